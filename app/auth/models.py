@@ -1,6 +1,6 @@
 from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey
 from datetime import datetime
-from app.database import Base
+from app.database import Base, ShardedByUser
 from sqlalchemy.orm import relationship
 
 
@@ -12,10 +12,25 @@ class User(Base):
     username = Column(String, unique=True, nullable=False)
     password = Column(String, nullable=False)
 
-    # connected to expenses
-    total_income = Column(Integer, default=0)
-    total_savings = Column(Integer, default=0)
+    # bumped to revoke every token issued so far
+    token_version = Column(Integer, nullable=False, default=0, server_default="0")
 
     expenses = relationship(
         "Expense", back_populates="owner", cascade="all, delete-orphan"
     )
+
+
+class UserBalance(ShardedByUser, Base):
+    __tablename__ = "user_balances"
+
+    # kept on the user's shard, next to the expenses it pays for, so a write
+    # that moves money commits to a single database. A user without a row
+    # has zero balances; the first credit creates it.
+    user_id = Column(
+        Integer, ForeignKey("user.id"), primary_key=True, autoincrement=False
+    )
+    total_income = Column(Integer, nullable=False, default=0)
+    total_savings = Column(Integer, nullable=False, default=0)
+    # bumped by every write to the user's balances, expenses or budget plans;
+    # report ETags are derived from it
+    data_version = Column(Integer, nullable=False, default=0)
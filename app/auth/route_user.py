@@ -1,11 +1,15 @@
+from dataclasses import dataclass
 from fastapi import Depends, APIRouter, status, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.database import get_db
+from app.database import get_db, get_primary_read_db, get_read_db
 from .schemas import UserCreate, ShowUser
-from .services import RegisterUser, LoginUser
+from .models import User
+from .services import RegisterUser, LoginUser, LogoutUser, UserProfile
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from app.core.jwt_handler import TokenGenerator
 from app.core.getuser import get_user
+from app.core.config import settings
+from app.core.user_cache import user_cache
 
 
 router = APIRouter()
@@ -13,7 +17,9 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/login")
 
 
 @router.post("/signup", response_model=ShowUser, status_code=status.HTTP_201_CREATED)
-async def create_user(user: UserCreate, db=Depends(get_db)):
+async def create_user(
+    user: UserCreate, db=Depends(get_db, scope="function")
+):
     new_user = await RegisterUser.create_new_user(user=user, db=db)
     # print("new_user==========>", new_user)
     return new_user
@@ -21,33 +27,148 @@ async def create_user(user: UserCreate, db=Depends(get_db)):
 
 @router.post("/login")
 async def login_user(
-    form_data: OAuth2PasswordRequestForm = Depends(), db=Depends(get_db)
+    form_data: OAuth2PasswordRequestForm = Depends(),
+    db=Depends(get_db, scope="function"),
+    read_db=Depends(get_primary_read_db),
 ):
     token = await LoginUser.authenticate_user(
-        email=form_data.username, password=form_data.password, db=db
+        email=form_data.username,
+        password=form_data.password,
+        db=db,
+        read_db=read_db,
     )
     return token
 
 
-@router.get("/me", response_model=ShowUser)
-async def get_current_user(
-    token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)
-):
+def verified_payload(token: str) -> dict:
     payload = TokenGenerator.verify_token(token)
     if not payload:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid or expired token",
         )
-    user = await get_user(email=payload.get("sub"), db=db)
+    return payload
+
+
+def revoked_token():
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Token has been revoked",
+    )
+
+
+async def resolve_user(token: str, db: AsyncSession):
+    payload = verified_payload(token)
+    # tokens issued before the uid claim existed are looked up by email
+    user_id = payload.get("uid")
+    # lets a read session pick the primary for a user who just wrote
+    db.info["user_id"] = user_id
+    subject = f"uid:{user_id}" if user_id is not None else payload.get("sub")
+    version = payload.get("ver", 0)
+    snapshot = user_cache.get(subject)
+    if snapshot is not None:
+        if snapshot["token_version"] != version:
+            raise revoked_token()
+        db.info["user_id"] = snapshot["id"]
+        return user_cache.attach(snapshot, db)
+    generation = user_cache.generation
+    if user_id is not None:
+        user = await db.get(User, user_id)
+    else:
+        user = await get_user(email=subject, db=db)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found",
         )
+    if user.token_version != version:
+        raise revoked_token()
+    # picks the shard for the user's expenses and plans
+    db.info["user_id"] = user.id
+    user_cache.set(subject, user_cache.snapshot(user), generation)
     return user
 
 
+async def get_current_user(
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_db, scope="function"),
+):
+    # for endpoints that write: the user lives in the request's write session
+    return await resolve_user(token, db)
+
+
+async def get_current_reader(
+    token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_read_db)
+):
+    return await resolve_user(token, db)
+
+
+@router.get("/me", response_model=ShowUser)
+async def read_current_user(
+    db=Depends(get_read_db), current_user=Depends(get_current_reader)
+):
+    return await UserProfile.load(db, current_user)
+
+
+@dataclass(frozen=True)
+class TokenUser:
+    # the caller as the token describes them; services only read `id`
+    id: int
+    version: int = 0
+
+
+async def get_token_user(token: str = Depends(oauth2_scheme)) -> TokenUser:
+    payload = verified_payload(token)
+    user_id = payload.get("uid")
+    if user_id is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token has no user id, please log in again",
+        )
+    # revocations made by this process; elsewhere the token stays usable on
+    # claim-only routes until it expires
+    version = payload.get("ver", 0)
+    if version < user_cache.token_floor.get(user_id, 0):
+        raise revoked_token()
+    return TokenUser(id=user_id, version=version)
+
+
+async def get_token_reader(
+    token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_read_db)
+) -> TokenUser:
+    current_user = await get_token_user(token)
+    db.info["user_id"] = current_user.id
+    return current_user
+
+
+async def get_token_writer(
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_db, scope="function"),
+) -> TokenUser:
+    current_user = await get_token_user(token)
+    db.info["user_id"] = current_user.id
+    return current_user
+
+
+# routes that only need the caller's id use these instead of
+# get_current_user / get_current_reader
+get_current_identity = (
+    get_token_writer if settings.AUTH_CLAIM_ONLY else get_current_user
+)
+get_reader_identity = (
+    get_token_reader if settings.AUTH_CLAIM_ONLY else get_current_reader
+)
+
+
+@router.post("/logout-all", status_code=status.HTTP_200_OK)
+async def logout_all(
+    db: AsyncSession = Depends(get_db, scope="function"),
+    current_user=Depends(get_current_user),
+):
+    result = await LogoutUser.revoke_tokens(db=db, current_user=current_user)
+    return result
+
+
 # just to check if the token is being received correctly
 # @router.get("/me")
 # async def read_users_me(token: str = Depends(oauth2_scheme)):
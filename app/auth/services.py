@@ -1,12 +1,16 @@
+from functools import partial
+from sqlalchemy import update
 from sqlalchemy.ext.asyncio import AsyncSession
 from .schemas import UserCreate, ShowUser
-from .models import User
+from .models import User, UserBalance
 from app.core.hashing import Hasher
 from app.core.jwt_handler import TokenGenerator
 from app.core.getuser import get_user
 from fastapi import HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from app.core.config import settings
+from app.core.user_cache import user_cache
+from app.database import after_commit, wrote_user_data
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="users/login")
 
@@ -14,6 +18,8 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="users/login")
 class RegisterUser:
     @staticmethod
     async def create_new_user(user: UserCreate, db: AsyncSession):
+        # hashed before the first statement, which takes the SQLite write lock
+        password = await Hasher.hash_password_async(user.password)
         user_in_db = await get_user(email=user.email, db=db)
         if user_in_db:
             raise HTTPException(
@@ -23,30 +29,80 @@ class RegisterUser:
         new_user = User(
             email=user.email,
             username=user.username,
-            password=Hasher.hash_password(user.password),
+            password=password,
         )
         db.add(new_user)
-        await db.commit()
-        await db.refresh(new_user)
+        await db.flush()
+        wrote_user_data(db, new_user.id)
 
-        return new_user
+        return UserProfile.show(new_user, None)
+
+
+class UserProfile:
+    @staticmethod
+    def show(user: User, balance: UserBalance | None) -> dict:
+        # ShowUser's fields: the user row is on the primary, the balances on
+        # the user's shard
+        return {
+            "id": user.id,
+            "email": user.email,
+            "username": user.username,
+            "total_income": balance.total_income if balance else 0,
+            "total_savings": balance.total_savings if balance else 0,
+        }
+
+    @staticmethod
+    async def load(db: AsyncSession, user: User) -> dict:
+        return UserProfile.show(user, await db.get(UserBalance, user.id))
 
 
 class LoginUser:
     @staticmethod
-    async def authenticate_user(email: str, password: str, db: AsyncSession):
-        user = await get_user(email=email, db=db)
-        if not user or not Hasher.verify_password(password, user.password):
+    async def authenticate_user(
+        email: str, password: str, db: AsyncSession, read_db: AsyncSession
+    ):
+        # looked up outside the write session, so the write lock is not held
+        # while the password is verified
+        user = await get_user(email=email, db=read_db)
+        valid, new_hash = False, None
+        if user:
+            valid, new_hash = await Hasher.verify_and_update_async(
+                password, user.password
+            )
+        if not valid:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Incorrect email or password",
             )
+        if new_hash:
+            # the cost factor changed since this hash was made
+            await db.execute(
+                update(User).where(User.id == user.id).values(password=new_hash)
+            )
+            after_commit(db, partial(user_cache.invalidate_user, user.id))
         access_token = TokenGenerator.create_token(
-            data={"sub": user.email},
+            data={"sub": user.email, "uid": user.id, "ver": user.token_version},
             expires_in_minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES,
         )
 
         return {"access_token": access_token, "token_type": "bearer"}
 
 
+class LogoutUser:
+    @staticmethod
+    async def revoke_tokens(db: AsyncSession, current_user: User):
+        # every token carries the version it was issued with; bumping it
+        # rejects all of them on the next request
+        stmt = (
+            update(User)
+            .where(User.id == current_user.id)
+            .values(token_version=User.token_version + 1)
+            .returning(User.token_version)
+        )
+        token_version = (await db.execute(stmt)).scalar_one()
+        after_commit(
+            db, partial(user_cache.revoke_tokens, current_user.id, token_version)
+        )
+        wrote_user_data(db, current_user.id)
+        return {"detail": "Logged out from all sessions"}
 
@@ -4,13 +4,83 @@ from dotenv import load_dotenv
 load_dotenv()
 
 
+def env_bool(name: str, default: bool) -> bool:
+    return os.getenv(name, str(default)).strip().lower() in ("1", "true", "yes", "on")
+
+
+def env_list(name: str) -> list[str]:
+    return [item.strip() for item in os.getenv(name, "").split(",") if item.strip()]
+
+
 class Settings:
     PROJECT_NAME: str = "Budget-Buddy"
     PROJECT_VERSION: str = "1.0.0"
     DATABASE_URL: str = os.getenv("DATABASE_URL")
+    # read-only sessions are spread round-robin over these, comma separated
+    DATABASE_REPLICA_URLS: list[str] = env_list("DATABASE_REPLICA_URLS")
+    # how long a user's reads stay on the primary after one of their writes
+    REPLICA_STICKY_SECONDS: float = float(os.getenv("REPLICA_STICKY_SECONDS", "5"))
+    # per-user tables (balances, expenses, budget plans, rollup, alerts,
+    # recurring rules) are spread over these by user id; empty keeps them on
+    # DATABASE_URL
+    SHARD_URLS: list[str] = env_list("SHARD_URLS")
+    # how often each process reloads the bucket -> shard map from the primary
+    SHARD_MAP_REFRESH_SECONDS: float = float(
+        os.getenv("SHARD_MAP_REFRESH_SECONDS", "5")
+    )
+    DB_ECHO: bool = env_bool("DB_ECHO", False)
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "5"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+    DB_POOL_PRE_PING: bool = env_bool("DB_POOL_PRE_PING", True)
+    DB_POOL_RECYCLE_SECONDS: int = int(os.getenv("DB_POOL_RECYCLE_SECONDS", "1800"))
+    # WAL, synchronous=NORMAL, busy_timeout and cache_size on SQLite connections
+    SQLITE_TUNING: bool = env_bool("SQLITE_TUNING", True)
+    SQLITE_BUSY_TIMEOUT_MS: int = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+    SQLITE_CACHE_SIZE_KB: int = int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536"))
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
     SECRET_KEY: str = os.getenv("SECRET_KEY")
     ALGORITHM: str = os.getenv("ALGORITHM", "HS256")
+    # expense routes that only need the caller's id trust the verified token
+    # claim instead of loading the User row
+    AUTH_CLAIM_ONLY: bool = env_bool("AUTH_CLAIM_ONLY", False)
+    # ORJSONResponse as the default response class; needs orjson installed
+    FAST_JSON: bool = env_bool("FAST_JSON", False)
+    BCRYPT_ROUNDS: int = int(os.getenv("BCRYPT_ROUNDS", "12"))
+    # "thread" or "process"; HASH_WORKERS=0 hashes inline on the event loop
+    HASH_EXECUTOR: str = os.getenv("HASH_EXECUTOR", "thread")
+    # leave a core for the event loop by default
+    HASH_WORKERS: int = int(
+        os.getenv("HASH_WORKERS", str(max(1, (os.cpu_count() or 2) - 1)))
+    )
+    HASH_QUEUE_SIZE: int = int(os.getenv("HASH_QUEUE_SIZE", "32"))
+    USER_CACHE_TTL_SECONDS: float = float(os.getenv("USER_CACHE_TTL_SECONDS", "60"))
+    # percent of a category's planned amount at which a spending alert fires
+    ALERT_THRESHOLDS: list[int] = sorted(
+        int(t) for t in os.getenv("ALERT_THRESHOLDS", "80,100").split(",") if t.strip()
+    )
+    # background materialization of recurring expenses and income
+    RECURRING_ENABLED: bool = env_bool("RECURRING_ENABLED", True)
+    RECURRING_POLL_SECONDS: float = float(os.getenv("RECURRING_POLL_SECONDS", "60"))
+    # rules per transaction, and occurrences per rule per pass when catching up
+    RECURRING_BATCH_SIZE: int = int(os.getenv("RECURRING_BATCH_SIZE", "500"))
+    RECURRING_MAX_CATCHUP: int = int(os.getenv("RECURRING_MAX_CATCHUP", "400"))
+    # group concurrent POST /expense/ writes into one transaction; a batch is
+    # committed when it is full or its oldest write has waited MAX_LATENCY_MS
+    WRITE_COALESCING: bool = env_bool("WRITE_COALESCING", False)
+    WRITE_BATCH_MAX_SIZE: int = int(os.getenv("WRITE_BATCH_MAX_SIZE", "64"))
+    WRITE_BATCH_MAX_LATENCY_MS: float = float(
+        os.getenv("WRITE_BATCH_MAX_LATENCY_MS", "5")
+    )
+    # rendered report bodies kept per (user, data version, URL); 0 disables
+    RESPONSE_CACHE_SIZE: int = int(os.getenv("RESPONSE_CACHE_SIZE", "0"))
+    # gzip responses of at least this many bytes; 0 disables compression
+    GZIP_MIN_SIZE: int = int(os.getenv("GZIP_MIN_SIZE", "1024"))
+    METRICS_ENABLED: bool = env_bool("METRICS_ENABLED", True)
+    # log requests slower than this; 0 disables the slow-request log
+    SLOW_REQUEST_MS: float = float(os.getenv("SLOW_REQUEST_MS", "0"))
+    # same statement this many times in one request is reported as a likely N+1
+    N_PLUS_ONE_THRESHOLD: int = int(os.getenv("N_PLUS_ONE_THRESHOLD", "10"))
+    USER_CACHE_MAX_SIZE: int = int(os.getenv("USER_CACHE_MAX_SIZE", "1024"))
 
 
 settings = Settings()
@@ -1,9 +1,30 @@
+import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from fastapi import HTTPException, status
 from passlib.context import CryptContext
+from .config import settings
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(
+    schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.BCRYPT_ROUNDS
+)
+
+
+def _make_executor() -> Executor | None:
+    if settings.HASH_WORKERS <= 0:
+        return None
+    if settings.HASH_EXECUTOR == "process":
+        return ProcessPoolExecutor(max_workers=settings.HASH_WORKERS)
+    return ThreadPoolExecutor(
+        max_workers=settings.HASH_WORKERS, thread_name_prefix="bcrypt"
+    )
 
 
 class Hasher:
+    # bcrypt takes 100ms+ per call, so the async variants run it off the event
+    # loop; calls beyond workers + queue size are rejected instead of queued
+    executor = _make_executor()
+    pending = 0
+
     @staticmethod
     def hash_password(password: str) -> str:
         return pwd_context.hash(password)
@@ -11,3 +32,39 @@ class Hasher:
     @staticmethod
     def verify_password(plain_password: str, hashed_password: str) -> bool:
         return pwd_context.verify(plain_password, hashed_password)
+
+    @staticmethod
+    def verify_and_update(
+        plain_password: str, hashed_password: str
+    ) -> tuple[bool, str | None]:
+        # returns a new hash when the stored one uses outdated settings
+        return pwd_context.verify_and_update(plain_password, hashed_password)
+
+    @staticmethod
+    async def _run(fn, *args):
+        if Hasher.executor is None:
+            return fn(*args)
+        if Hasher.pending >= settings.HASH_WORKERS + settings.HASH_QUEUE_SIZE:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many authentication requests, try again shortly",
+                headers={"Retry-After": "1"},
+            )
+        Hasher.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(Hasher.executor, fn, *args)
+        finally:
+            Hasher.pending -= 1
+
+    @staticmethod
+    async def hash_password_async(password: str) -> str:
+        return await Hasher._run(Hasher.hash_password, password)
+
+    @staticmethod
+    async def verify_and_update_async(
+        plain_password: str, hashed_password: str
+    ) -> tuple[bool, str | None]:
+        return await Hasher._run(
+            Hasher.verify_and_update, plain_password, hashed_password
+        )
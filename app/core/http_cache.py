@@ -0,0 +1,111 @@
+"""Conditional GETs for per-user reports.
+
+Every write to a user's balances, expenses or budget plans bumps
+UserBalance.data_version in the same transaction. Report routes read that version
+first, with one primary-key lookup, and derive an ETag from it. A poll whose
+If-None-Match still matches gets a 304 without the report queries. The ETag
+is weak: GZipMiddleware sends the same version gzipped or not, and a strong
+tag would claim both bodies are byte-for-byte the same.
+With RESPONSE_CACHE_SIZE > 0 rendered bodies are also kept in process,
+keyed by (user, version, URL). A write moves the user to a new version and
+so to new keys; nothing needs invalidating.
+"""
+from collections import OrderedDict
+from typing import Awaitable, Callable
+
+from fastapi import Request, Response, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app.auth.models import UserBalance
+from .config import settings
+
+
+class ResponseCache:
+    """Bounded LRU of rendered JSON bodies."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[tuple, bytes] = OrderedDict()
+
+    def get(self, key: tuple) -> bytes | None:
+        body = self._entries.get(key)
+        if body is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return body
+
+    def set(self, key: tuple, body: bytes):
+        if not self.max_size:
+            return
+        self._entries[key] = body
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+
+response_cache = ResponseCache(max_size=settings.RESPONSE_CACHE_SIZE)
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    # If-None-Match uses the weak comparison, so W/"x" and "x" match either
+    if not if_none_match:
+        return False
+    opaque = etag.removeprefix("W/")
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == opaque:
+            return True
+    return False
+
+
+async def data_version(db: AsyncSession, user_id: int) -> int:
+    # a user without a balance row has never written anything
+    version = await db.scalar(
+        select(UserBalance.data_version).where(UserBalance.user_id == user_id)
+    )
+    return version or 0
+
+
+def render_json(content) -> bytes:
+    # the same encoding FastAPI applies to a route without a response_model
+    response_class = ORJSONResponse if settings.FAST_JSON else JSONResponse
+    return response_class(jsonable_encoder(content)).body
+
+
+async def versioned_response(
+    request: Request,
+    db: AsyncSession,
+    user_id: int,
+    compute: Callable[[], Awaitable],
+) -> Response:
+    # the version is read before the report, so a write landing in between
+    # can only make the body newer than its ETag, never older; the next poll
+    # then just fetches it again
+    version = await data_version(db, user_id)
+    etag = f'W/"{user_id}-{version}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "private, no-cache",
+        "Vary": "Authorization",
+    }
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    key = (user_id, version, request.url.path, request.url.query)
+    body = response_cache.get(key) if settings.RESPONSE_CACHE_SIZE else None
+    if body is None:
+        body = render_json(await compute())
+        response_cache.set(key, body)
+    return Response(content=body, media_type="application/json", headers=headers)
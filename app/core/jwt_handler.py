@@ -1,7 +1,40 @@
+import base64
+import hashlib
+import hmac
+import json
+import math
+import time
+from functools import lru_cache
 from jose import jwt, JWTError
 from datetime import datetime, timedelta
 from .config import settings
 
+HMAC_DIGESTS = {
+    "HS256": hashlib.sha256,
+    "HS384": hashlib.sha384,
+    "HS512": hashlib.sha512,
+}
+
+
+@lru_cache(maxsize=4)
+def hmac_key(secret: str, algorithm: str):
+    # keyed HMAC state built once; each verification copies it instead of
+    # re-deriving the inner and outer pads from the secret
+    return hmac.new(secret.encode(), digestmod=HMAC_DIGESTS[algorithm])
+
+
+def b64url_decode(segment: str) -> bytes:
+    return base64.urlsafe_b64decode(segment + "=" * (-len(segment) % 4))
+
+
+def is_numeric_date(value) -> bool:
+    # json.loads also yields NaN and Infinity, which never expire
+    return (
+        isinstance(value, (int, float))
+        and not isinstance(value, bool)
+        and math.isfinite(value)
+    )
+
 
 class TokenGenerator:
     @staticmethod
@@ -16,6 +49,8 @@ class TokenGenerator:
         return encoded_jwt
 
     def verify_token(token: str):
+        if settings.ALGORITHM in HMAC_DIGESTS:
+            return TokenGenerator.verify_hmac_token(token)
         try:
             payload = jwt.decode(
                 token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM]
@@ -23,3 +58,42 @@ class TokenGenerator:
             return payload
         except JWTError:
             return None
+
+    @staticmethod
+    def verify_hmac_token(token: str):
+        # the checks jose.jwt.decode makes for our HS* tokens, without its
+        # generic key handling and claim machinery on every request
+        try:
+            header_segment, payload_segment, signature = token.split(".")
+            signing_input = f"{header_segment}.{payload_segment}"
+            header = json.loads(b64url_decode(header_segment))
+            if header.get("alg") != settings.ALGORITHM:
+                return None
+            mac = hmac_key(settings.SECRET_KEY, settings.ALGORITHM).copy()
+            mac.update(signing_input.encode())
+            if not hmac.compare_digest(mac.digest(), b64url_decode(signature)):
+                return None
+            payload = json.loads(b64url_decode(payload_segment))
+        except (ValueError, TypeError, AttributeError):
+            return None
+        if not isinstance(payload, dict):
+            return None
+        # verify_token gives jose no audience, so jose rejects any "aud"
+        if "aud" in payload:
+            return None
+        if any(
+            claim in payload and not isinstance(payload[claim], str)
+            for claim in ("sub", "jti")
+        ):
+            return None
+        if any(
+            claim in payload and not is_numeric_date(payload[claim])
+            for claim in ("exp", "nbf", "iat")
+        ):
+            return None
+        now = time.time()
+        if "exp" in payload and payload["exp"] <= now:
+            return None
+        if "nbf" in payload and payload["nbf"] > now:
+            return None
+        return payload
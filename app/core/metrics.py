@@ -0,0 +1,233 @@
+import logging
+import time
+from collections import Counter
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from fastapi.responses import PlainTextResponse
+from sqlalchemy import event
+from .config import settings
+from .http_cache import response_cache
+from .user_cache import user_cache
+
+logger = logging.getLogger("budget_buddy.metrics")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+
+class Histogram:
+    """Cumulative Prometheus histogram, one series per label tuple."""
+
+    def __init__(self, name: str, help: str, labels: tuple, buckets: tuple):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._series: dict[tuple, list] = {}
+
+    def observe(self, label_values: tuple, value: float):
+        series = self._series.get(label_values)
+        if series is None:
+            # per-bucket counts, then sum and count
+            series = self._series[label_values] = [0] * len(self.buckets) + [0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for label_values, series in sorted(self._series.items()):
+            labels = format_labels(self.labels, label_values)
+            for bound, count in zip(self.buckets, series):
+                le = format_labels(self.labels + ("le",), label_values + (bound,))
+                lines.append(f"{self.name}_bucket{le} {count}")
+            inf = format_labels(self.labels + ("le",), label_values + ("+Inf",))
+            lines.append(f"{self.name}_bucket{inf} {series[-1]}")
+            lines.append(f"{self.name}_sum{labels} {series[-2]}")
+            lines.append(f"{self.name}_count{labels} {series[-1]}")
+        return lines
+
+
+class CounterMetric:
+    def __init__(self, name: str, help: str, labels: tuple):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values: Counter = Counter()
+
+    def inc(self, label_values: tuple, amount: float = 1):
+        self._values[label_values] += amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for label_values, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{format_labels(self.labels, label_values)} {value}")
+        return lines
+
+
+def format_labels(names: tuple, values: tuple) -> str:
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"')
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+request_duration = Histogram(
+    "http_request_duration_seconds",
+    "Request latency by route.",
+    ("method", "route", "status"),
+    LATENCY_BUCKETS,
+)
+request_db_duration = Histogram(
+    "http_request_db_seconds",
+    "Time spent in database cursor calls per request.",
+    ("method", "route"),
+    LATENCY_BUCKETS,
+)
+request_db_statements = Histogram(
+    "http_request_db_statements",
+    "SQL statements executed per request.",
+    ("method", "route"),
+    STATEMENT_BUCKETS,
+)
+n_plus_one_suspected = CounterMetric(
+    "http_request_n_plus_one_total",
+    "Requests that ran one statement at least N_PLUS_ONE_THRESHOLD times.",
+    ("method", "route"),
+)
+slow_requests = CounterMetric(
+    "http_slow_requests_total",
+    "Requests slower than SLOW_REQUEST_MS.",
+    ("method", "route"),
+)
+
+
+@dataclass
+class RequestStats:
+    db_time: float = 0.0
+    statements: int = 0
+    # statement text -> executions, to spot the same query run per row
+    by_statement: Counter = field(default_factory=Counter)
+
+
+current_stats: ContextVar[RequestStats | None] = ContextVar(
+    "current_request_stats", default=None
+)
+
+
+def instrument_engine(engine):
+    # cursor events fire in SQLAlchemy's greenlet, which shares the calling
+    # task's context, so the request's stats object is visible here
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        stats = current_stats.get()
+        if stats is None:
+            return
+        stats.db_time += elapsed
+        stats.statements += 1
+        stats.by_statement[statement] += 1
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware, so streamed responses are timed to the last chunk."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = current_stats.set(stats)
+        status = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_stats.reset(token)
+            self.record(scope, status, time.perf_counter() - start, stats)
+
+    @staticmethod
+    def record(scope, status: int, elapsed: float, stats: RequestStats):
+        method = scope["method"]
+        route = scope.get("route")
+        # the route template keeps label cardinality bounded
+        path = getattr(route, "path", "unmatched")
+        if path == "/metrics":
+            return
+        request_duration.observe((method, path, status), elapsed)
+        request_db_duration.observe((method, path), stats.db_time)
+        request_db_statements.observe((method, path), stats.statements)
+
+        if stats.by_statement:
+            statement, repeats = stats.by_statement.most_common(1)[0]
+            if repeats >= settings.N_PLUS_ONE_THRESHOLD:
+                n_plus_one_suspected.inc((method, path))
+                logger.warning(
+                    "possible N+1 on %s %s: statement ran %d times: %s",
+                    method,
+                    path,
+                    repeats,
+                    " ".join(statement.split())[:200],
+                )
+
+        if settings.SLOW_REQUEST_MS and elapsed * 1000 >= settings.SLOW_REQUEST_MS:
+            slow_requests.inc((method, path))
+            logger.warning(
+                "slow request %s %s -> %d in %.1f ms (db %.1f ms, %d statements)",
+                method,
+                scope["path"],
+                status,
+                elapsed * 1000,
+                stats.db_time * 1000,
+                stats.statements,
+            )
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in (
+        request_duration,
+        request_db_duration,
+        request_db_statements,
+        n_plus_one_suspected,
+        slow_requests,
+    ):
+        lines.extend(metric.render())
+    caches = (("user_cache", user_cache), ("response_cache", response_cache))
+    for prefix, cache in caches:
+        stats = cache.stats()
+        for key, kind in (
+            ("hits", "counter"),
+            ("misses", "counter"),
+            ("size", "gauge"),
+        ):
+            name = f"{prefix}_{key}" + ("_total" if kind == "counter" else "")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.append(f"{name} {stats[key]}")
+    return "\n".join(lines) + "\n"
+
+
+async def metrics_endpoint():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,98 @@
+import time
+from collections import OrderedDict
+from sqlalchemy import inspect
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached
+from app.auth.models import User
+from .config import settings
+
+
+class UserCache:
+    """Bounded TTL/LRU cache of resolved users, keyed by token subject.
+
+    Values are plain column snapshots, never ORM instances, so they can be
+    attached to whichever session the request uses. All methods are
+    synchronous, so under asyncio no other request can interleave with them.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self._subjects_by_user: dict[int, set[str]] = {}
+        # bumped by every invalidation; a load that started before the bump
+        # must not repopulate the cache with the row it read earlier
+        self.generation = 0
+        # user id -> lowest token version still valid, recorded when this
+        # process revokes tokens; claim-only auth has no user row to check
+        self.token_floor: dict[int, int] = {}
+
+    def get(self, subject: str) -> dict | None:
+        entry = self._entries.get(subject)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                self._discard(subject)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(subject)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, subject: str, snapshot: dict, generation: int):
+        if generation != self.generation:
+            return
+        user_id = snapshot["id"]
+        self._discard(subject)
+        self._entries[subject] = (time.monotonic() + self.ttl, snapshot)
+        self._subjects_by_user.setdefault(user_id, set()).add(subject)
+        while len(self._entries) > self.max_size:
+            self._discard(next(iter(self._entries)))
+
+    def invalidate_user(self, user_id: int):
+        self.generation += 1
+        for subject in self._subjects_by_user.pop(user_id, set()):
+            self._entries.pop(subject, None)
+
+    def revoke_tokens(self, user_id: int, token_version: int):
+        self.token_floor[user_id] = token_version
+        self.invalidate_user(user_id)
+
+    def clear(self):
+        self._entries.clear()
+        self._subjects_by_user.clear()
+        self.token_floor.clear()
+
+    @staticmethod
+    def snapshot(user: User) -> dict:
+        return {
+            attr.key: getattr(user, attr.key)
+            for attr in inspect(User).column_attrs
+        }
+
+    @staticmethod
+    def attach(snapshot: dict, db: AsyncSession) -> User:
+        # rebuild the row as a clean persistent instance, without a SELECT
+        user = User(**snapshot)
+        make_transient_to_detached(user)
+        db.add(user)
+        return user
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+    def _discard(self, subject: str):
+        entry = self._entries.pop(subject, None)
+        if entry is None:
+            return
+        subjects = self._subjects_by_user.get(entry[1]["id"])
+        if subjects is not None:
+            subjects.discard(subject)
+            if not subjects:
+                del self._subjects_by_user[entry[1]["id"]]
+
+
+user_cache = UserCache(
+    max_size=settings.USER_CACHE_MAX_SIZE, ttl=settings.USER_CACHE_TTL_SECONDS
+)
@@ -1,24 +1,374 @@
+import itertools
+import time
+import zlib
+from collections import OrderedDict
+from functools import partial
+from fastapi import HTTPException, status
+from sqlalchemy import Boolean, Column, Integer, Table, event
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
-from sqlalchemy.orm import declarative_base
+from sqlalchemy.future import select
+from sqlalchemy.orm import Session, declarative_base
+from sqlalchemy.sql.util import find_tables
 from app.core.config import settings
 
 DATABASE_URL = settings.DATABASE_URL
 
+
+def is_sqlite_file(url: str) -> bool:
+    parsed = make_url(url)
+    return parsed.get_backend_name() == "sqlite" and parsed.database not in (
+        None,
+        "",
+        ":memory:",
+    )
+
+
+def engine_options(url: str, single_writer: bool = False) -> dict:
+    options = {"echo": settings.DB_ECHO, "future": True}
+    if make_url(url).get_backend_name() == "sqlite" and not is_sqlite_file(url):
+        # in-memory SQLite uses a single static connection, not a queue pool
+        return options
+    options.update(
+        pool_size=1 if single_writer else settings.DB_POOL_SIZE,
+        max_overflow=0 if single_writer else settings.DB_MAX_OVERFLOW,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+        pool_recycle=settings.DB_POOL_RECYCLE_SECONDS,
+    )
+    return options
+
+
+def tune_sqlite(engine):
+    # WAL lets readers proceed while a writer holds the lock; busy_timeout
+    # makes writers wait for each other instead of failing immediately
+    if engine.dialect.name != "sqlite" or not settings.SQLITE_TUNING:
+        return
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={settings.SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute(f"PRAGMA cache_size=-{settings.SQLITE_CACHE_SIZE_KB}")
+        cursor.close()
+        # transactions are begun explicitly below, not by the driver
+        dbapi_connection.isolation_level = None
+
+    # A deferred transaction that reads first (the user lookup) and then
+    # writes must upgrade its lock, and SQLite fails that upgrade with
+    # SQLITE_BUSY at once instead of applying busy_timeout. BEGIN IMMEDIATE
+    # takes the write lock up front, where busy_timeout does apply.
+    # AUTOCOMMIT connections (read_engine, replicas) run without a BEGIN.
+    @event.listens_for(engine.sync_engine, "begin")
+    def begin_immediate(conn):
+        if conn.get_execution_options().get("isolation_level") != "AUTOCOMMIT":
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+
+# SQLite runs one write transaction at a time. With a single pooled write
+# connection, write sessions queue for it in arrival order, instead of
+# polling SQLite's lock until busy_timeout runs out (unfair under load, so
+# some requests failed with "database is locked"). Reads get their own pool.
+SQLITE_SINGLE_WRITER = settings.SQLITE_TUNING and is_sqlite_file(DATABASE_URL)
+
 # Async engine
-engine = create_async_engine(DATABASE_URL, echo=True, future=True)
+engine = create_async_engine(
+    DATABASE_URL,
+    **engine_options(DATABASE_URL, single_writer=SQLITE_SINGLE_WRITER),
+)
+tune_sqlite(engine)
+
+# Base for models
+Base = declarative_base()
+
+# Read-only sessions: autocommit connections never open a transaction, so
+# there is no BEGIN/COMMIT round trip, and nothing is ever flushed
+if SQLITE_SINGLE_WRITER:
+    read_pool_engine = create_async_engine(DATABASE_URL, **engine_options(DATABASE_URL))
+    tune_sqlite(read_pool_engine)
+else:
+    read_pool_engine = engine
+read_engine = read_pool_engine.execution_options(isolation_level="AUTOCOMMIT")
+
+
+def create_replica_engine(url: str):
+    replica = create_async_engine(url, **engine_options(url))
+    tune_sqlite(replica)
+    return replica
+
+
+replica_engines = [create_replica_engine(url) for url in settings.DATABASE_REPLICA_URLS]
+
+
+class ReplicaRouter:
+    """Round-robin over the replicas, with read-your-writes stickiness.
+
+    A user whose write committed less than REPLICA_STICKY_SECONDS ago reads
+    from the primary, so replication lag never hides their own change.
+    Stickiness is recorded per process.
+    """
+
+    def __init__(self, engines: list, sticky_seconds: float):
+        self.engines = [
+            replica.execution_options(isolation_level="AUTOCOMMIT")
+            for replica in engines
+        ]
+        self.sticky_seconds = sticky_seconds
+        self._next = itertools.cycle(self.engines)
+        # user id -> expiry; expiries grow with insertion order, so expired
+        # entries are always at the front
+        self._sticky: OrderedDict[int, float] = OrderedDict()
+
+    def stick(self, user_id: int):
+        if not self.engines:
+            return
+        now = time.monotonic()
+        self._sticky.pop(user_id, None)
+        self._sticky[user_id] = now + self.sticky_seconds
+        while self._sticky and next(iter(self._sticky.values())) <= now:
+            self._sticky.popitem(last=False)
+
+    def is_sticky(self, user_id: int | None) -> bool:
+        expiry = self._sticky.get(user_id)
+        return expiry is not None and expiry > time.monotonic()
+
+    def engine_for(self, user_id: int | None):
+        if not self.engines or self.is_sticky(user_id):
+            return read_engine
+        return next(self._next)
+
+
+replica_router = ReplicaRouter(replica_engines, settings.REPLICA_STICKY_SECONDS)
+
+
+# Sharding. With SHARD_URLS set, the rows of models mixing in ShardedByUser
+# live on one of those databases, picked by their owner's id; the primary
+# keeps the user table and the shard map. User ids hash into a fixed number
+# of buckets and shard_buckets assigns each bucket to a shard, so a
+# rebalance moves whole buckets (app.expenses.sharding).
+SHARD_BUCKETS = 256
+# shard index of buckets whose rows are still in the primary's tables, as
+# before sharding was enabled
+PRIMARY_SHARD = -1
+
+shard_buckets = Table(
+    "shard_buckets",
+    Base.metadata,
+    Column("bucket", Integer, primary_key=True, autoincrement=False),
+    Column("shard", Integer, nullable=False),
+    # set while the bucket is being copied; its writes are refused meanwhile
+    Column("moving", Boolean, nullable=False, default=False),
+)
+
+# names of the tables of ShardedByUser models
+sharded_table_names: set[str] = set()
+
+
+class ShardedByUser:
+    """Mixin for models whose rows live on their owner's shard."""
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        sharded_table_names.add(cls.__tablename__)
+
+
+def user_bucket(user_id: int) -> int:
+    # crc32 rather than hash(): the same in every process and Python version
+    return zlib.crc32(str(user_id).encode()) % SHARD_BUCKETS
+
+
+def create_shard_engine(url: str):
+    shard = create_async_engine(url, **engine_options(url))
+    tune_sqlite(shard)
+    return shard
+
+
+shard_engines = [create_shard_engine(url) for url in settings.SHARD_URLS]
+
+
+class ShardMap:
+    """Bucket -> shard assignments, reloaded from the primary.
+
+    Each process rereads shard_buckets at most every SHARD_MAP_REFRESH_SECONDS,
+    before a request or job uses the map. The rebalancing tool waits longer
+    than that around every change, so no process acts on a stale assignment.
+    """
+
+    def __init__(self, engines: list, refresh_seconds: float):
+        self.engines = engines
+        self.read_engines = [
+            shard.execution_options(isolation_level="AUTOCOMMIT") for shard in engines
+        ]
+        self.refresh_seconds = refresh_seconds
+        self.buckets: dict[int, int] = {}
+        self.moving: set[int] = set()
+        self._expires = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.engines)
+
+    async def refresh(self, force: bool = False):
+        if not self.engines or (not force and time.monotonic() < self._expires):
+            return
+        async with read_engine.connect() as conn:
+            rows = (await conn.execute(select(shard_buckets))).all()
+        self.buckets = {row.bucket: row.shard for row in rows}
+        self.moving = {row.bucket for row in rows if row.moving}
+        self._expires = time.monotonic() + self.refresh_seconds
+
+    def shard_ids(self) -> list:
+        # the shards jobs must visit one by one; None means "not sharded"
+        if not self.engines:
+            return [None]
+        ids = list(range(len(self.engines)))
+        if PRIMARY_SHARD in self.buckets.values():
+            ids.append(PRIMARY_SHARD)
+        return ids
+
+    def shard_for_bucket(self, bucket: int) -> int:
+        return self.buckets.get(bucket, bucket % len(self.engines))
+
+    def shard_of(self, user_id: int) -> int:
+        return self.shard_for_bucket(user_bucket(user_id))
+
+    def is_moving(self, user_id: int) -> bool:
+        return user_bucket(user_id) in self.moving
+
+    def owns(self, shard: int | None, user_id: int) -> bool:
+        # whether `shard` holds the user's live rows; not while they move
+        if shard is None:
+            return True
+        return self.shard_of(user_id) == shard and not self.is_moving(user_id)
+
+    def check_writable(self, user_id: int):
+        if self.is_moving(user_id):
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Your data is being moved, try again shortly",
+                headers={"Retry-After": str(max(1, round(self.refresh_seconds)))},
+            )
+
+    def engine(self, shard: int, read_only: bool = False):
+        if shard == PRIMARY_SHARD:
+            return read_engine if read_only else engine
+        return (self.read_engines if read_only else self.engines)[shard]
+
+    def engine_for(self, info: dict, read_only: bool, writing: bool):
+        # info["shard"] is set by jobs that work through one shard at a time
+        shard = info.get("shard")
+        if shard is None:
+            user_id = info.get("user_id")
+            if user_id is None:
+                raise RuntimeError(
+                    "per-user tables are sharded; set session.info['user_id'] "
+                    "or session.info['shard'] before querying them"
+                )
+            # a moving bucket is still read from its source shard
+            if writing:
+                self.check_writable(user_id)
+            shard = self.shard_of(user_id)
+        return self.engine(shard, read_only)
+
+
+shard_map = ShardMap(shard_engines, settings.SHARD_MAP_REFRESH_SECONDS)
+
+
+def touches_sharded(mapper, clause) -> bool:
+    if mapper is not None:
+        tables = [mapper.local_table]
+    elif clause is not None:
+        tables = find_tables(clause, include_crud=True)
+    else:
+        return False
+    sharded = {table.name in sharded_table_names for table in tables}
+    if len(sharded) > 1:
+        raise RuntimeError("statement mixes sharded and global tables")
+    return sharded == {True}
+
+
+class RoutingSession(Session):
+    # Statements on sharded tables go to the owner's shard. Everything else
+    # goes to the primary, or, in read-only sessions, to the replica chosen
+    # on the session's first such statement, so one request reads from a
+    # single replica. Identity dependencies put the caller's id in
+    # session.info["user_id"] before the first statement.
+    #
+    # A write session writes to one database only: two connections commit
+    # one after the other, so a failure between them would leave half of a
+    # change. Balances live on the user's shard for this reason.
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if self.info.get("read_only", False):
+            if shard_map.enabled and touches_sharded(mapper, clause):
+                return shard_map.engine_for(self.info, True, False).sync_engine
+            bind = self.info.get("bind")
+            if bind is None:
+                user_id = self.info.get("user_id")
+                bind = replica_router.engine_for(user_id).sync_engine
+                self.info["bind"] = bind
+            return bind
+        # flushes come with a mapper and without a clause
+        writing = clause.is_dml if clause is not None else mapper is not None
+        if shard_map.enabled and touches_sharded(mapper, clause):
+            bind = shard_map.engine_for(self.info, False, writing).sync_engine
+        else:
+            bind = super().get_bind(mapper, clause=clause, **kw)
+        if writing and self.info.setdefault("writes_to", bind) is not bind:
+            raise RuntimeError("a write session cannot write to two databases")
+        return bind
+
 
 # Async session factory
 AsyncSessionLocal = async_sessionmaker(
-    bind=engine, 
+    bind=engine,
     class_=AsyncSession,
-    expire_on_commit=False
+    sync_session_class=RoutingSession,
+    expire_on_commit=False,
 )
 
-# Base for models
-Base = declarative_base()
+ReadSessionLocal = async_sessionmaker(
+    bind=read_engine,
+    class_=AsyncSession,
+    sync_session_class=RoutingSession,
+    expire_on_commit=False,
+    autoflush=False,
+    info={"read_only": True},
+)
+
+
+async def begin_read_transaction(session: AsyncSession, mapper):
+    # db.stream() uses a server-side cursor, which PostgreSQL only opens
+    # inside a transaction; read sessions are autocommit, so start a
+    # read-only one on the connection that `mapper`'s rows are read from.
+    # SQLite streams without one.
+    bind = session.get_bind(mapper)
+    if bind.dialect.name == "sqlite":
+        return
+    await session.connection(
+        bind_arguments={"mapper": mapper},
+        execution_options={
+            "isolation_level": "REPEATABLE READ",
+            "postgresql_readonly": True,
+        },
+    )
 
-# Dependency to get database session
+
+def after_commit(session: AsyncSession, callback):
+    # run `callback` once get_db has committed the request's unit of work
+    session.info.setdefault("after_commit", []).append(callback)
+
+
+def wrote_user_data(session: AsyncSession, user_id: int):
+    # the user's reads stay on the primary for a while after this commits
+    after_commit(session, partial(replica_router.stick, user_id))
+
+
+# Dependency for endpoints that write. The endpoint's changes are committed
+# once, here; declare it as Depends(get_db, scope="function") so the commit
+# happens before the response is sent rather than after it.
 async def get_db() -> AsyncSession:
+    await shard_map.refresh()
     async with AsyncSessionLocal() as session:
         try:
             yield session
@@ -26,5 +376,20 @@ async def get_db() -> AsyncSession:
         except Exception:
             await session.rollback()
             raise
-        finally:
-            await session.close()
+        for callback in session.info.pop("after_commit", ()):
+            callback()
+
+
+# Dependency for endpoints that only read
+async def get_read_db() -> AsyncSession:
+    await shard_map.refresh()
+    async with ReadSessionLocal() as session:
+        yield session
+
+
+# Dependency for reads that must see the latest commit even with replicas
+# configured, such as the login right after a signup
+async def get_primary_read_db() -> AsyncSession:
+    await shard_map.refresh()
+    async with ReadSessionLocal(info={"bind": read_engine.sync_engine}) as session:
+        yield session
@@ -0,0 +1,102 @@
+"""Spending alerts, raised as a category's month total crosses a percentage
+of its budget plan.
+
+Evaluation is incremental: MonthlyRollup.apply already returns the running
+total and the planned amount, so a write only reaches this table when it
+actually crosses a threshold.
+"""
+from datetime import datetime
+
+from sqlalchemy import tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app.auth import models
+from app.core.config import settings
+from app.shared.utils import decode_cursor, dialect_insert, encode_cursor
+from .models import SpendingAlert
+from .schemas import AlertFilter, Catagory
+
+
+class SpendingAlerts:
+    @staticmethod
+    def crossed(previous: int, current: int, planned: int) -> list[int]:
+        # thresholds strictly below `previous` fired on an earlier write
+        return [
+            threshold
+            for threshold in settings.ALERT_THRESHOLDS
+            if previous * 100 < threshold * planned <= current * 100
+        ]
+
+    @staticmethod
+    async def evaluate(
+        db: AsyncSession,
+        user_id: int,
+        catagory: Catagory,
+        created_at: datetime,
+        amount: int,
+        totals,
+    ):
+        # `totals` is the (total_amount, planned_amount) row from the rollup
+        if not totals.planned_amount or amount <= 0:
+            return []
+        thresholds = SpendingAlerts.crossed(
+            totals.total_amount - amount, totals.total_amount, totals.planned_amount
+        )
+        if not thresholds:
+            return []
+        stmt = dialect_insert(db)(SpendingAlert).values(
+            [
+                {
+                    "user_id": user_id,
+                    "year": created_at.year,
+                    "month": created_at.month,
+                    "catagory": catagory,
+                    "threshold": threshold,
+                    "planned_amount": totals.planned_amount,
+                    "actual_amount": totals.total_amount,
+                    "created_at": created_at,
+                }
+                for threshold in thresholds
+            ]
+        )
+        # a threshold already fired this month (e.g. spending dropped after a
+        # delete and rose again) is not raised twice
+        stmt = stmt.on_conflict_do_nothing(
+            index_elements=["user_id", "year", "month", "catagory", "threshold"]
+        )
+        await db.execute(stmt)
+        return thresholds
+
+    @staticmethod
+    async def list_alerts(
+        filters: AlertFilter, db: AsyncSession, current_user: models.User
+    ):
+        # newest first, keyset paginated on (created_at, id) like expenses
+        stmt = select(
+            SpendingAlert.id,
+            SpendingAlert.year,
+            SpendingAlert.month,
+            SpendingAlert.catagory,
+            SpendingAlert.threshold,
+            SpendingAlert.planned_amount,
+            SpendingAlert.actual_amount,
+            SpendingAlert.created_at,
+        ).where(SpendingAlert.user_id == current_user.id)
+        if filters.cursor:
+            created_at, id = decode_cursor(filters.cursor)
+            stmt = stmt.where(
+                tuple_(SpendingAlert.created_at, SpendingAlert.id)
+                < tuple_(created_at, id)
+            )
+        stmt = stmt.order_by(
+            SpendingAlert.created_at.desc(), SpendingAlert.id.desc()
+        ).limit(filters.limit + 1)
+        alerts = (await db.execute(stmt)).all()
+
+        next_cursor = None
+        if len(alerts) > filters.limit:
+            alerts = alerts[: filters.limit]
+            last = alerts[-1]
+            next_cursor = encode_cursor(last.created_at, last.id)
+        return {"items": alerts, "next_cursor": next_cursor}
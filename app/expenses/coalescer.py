@@ -0,0 +1,282 @@
+"""Group commit for single-expense writes.
+
+On SQLite every transaction takes the database-wide write lock and syncs the
+WAL on commit, so a burst of POST /expense/ requests queues up behind itself.
+With WRITE_COALESCING enabled those requests hand their expense to
+ExpenseWriteCoalescer instead. A background task collects whatever arrives
+within WRITE_BATCH_MAX_LATENCY_MS (up to WRITE_BATCH_MAX_SIZE writes) and
+applies the lot in one transaction. Each caller then gets back its own
+expense, or its own "cannot exceed" error, exactly as the direct path would
+produce them.
+"""
+import asyncio
+import logging
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime
+
+from fastapi import HTTPException, status
+from sqlalchemy import insert, select, update
+
+from app.auth import models
+from app.core.config import settings
+from app.database import (
+    AsyncSessionLocal,
+    ReadSessionLocal,
+    read_engine,
+    replica_router,
+    shard_map,
+)
+from app.shared.utils import dialect_insert
+from .models import Expense
+from .schemas import ExpenseCreate, ExpenseSource
+from .services import ExpenseManagement
+
+logger = logging.getLogger("budget_buddy.coalescer")
+
+
+@dataclass
+class PendingExpense:
+    user_id: int
+    token_version: int
+    expense_data: ExpenseCreate
+    created_at: datetime
+    future: asyncio.Future
+
+
+class ExpenseWriteCoalescer:
+    def __init__(self):
+        self.queue: asyncio.Queue | None = None
+        self.task: asyncio.Task | None = None
+        self.batches = 0
+        self.writes = 0
+
+    @property
+    def running(self) -> bool:
+        return self.task is not None
+
+    def start(self):
+        self.queue = asyncio.Queue()
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        # new writes take the direct path from here on; the ones already
+        # queued are still committed before the task exits
+        task, self.task = self.task, None
+        if task is not None:
+            self.queue.put_nowait(None)
+            await task
+
+    async def submit(self, expense_data: ExpenseCreate, current_user) -> Expense:
+        # current_user is the token's TokenUser; the batch checks the row
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait(
+            PendingExpense(
+                current_user.id,
+                current_user.version,
+                expense_data,
+                datetime.utcnow(),
+                future,
+            )
+        )
+        # a caller that goes away is not taken out of the batch; like a
+        # disconnect during a direct write, its expense may still be committed
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        latency = settings.WRITE_BATCH_MAX_LATENCY_MS / 1000
+        stopping = False
+        while not stopping:
+            first = await self.queue.get()
+            if first is None:
+                return
+            batch = [first]
+            deadline = loop.time() + latency
+            while len(batch) < settings.WRITE_BATCH_MAX_SIZE:
+                try:
+                    pending = self.queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        pending = await asyncio.wait_for(self.queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                if pending is None:
+                    stopping = True
+                    break
+                batch.append(pending)
+            await self._write_batch(batch)
+
+    async def _write_batch(self, batch: list[PendingExpense]):
+        # with sharding, one transaction per shard the batch's users live on
+        try:
+            await shard_map.refresh()
+        except Exception as e:
+            self._fail(batch, e)
+            return
+        groups = defaultdict(list)
+        for pending in batch:
+            if not shard_map.enabled:
+                groups[None].append(pending)
+                continue
+            try:
+                shard_map.check_writable(pending.user_id)
+            except HTTPException as e:
+                pending.future.set_exception(e)
+                continue
+            groups[shard_map.shard_of(pending.user_id)].append(pending)
+        for shard, group in groups.items():
+            await self._write_group(shard, group)
+
+    def _fail(self, batch: list[PendingExpense], error: Exception):
+        # a failure here is the database's, not any one caller's; the
+        # whole batch was rolled back and every caller sees the error
+        logger.exception("expense write batch of %d failed", len(batch))
+        for pending in batch:
+            if not pending.future.done():
+                pending.future.set_exception(error)
+
+    async def _write_group(self, shard: int | None, batch: list[PendingExpense]):
+        try:
+            async with AsyncSessionLocal(info={"shard": shard}) as db:
+                results = await self._apply(db, batch)
+                await db.commit()
+        except Exception as e:
+            self._fail(batch, e)
+            return
+        self.batches += 1
+        self.writes += len(batch)
+        for user_id in {pending.user_id for pending in batch}:
+            replica_router.stick(user_id)
+        for pending, result in zip(batch, results):
+            if pending.future.done():
+                continue
+            if isinstance(result, Exception):
+                pending.future.set_exception(result)
+            else:
+                pending.future.set_result(result)
+
+    @staticmethod
+    async def _apply(db, batch: list[PendingExpense]) -> list:
+        # get_current_user's lookup and token check, once for the whole batch,
+        # on the primary; the user table is not written here, so the batch
+        # commits to the one database its balances and expenses live on
+        user_ids = {pending.user_id for pending in batch}
+        async with ReadSessionLocal(info={"bind": read_engine.sync_engine}) as users:
+            versions = dict(
+                (
+                    await users.execute(
+                        select(models.User.id, models.User.token_version).where(
+                            models.User.id.in_(user_ids)
+                        )
+                    )
+                ).all()
+            )
+        # A no-op UPDATE rather than a SELECT: it locks the rows on PostgreSQL
+        # and takes SQLite's write lock up front, so no other writer can move
+        # the balances between this read and the update below. Users without
+        # a balance row have nothing to spend.
+        stmt = (
+            update(models.UserBalance)
+            .where(models.UserBalance.user_id.in_(versions))
+            .values(total_income=models.UserBalance.total_income)
+            .returning(
+                models.UserBalance.user_id,
+                models.UserBalance.total_income,
+                models.UserBalance.total_savings,
+            )
+        )
+        start = {user_id: (0, 0) for user_id in versions}
+        for row in (await db.execute(stmt)).all():
+            start[row.user_id] = (row.total_income, row.total_savings)
+        balances = {user_id: list(start[user_id]) for user_id in start}
+
+        # the same checks as ExpenseManagement.add_expense, in arrival order
+        results = []
+        accepted = []
+        for pending in batch:
+            source = pending.expense_data.source
+            amount = pending.expense_data.amount
+            balance = balances.get(pending.user_id)
+            if balance is None:
+                results.append(
+                    HTTPException(
+                        status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
+                    )
+                )
+                continue
+            if versions[pending.user_id] != pending.token_version:
+                results.append(
+                    HTTPException(
+                        status_code=status.HTTP_401_UNAUTHORIZED,
+                        detail="Token has been revoked",
+                    )
+                )
+                continue
+            index = 1 if source == ExpenseSource.SAVINGS else 0
+            if balance[index] < amount:
+                results.append(
+                    HTTPException(
+                        status_code=status.HTTP_400_BAD_REQUEST,
+                        detail=f"Expense cannot exceed total {source.value}",
+                    )
+                )
+                continue
+            balance[index] -= amount
+            results.append(None)
+            accepted.append(pending)
+        if not accepted:
+            return results
+
+        # written as deltas: a row another writer created after the read
+        # above was not locked by it
+        touched = {pending.user_id for pending in accepted}
+        stmt = dialect_insert(db)(models.UserBalance).values(
+            [
+                {
+                    "user_id": user_id,
+                    "total_income": income - start[user_id][0],
+                    "total_savings": savings - start[user_id][1],
+                    "data_version": 1,
+                }
+                for user_id, (income, savings) in balances.items()
+                if user_id in touched
+            ]
+        )
+        await db.execute(
+            stmt.on_conflict_do_update(
+                index_elements=["user_id"],
+                set_={
+                    "total_income": models.UserBalance.total_income
+                    + stmt.excluded.total_income,
+                    "total_savings": models.UserBalance.total_savings
+                    + stmt.excluded.total_savings,
+                    "data_version": models.UserBalance.data_version + 1,
+                },
+            )
+        )
+        rows = [
+            {
+                "amount": pending.expense_data.amount,
+                "user_id": pending.user_id,
+                "catagory": pending.expense_data.catagory,
+                "created_at": pending.created_at,
+            }
+            for pending in accepted
+        ]
+        ids = (
+            await db.execute(
+                insert(Expense).returning(Expense.id, sort_by_parameter_order=True),
+                rows,
+            )
+        ).scalars().all()
+        await ExpenseManagement.apply_totals(db, rows)
+
+        expenses = iter(Expense(id=id, **row) for id, row in zip(ids, rows))
+        return [next(expenses) if result is None else result for result in results]
+
+
+expense_writer = ExpenseWriteCoalescer()
@@ -1,12 +1,22 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Enum
+from sqlalchemy import (
+    Boolean,
+    Column,
+    Integer,
+    String,
+    Float,
+    DateTime,
+    ForeignKey,
+    Enum,
+    Index,
+)
 from sqlalchemy.orm import relationship
 from datetime import datetime
 
 from . import schemas
-from app.database import Base
+from app.database import Base, ShardedByUser
 
 
-class Expense(Base):
+class Expense(ShardedByUser, Base):
     __tablename__ = "expenses_table"
 
     id = Column(Integer, primary_key=True, index=True)
@@ -17,8 +27,14 @@ class Expense(Base):
 
     user_id = Column(Integer, ForeignKey("user.id"), nullable=False)
     owner = relationship("User", back_populates="expenses")
-    
-class BudgetPlan(Base):
+
+    # month reports and the category route filter on a created_at range
+    __table_args__ = (
+        Index("ix_expenses_user_created", "user_id", "created_at"),
+        Index("ix_expenses_user_catagory_created", "user_id", "catagory", "created_at"),
+    )
+
+class BudgetPlan(ShardedByUser, Base):
     __tablename__="budget_plans"
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("user.id"), nullable=False)
@@ -27,4 +43,88 @@ class BudgetPlan(Base):
     category=Column(Enum(schemas.Catagory), nullable=False)
     planned_amount=Column(Integer, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
+
+    # one plan row per category and month; also the upsert conflict target
+    __table_args__ = (
+        Index(
+            "uq_budget_plans_user_month_category",
+            "user_id",
+            "year",
+            "month",
+            "category",
+            unique=True,
+        ),
+    )
     
+
+class MonthlyCategoryTotal(ShardedByUser, Base):
+    __tablename__ = "monthly_category_totals"
+
+    # rollup of expenses_table, kept in step by ExpenseManagement writes
+    user_id = Column(Integer, ForeignKey("user.id"), primary_key=True)
+    year = Column(Integer, primary_key=True)
+    month = Column(Integer, primary_key=True)
+    catagory = Column(Enum(schemas.Catagory), primary_key=True)
+    total_amount = Column(Integer, nullable=False, default=0)
+    expense_count = Column(Integer, nullable=False, default=0)
+
+
+class SpendingAlert(ShardedByUser, Base):
+    __tablename__ = "spending_alerts"
+
+    # a category's month total crossing `threshold` percent of its plan
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("user.id"), nullable=False)
+    year = Column(Integer, nullable=False)
+    month = Column(Integer, nullable=False)
+    catagory = Column(Enum(schemas.Catagory), nullable=False)
+    threshold = Column(Integer, nullable=False)
+    planned_amount = Column(Integer, nullable=False)
+    actual_amount = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        # each threshold fires once per category and month
+        Index(
+            "uq_spending_alerts_user_month_threshold",
+            "user_id",
+            "year",
+            "month",
+            "catagory",
+            "threshold",
+            unique=True,
+        ),
+        Index("ix_spending_alerts_user_created", "user_id", "created_at"),
+    )
+
+
+class RecurringRule(ShardedByUser, Base):
+    __tablename__ = "recurring_rules"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("user.id"), nullable=False)
+    kind = Column(Enum(schemas.RecurringKind), nullable=False)
+    amount = Column(Integer, nullable=False)
+    # expense rules only
+    source = Column(Enum(schemas.ExpenseSource), nullable=True)
+    catagory = Column(Enum(schemas.Catagory), nullable=True)
+    frequency = Column(Enum(schemas.Frequency), nullable=False)
+    cron = Column(String, nullable=True)
+    # monthly rules keep start_at's day of month, clamped to short months
+    start_at = Column(DateTime, nullable=False)
+    end_at = Column(DateTime, nullable=True)
+    next_run_at = Column(DateTime, nullable=False)
+    active = Column(Boolean, nullable=False, default=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (Index("ix_recurring_rules_due", "active", "next_run_at"),)
+
+
+class RecurringOccurrence(ShardedByUser, Base):
+    __tablename__ = "recurring_occurrences"
+
+    # idempotency key: an occurrence is materialized at most once
+    rule_id = Column(Integer, ForeignKey("recurring_rules.id"), primary_key=True)
+    occurs_at = Column(DateTime, primary_key=True)
+    # "applied", or "skipped" when the balance could not cover it
+    status = Column(String, nullable=False, default="applied")
@@ -0,0 +1,319 @@
+"""Recurring expenses, income and savings transfers.
+
+Rules are materialized by RecurringScheduler, a background task started with
+the application. Each pass claims a batch of due rules and expands every
+occurrence up to now. It records the occurrences in recurring_occurrences
+(whose primary key is the idempotency key), then applies the new ones in bulk
+using the same balance, rollup and alert effects as ExpenseManagement.
+Catching up after downtime is therefore a few batched statements per pass
+rather than one request per missed occurrence.
+"""
+import asyncio
+import calendar
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from fastapi import HTTPException, status
+from sqlalchemy import insert, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app.auth import models
+from app.core.config import settings
+from app.database import AsyncSessionLocal, shard_map, wrote_user_data
+from app.shared.cron import CronSchedule
+from app.shared.utils import dialect_insert
+from .models import Expense, RecurringOccurrence, RecurringRule
+from .schemas import ExpenseSource, Frequency, RecurringKind, RecurringRuleCreate
+from .services import ExpenseManagement
+
+logger = logging.getLogger("budget_buddy.recurring")
+
+# rows per multi-row INSERT, well under SQLite's bound-parameter limit
+INSERT_CHUNK = 1000
+
+
+def next_occurrence(rule: RecurringRule, after: datetime) -> datetime:
+    if rule.frequency == Frequency.DAILY:
+        return after + timedelta(days=1)
+    if rule.frequency == Frequency.WEEKLY:
+        return after + timedelta(weeks=1)
+    if rule.frequency == Frequency.MONTHLY:
+        year, month = divmod(after.month, 12)
+        year += after.year
+        month += 1
+        day = min(rule.start_at.day, calendar.monthrange(year, month)[1])
+        return after.replace(year=year, month=month, day=day)
+    return CronSchedule(rule.cron).next_after(after)
+
+
+def balance_deltas(rule: RecurringRule) -> tuple[int, int]:
+    # (income, savings) change of one occurrence, as ExpenseManagement does it
+    if rule.kind == RecurringKind.INCOME:
+        return rule.amount, 0
+    if rule.kind == RecurringKind.SAVINGS:
+        return -rule.amount, rule.amount
+    if rule.source == ExpenseSource.SAVINGS:
+        return 0, -rule.amount
+    return -rule.amount, 0
+
+
+class RecurringRules:
+    @staticmethod
+    async def create_rule(
+        rule_data: RecurringRuleCreate, db: AsyncSession, current_user: models.User
+    ):
+        if rule_data.kind == RecurringKind.EXPENSE and (
+            rule_data.source is None or rule_data.catagory is None
+        ):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Recurring expenses need a source and a catagory",
+            )
+        if (rule_data.frequency == Frequency.CRON) != bool(rule_data.cron):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="A cron expression is required for, and only for, cron rules",
+            )
+        start_at = rule_data.start_at or datetime.utcnow()
+        next_run_at = start_at
+        if rule_data.frequency == Frequency.CRON:
+            try:
+                next_run_at = CronSchedule(rule_data.cron).next_after(
+                    start_at - timedelta(minutes=1)
+                )
+            except ValueError as e:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST, detail=str(e)
+                ) from e
+        if rule_data.end_at is not None and rule_data.end_at < next_run_at:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="end_at is before the first occurrence",
+            )
+
+        is_expense = rule_data.kind == RecurringKind.EXPENSE
+        rule = RecurringRule(
+            user_id=current_user.id,
+            kind=rule_data.kind,
+            amount=rule_data.amount,
+            source=rule_data.source if is_expense else None,
+            catagory=rule_data.catagory if is_expense else None,
+            frequency=rule_data.frequency,
+            cron=rule_data.cron,
+            start_at=start_at,
+            end_at=rule_data.end_at,
+            next_run_at=next_run_at,
+            active=True,
+        )
+        db.add(rule)
+        await db.flush()
+        wrote_user_data(db, current_user.id)
+        return rule
+
+    @staticmethod
+    async def list_rules(db: AsyncSession, current_user: models.User):
+        stmt = (
+            select(RecurringRule)
+            .where(RecurringRule.user_id == current_user.id, RecurringRule.active)
+            .order_by(RecurringRule.next_run_at)
+        )
+        result = await db.execute(stmt)
+        return result.scalars().all()
+
+    @staticmethod
+    async def deactivate_rule(id: int, db: AsyncSession, current_user: models.User):
+        # rules are deactivated rather than deleted, keeping their occurrences
+        stmt = (
+            update(RecurringRule)
+            .where(
+                RecurringRule.id == id,
+                RecurringRule.user_id == current_user.id,
+                RecurringRule.active,
+            )
+            .values(active=False)
+        )
+        result = await db.execute(stmt)
+        if not result.rowcount:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="Recurring rule not found"
+            )
+        wrote_user_data(db, current_user.id)
+        return {"detail": "Recurring rule deleted successfully"}
+
+
+class RecurringScheduler:
+    @staticmethod
+    async def run_due(now: datetime | None = None) -> int:
+        """Materialize everything due at `now`; returns occurrences applied."""
+        now = now or datetime.utcnow()
+        applied = 0
+        await shard_map.refresh()
+        for shard in shard_map.shard_ids():
+            while True:
+                await shard_map.refresh()
+                async with AsyncSessionLocal(info={"shard": shard}) as db:
+                    claimed, batch_applied = await RecurringScheduler._run_batch(
+                        db, now, shard
+                    )
+                applied += batch_applied
+                if not claimed:
+                    break
+        return applied
+
+    @staticmethod
+    async def run_forever(stop: asyncio.Event):
+        # stopped through the event rather than cancelled, so a pass is never
+        # interrupted in the middle of its transaction
+        while not stop.is_set():
+            try:
+                applied = await RecurringScheduler.run_due()
+                if applied:
+                    logger.info("materialized %d recurring occurrences", applied)
+            except Exception:
+                logger.exception("recurring scheduler pass failed")
+            try:
+                await asyncio.wait_for(
+                    stop.wait(), timeout=settings.RECURRING_POLL_SECONDS
+                )
+            except asyncio.TimeoutError:
+                pass
+
+    @staticmethod
+    async def _run_batch(
+        db: AsyncSession, now: datetime, shard: int | None = None
+    ) -> tuple[int, int]:
+        # SKIP LOCKED lets several app processes share the work on PostgreSQL;
+        # SQLite serializes writers anyway and ignores the clause
+        stmt = (
+            select(RecurringRule)
+            .where(RecurringRule.active, RecurringRule.next_run_at <= now)
+            .order_by(RecurringRule.next_run_at, RecurringRule.id)
+            .limit(settings.RECURRING_BATCH_SIZE)
+            .with_for_update(skip_locked=True)
+        )
+        rules = (await db.execute(stmt)).scalars().all()
+        # rules of a bucket being moved, or left behind on its old shard
+        # until the move cleans up, belong to no pass here
+        rules = [rule for rule in rules if shard_map.owns(shard, rule.user_id)]
+        if not rules:
+            return 0, 0
+
+        due = []
+        for rule in rules:
+            when = rule.next_run_at
+            for _ in range(settings.RECURRING_MAX_CATCHUP):
+                if when > now or (rule.end_at is not None and when > rule.end_at):
+                    break
+                due.append(
+                    {"rule_id": rule.id, "occurs_at": when, "status": "applied"}
+                )
+                when = next_occurrence(rule, when)
+            # a rule with more backlog than MAX_CATCHUP is still due and is
+            # picked up again by the next batch
+            rule.next_run_at = when
+            if rule.end_at is not None and when > rule.end_at:
+                rule.active = False
+
+        # occurrences another run already recorded are not returned again
+        fresh = []
+        for offset in range(0, len(due), INSERT_CHUNK):
+            stmt = (
+                dialect_insert(db)(RecurringOccurrence)
+                .values(due[offset : offset + INSERT_CHUNK])
+                .on_conflict_do_nothing(index_elements=["rule_id", "occurs_at"])
+                .returning(RecurringOccurrence.rule_id, RecurringOccurrence.occurs_at)
+            )
+            fresh.extend((await db.execute(stmt)).all())
+
+        rules_by_id = {rule.id: rule for rule in rules}
+        by_user = defaultdict(list)
+        for occurrence in fresh:
+            rule = rules_by_id[occurrence.rule_id]
+            by_user[rule.user_id].append((rule, occurrence.occurs_at))
+
+        applied = []
+        skipped = []
+        balances = []
+        for user_id, occurrences in by_user.items():
+            # income is credited whatever the balance. The upsert creates the
+            # row of a user who has none yet, and for users without income
+            # rules still takes the row lock (and SQLite's write lock), so
+            # the balances read here stay current below
+            credit = sum(
+                rule.amount
+                for rule, _ in occurrences
+                if rule.kind == RecurringKind.INCOME
+            )
+            stmt = dialect_insert(db)(models.UserBalance).values(
+                user_id=user_id,
+                total_income=credit,
+                total_savings=0,
+                data_version=1,
+            )
+            stmt = stmt.on_conflict_do_update(
+                index_elements=["user_id"],
+                set_={
+                    "total_income": models.UserBalance.total_income
+                    + stmt.excluded.total_income,
+                    "data_version": models.UserBalance.data_version + 1,
+                },
+            ).returning(
+                models.UserBalance.total_income, models.UserBalance.total_savings
+            )
+            income, savings = (await db.execute(stmt)).one()
+            # debits are checked one by one in date order, as add_expense
+            # checks each write; only the ones the balance cannot cover are
+            # skipped
+            debited = False
+            for rule, occurs_at in sorted(occurrences, key=lambda o: o[1]):
+                if rule.kind != RecurringKind.INCOME:
+                    d_income, d_savings = balance_deltas(rule)
+                    if income + d_income < 0 or savings + d_savings < 0:
+                        skipped.append((rule, occurs_at))
+                        continue
+                    income += d_income
+                    savings += d_savings
+                    debited = True
+                applied.append((rule, occurs_at))
+            if debited:
+                balances.append(
+                    {
+                        "user_id": user_id,
+                        "total_income": income,
+                        "total_savings": savings,
+                    }
+                )
+        if balances:
+            await db.execute(update(models.UserBalance), balances)
+
+        if skipped:
+            logger.warning(
+                "skipped %d recurring occurrences the balance could not cover",
+                len(skipped),
+            )
+            await db.execute(
+                update(RecurringOccurrence),
+                [
+                    {"rule_id": rule.id, "occurs_at": occurs_at, "status": "skipped"}
+                    for rule, occurs_at in skipped
+                ],
+            )
+
+        expenses = [
+            {
+                "user_id": rule.user_id,
+                "amount": rule.amount,
+                "catagory": rule.catagory,
+                "created_at": occurs_at,
+            }
+            for rule, occurs_at in applied
+            if rule.kind == RecurringKind.EXPENSE
+        ]
+        if expenses:
+            await db.execute(insert(Expense), expenses)
+            await ExpenseManagement.apply_totals(db, expenses)
+
+        await db.commit()
+        return len(rules), len(applied)
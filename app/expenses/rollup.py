@@ -0,0 +1,169 @@
+"""Per-user monthly category totals.
+
+The rollup is updated in the same transaction as every expense write. To
+rebuild it from expenses_table or verify it against the raw rows:
+
+    python -m app.expenses.rollup rebuild [--user-id ID]
+    python -m app.expenses.rollup check [--user-id ID]
+"""
+import argparse
+import asyncio
+import sys
+from datetime import datetime
+
+from sqlalchemy import delete, extract, func, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app.auth import models  # noqa: F401  registers User for Expense.owner
+from app.database import AsyncSessionLocal, shard_map
+from app.shared.utils import dialect_insert
+from .models import BudgetPlan, Expense, MonthlyCategoryTotal
+from .schemas import Catagory
+
+
+class MonthlyRollup:
+    @staticmethod
+    async def apply(
+        db: AsyncSession,
+        user_id: int,
+        catagory: Catagory,
+        created_at: datetime,
+        amount: int,
+        count: int,
+    ):
+        # add (or with negative values, remove) expenses from one rollup row;
+        # returns the new running total and the month's planned amount for the
+        # category (None without a plan), read in the same statement
+        planned = (
+            select(BudgetPlan.planned_amount)
+            .where(
+                BudgetPlan.user_id == user_id,
+                BudgetPlan.year == created_at.year,
+                BudgetPlan.month == created_at.month,
+                BudgetPlan.category == catagory,
+            )
+            .scalar_subquery()
+        )
+        stmt = dialect_insert(db)(MonthlyCategoryTotal).values(
+            user_id=user_id,
+            year=created_at.year,
+            month=created_at.month,
+            catagory=catagory,
+            total_amount=amount,
+            expense_count=count,
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["user_id", "year", "month", "catagory"],
+            set_={
+                "total_amount": MonthlyCategoryTotal.total_amount
+                + stmt.excluded.total_amount,
+                "expense_count": MonthlyCategoryTotal.expense_count
+                + stmt.excluded.expense_count,
+            },
+        ).returning(MonthlyCategoryTotal.total_amount, planned.label("planned_amount"))
+        result = await db.execute(stmt)
+        return result.one()
+
+    @staticmethod
+    def _expected(user_id: int | None = None):
+        year = extract("year", Expense.created_at)
+        month = extract("month", Expense.created_at)
+        stmt = select(
+            Expense.user_id,
+            year.label("year"),
+            month.label("month"),
+            Expense.catagory,
+            func.sum(Expense.amount).label("total_amount"),
+            func.count(Expense.id).label("expense_count"),
+        ).group_by(Expense.user_id, year, month, Expense.catagory)
+        if user_id is not None:
+            stmt = stmt.where(Expense.user_id == user_id)
+        return stmt
+
+    @staticmethod
+    async def rebuild(db: AsyncSession, user_id: int | None = None):
+        stmt = delete(MonthlyCategoryTotal)
+        if user_id is not None:
+            stmt = stmt.where(MonthlyCategoryTotal.user_id == user_id)
+        await db.execute(stmt)
+        await db.execute(
+            insert(MonthlyCategoryTotal).from_select(
+                [
+                    "user_id",
+                    "year",
+                    "month",
+                    "catagory",
+                    "total_amount",
+                    "expense_count",
+                ],
+                MonthlyRollup._expected(user_id),
+            )
+        )
+        await db.commit()
+
+    @staticmethod
+    async def backfill_if_empty(db: AsyncSession):
+        # databases created before the rollup existed start with an empty table
+        has_rollup = await db.scalar(select(MonthlyCategoryTotal.user_id).limit(1))
+        has_expenses = await db.scalar(select(Expense.id).limit(1))
+        if has_rollup is None and has_expenses is not None:
+            await MonthlyRollup.rebuild(db)
+
+    @staticmethod
+    async def check(db: AsyncSession, user_id: int | None = None):
+        """Return (key, expected, actual) for every rollup row that has drifted."""
+        expected = {
+            (row.user_id, int(row.year), int(row.month), row.catagory): (
+                row.total_amount,
+                row.expense_count,
+            )
+            for row in await db.execute(MonthlyRollup._expected(user_id))
+        }
+        stmt = select(MonthlyCategoryTotal).where(
+            MonthlyCategoryTotal.expense_count != 0
+        )
+        if user_id is not None:
+            stmt = stmt.where(MonthlyCategoryTotal.user_id == user_id)
+        actual = {
+            (r.user_id, r.year, r.month, r.catagory): (r.total_amount, r.expense_count)
+            for r in (await db.execute(stmt)).scalars()
+        }
+        return [
+            (key, expected.get(key, (0, 0)), actual.get(key, (0, 0)))
+            for key in sorted(expected.keys() | actual.keys(), key=str)
+            if expected.get(key) != actual.get(key)
+        ]
+
+
+async def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("command", choices=["rebuild", "check"])
+    parser.add_argument("--user-id", type=int)
+    args = parser.parse_args(argv)
+
+    # a user's expenses and rollup rows share a shard, so each shard is
+    # rebuilt and checked on its own
+    await shard_map.refresh(force=True)
+    if args.user_id is not None:
+        infos = [{"user_id": args.user_id}]
+    else:
+        infos = [{"shard": shard} for shard in shard_map.shard_ids()]
+    mismatches = []
+    for info in infos:
+        async with AsyncSessionLocal(info=info) as db:
+            if args.command == "rebuild":
+                await MonthlyRollup.rebuild(db, user_id=args.user_id)
+            else:
+                mismatches += await MonthlyRollup.check(db, user_id=args.user_id)
+    if args.command == "rebuild":
+        print("monthly_category_totals rebuilt")
+        return 0
+    for key, expected, actual in mismatches:
+        print(f"{key}: expected {expected}, found {actual}")
+    print(f"{len(mismatches)} mismatched rollup rows")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
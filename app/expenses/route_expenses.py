@@ -1,30 +1,76 @@
-from fastapi import APIRouter, status, Depends, HTTPException
+from fastapi import (
+    APIRouter,
+    status,
+    Depends,
+    HTTPException,
+    Request,
+    UploadFile,
+    File,
+)
+from fastapi.responses import Response, StreamingResponse
+from pydantic import TypeAdapter
 from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import date
+from functools import partial
 
-from app.database import get_db
-from .services import ExpenseManagement, ExpensePlanner
+from app.core.config import settings
+from app.core.http_cache import versioned_response
+from app.database import get_db, get_read_db
+from .services import ExpenseManagement, ExpensePlanner, DashboardSummary
+from .alerts import SpendingAlerts
+from .coalescer import expense_writer
+from .recurring import RecurringRules
 from .schemas import (
     IncomeSchema,
     SavingSchema,
     ExpenseCreate,
+    ExpenseBatchResult,
     ExpenseShow,
+    ExpenseFilter,
+    ExpensePage,
+    ExportFormat,
+    Bucket,
+    AnalyticsShow,
     CatagoryShow,
     MonthlyPlanCreate,
+    DashboardSummaryShow,
+    AlertFilter,
+    AlertPage,
+    RecurringRuleCreate,
+    RecurringRuleShow,
+)
+from app.auth.route_user import (
+    get_current_user,
+    get_current_reader,
+    get_current_identity,
+    get_reader_identity,
+    get_token_user,
+    oauth2_scheme,
+    resolve_user,
 )
-from app.auth.route_user import get_current_user
 from app.auth.schemas import ShowUser
 
 
 router = APIRouter()
+expense_page_adapter = TypeAdapter(ExpensePage)
+
+
+def expense_page_response(page: dict) -> Response:
+    # validate the page in one pass and encode it in pydantic-core, instead of
+    # FastAPI validating each row against response_model and re-encoding it
+    validated = expense_page_adapter.validate_python(page, from_attributes=True)
+    return Response(
+        content=expense_page_adapter.dump_json(validated),
+        media_type="application/json",
+    )
 
 
 @router.put("/income/", status_code=status.HTTP_201_CREATED, response_model=ShowUser)
 async def add_income(
     income_data: IncomeSchema,
-    db=Depends(get_db),
+    db=Depends(get_db, scope="function"),
     current_user=Depends(get_current_user),
 ):
-    print("current_user===========>", current_user)
     updated_income = await ExpenseManagement.update_income(
         income_data=income_data, db=db, current_user=current_user
     )
@@ -34,7 +80,7 @@ async def add_income(
 @router.put("/savings/", status_code=status.HTTP_201_CREATED, response_model=ShowUser)
 async def add_savings(
     saving_data: SavingSchema,
-    db=Depends(get_db),
+    db=Depends(get_db, scope="function"),
     current_user=Depends(get_current_user),
 ):
     updated_savings = await ExpenseManagement.update_savings(
@@ -43,51 +89,134 @@ async def add_savings(
     return updated_savings
 
 
+async def get_expense_writer_identity(
+    token: str = Depends(oauth2_scheme), db=Depends(get_db, scope="function")
+):
+    # with the coalescer running, its batch checks the user row and the token
+    # version itself; loading the User here would hold a pooled connection
+    # for as long as the request waits on the batch
+    if expense_writer.running or settings.AUTH_CLAIM_ONLY:
+        current_user = await get_token_user(token)
+        db.info["user_id"] = current_user.id
+        return current_user
+    return await resolve_user(token, db)
+
+
 @router.post(
     "/expense/", status_code=status.HTTP_201_CREATED, response_model=ExpenseShow
 )
 async def add_expense(
     expense_data: ExpenseCreate,
-    db=Depends(get_db),
-    current_user=Depends(get_current_user),
+    db=Depends(get_db, scope="function"),
+    current_user=Depends(get_expense_writer_identity),
 ):
+    if expense_writer.running:
+        return await expense_writer.submit(expense_data, current_user)
     new_expense = await ExpenseManagement.add_expense(
         expense_data=expense_data, db=db, current_user=current_user
     )
     return new_expense
 
 
-@router.get(
-    "/expense/", status_code=status.HTTP_200_OK, response_model=list[ExpenseShow]
+@router.post(
+    "/expense/batch",
+    status_code=status.HTTP_201_CREATED,
+    response_model=ExpenseBatchResult,
 )
-async def get_expense_list(
-    db=Depends(get_db),
+async def add_expense_batch(
+    expenses: list[ExpenseCreate],
+    db=Depends(get_db, scope="function"),
+    current_user=Depends(get_current_user),
+):
+    result = await ExpenseManagement.add_expenses(
+        expenses=expenses, db=db, current_user=current_user
+    )
+    return result
+
+
+@router.post(
+    "/expense/batch/csv",
+    status_code=status.HTTP_201_CREATED,
+    response_model=ExpenseBatchResult,
+)
+async def add_expense_csv(
+    file: UploadFile = File(...),
+    db=Depends(get_db, scope="function"),
     current_user=Depends(get_current_user),
 ):
-    expenses = await ExpenseManagement.expense_list(db=db, current_user=current_user)
-    return expenses
+    expenses = ExpenseManagement.parse_expense_csv(await file.read())
+    result = await ExpenseManagement.add_expenses(
+        expenses=expenses, db=db, current_user=current_user
+    )
+    return result
+
+
+@router.get("/expense/", status_code=status.HTTP_200_OK, response_model=ExpensePage)
+async def get_expense_list(
+    filters: ExpenseFilter = Depends(),
+    db=Depends(get_read_db),
+    current_user=Depends(get_reader_identity),
+):
+    expenses = await ExpenseManagement.expense_list(
+        filters=filters, db=db, current_user=current_user
+    )
+    return expense_page_response(expenses)
+
+
+@router.get("/expense/export", status_code=status.HTTP_200_OK)
+async def export_expenses(
+    format: ExportFormat = ExportFormat.NDJSON,
+    current_user=Depends(get_reader_identity),
+):
+    media_type = "text/csv" if format == ExportFormat.CSV else "application/x-ndjson"
+    return StreamingResponse(
+        ExpenseManagement.export_expenses(format=format, user_id=current_user.id),
+        media_type=media_type,
+        headers={
+            "Content-Disposition": f'attachment; filename="expenses.{format.value}"'
+        },
+    )
+
+
+@router.get(
+    "/expense/analytics",
+    status_code=status.HTTP_200_OK,
+    response_model=AnalyticsShow,
+)
+async def get_expense_analytics(
+    start: date,
+    end: date,
+    bucket: Bucket = Bucket.MONTH,
+    db=Depends(get_read_db),
+    current_user=Depends(get_reader_identity),
+):
+    result = await ExpenseManagement.analytics(
+        start=start, end=end, bucket=bucket, db=db, current_user=current_user
+    )
+    return result
 
 
 @router.get(
     "/expense/{catagory}",
     status_code=status.HTTP_200_OK,
-    response_model=list[ExpenseShow],
+    response_model=ExpensePage,
 )
 async def get_expense_by_catagory(
     catagory: str,
-    db=Depends(get_db),
-    current_user=Depends(get_current_user),
+    filters: ExpenseFilter = Depends(),
+    db=Depends(get_read_db),
+    current_user=Depends(get_reader_identity),
 ):
     expenses = await ExpenseManagement.expense_list_by_catagory(
-        catagory=catagory, db=db, current_user=current_user
+        catagory=catagory, filters=filters, db=db, current_user=current_user
     )
-    return expenses
+    return expense_page_response(expenses)
 
 
 @router.delete("/expense/{id}", status_code=status.HTTP_200_OK, response_model=ShowUser)
 async def delete_expense(
     id: int,
-    db=Depends(get_db),
+    db=Depends(get_db, scope="function"),
     current_user=Depends(get_current_user),
 ):
     updated_user = await ExpenseManagement.delete_expense(
@@ -98,12 +227,24 @@ async def delete_expense(
 
 @router.get("/expense/monthly/{year}/{month}", status_code=status.HTTP_200_OK)
 async def get_monthly_report(
-    year: int, month: int, db=Depends(get_db), current_user=Depends(get_current_user)
+    year: int,
+    month: int,
+    request: Request,
+    db=Depends(get_read_db),
+    current_user=Depends(get_reader_identity),
 ):
-    report = await ExpenseManagement.monthly_report(
-        year=year, month=month, db=db, current_user=current_user
+    return await versioned_response(
+        request,
+        db,
+        current_user.id,
+        partial(
+            ExpenseManagement.monthly_report,
+            year=year,
+            month=month,
+            db=db,
+            current_user=current_user,
+        ),
     )
-    return report
 
 
 @router.post("/budget-plan/{year}/{month}", status_code=status.HTTP_201_CREATED)
@@ -111,8 +252,8 @@ async def create_budget_plan(
     year: int,
     month: int,
     plan_data: MonthlyPlanCreate,
-    db=Depends(get_db),
-    current_user=Depends(get_current_user),
+    db=Depends(get_db, scope="function"),
+    current_user=Depends(get_current_identity),
 ):
     result = await ExpensePlanner.create_budget_plan(
         year=year, month=month, plan_data=plan_data, db=db, current_user=current_user
@@ -124,20 +265,29 @@ async def create_budget_plan(
 async def get_budget_plan(
     year: int,
     month: int,
-    db=Depends(get_db),
-    current_user=Depends(get_current_user),
+    request: Request,
+    db=Depends(get_read_db),
+    current_user=Depends(get_reader_identity),
 ):
-    result = await ExpensePlanner.get_budget_plan(
-        year=year, month=month, db=db, current_user=current_user
+    return await versioned_response(
+        request,
+        db,
+        current_user.id,
+        partial(
+            ExpensePlanner.get_budget_plan,
+            year=year,
+            month=month,
+            db=db,
+            current_user=current_user,
+        ),
     )
-    return result
 
 @router.delete("/budget-plan/{year}/{month}", status_code=status.HTTP_200_OK)
 async def delete_budget_plan(
     year: int,
     month: int,
-    db=Depends(get_db),
-    current_user=Depends(get_current_user),
+    db=Depends(get_db, scope="function"),
+    current_user=Depends(get_current_identity),
 ):
     result = await ExpensePlanner.delete_budget_plan(
         year=year, month=month, db=db, current_user=current_user
@@ -149,8 +299,8 @@ async def delete_budget_plan(
 async def update_budget_plan(
     id: int,
     amount: int,
-    db=Depends(get_db),
-    current_user=Depends(get_current_user),
+    db=Depends(get_db, scope="function"),
+    current_user=Depends(get_current_identity),
 ):
     result = await ExpensePlanner.update_budget_plan(
         id=id, amount=amount, db=db, current_user=current_user
@@ -161,10 +311,90 @@ async def update_budget_plan(
 async def get_budget_vs_actual(
     year: int,
     month: int,
-    db=Depends(get_db),
-    current_user=Depends(get_current_user),
+    request: Request,
+    db=Depends(get_read_db),
+    current_user=Depends(get_reader_identity),
 ):
-    result = await ExpensePlanner.budget_vs_actual(
-        year=year, month=month, db=db, current_user=current_user
+    return await versioned_response(
+        request,
+        db,
+        current_user.id,
+        partial(
+            ExpensePlanner.budget_vs_actual,
+            year=year,
+            month=month,
+            db=db,
+            current_user=current_user,
+        ),
+    )
+
+
+@router.get(
+    "/dashboard/summary/{year}/{month}",
+    status_code=status.HTTP_200_OK,
+    response_model=DashboardSummaryShow,
+)
+async def get_dashboard_summary(
+    year: int,
+    month: int,
+    filters: ExpenseFilter = Depends(),
+    db=Depends(get_read_db),
+    current_user=Depends(get_current_reader),
+):
+    result = await DashboardSummary.summary(
+        year=year, month=month, filters=filters, db=db, current_user=current_user
+    )
+    return result
+
+
+@router.get("/alerts/", status_code=status.HTTP_200_OK, response_model=AlertPage)
+async def get_spending_alerts(
+    filters: AlertFilter = Depends(),
+    db=Depends(get_read_db),
+    current_user=Depends(get_reader_identity),
+):
+    alerts = await SpendingAlerts.list_alerts(
+        filters=filters, db=db, current_user=current_user
     )
-    return result
\ No newline at end of file
+    return alerts
+
+
+@router.post(
+    "/recurring/",
+    status_code=status.HTTP_201_CREATED,
+    response_model=RecurringRuleShow,
+)
+async def create_recurring_rule(
+    rule_data: RecurringRuleCreate,
+    db=Depends(get_db, scope="function"),
+    current_user=Depends(get_current_identity),
+):
+    rule = await RecurringRules.create_rule(
+        rule_data=rule_data, db=db, current_user=current_user
+    )
+    return rule
+
+
+@router.get(
+    "/recurring/",
+    status_code=status.HTTP_200_OK,
+    response_model=list[RecurringRuleShow],
+)
+async def get_recurring_rules(
+    db=Depends(get_read_db),
+    current_user=Depends(get_reader_identity),
+):
+    rules = await RecurringRules.list_rules(db=db, current_user=current_user)
+    return rules
+
+
+@router.delete("/recurring/{id}", status_code=status.HTTP_200_OK)
+async def delete_recurring_rule(
+    id: int,
+    db=Depends(get_db, scope="function"),
+    current_user=Depends(get_current_identity),
+):
+    result = await RecurringRules.deactivate_rule(
+        id=id, db=db, current_user=current_user
+    )
+    return result
@@ -1,8 +1,10 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from datetime import datetime
 from enum import Enum
 from typing import Literal
-from typing import List
+from typing import List, Optional
+from fastapi import Query
+from app.auth.schemas import ShowUser
 
 
 class IncomeSchema(BaseModel):
@@ -48,6 +50,12 @@ class ExpenseCreate(BaseModel):
     catagory: Catagory
 
 
+class ExpenseBatchResult(BaseModel):
+    inserted: int
+    total_income: int
+    total_savings: int
+
+
 class ExpenseShow(BaseModel):
     id: int
     amount: int
@@ -58,9 +66,128 @@ class ExpenseShow(BaseModel):
         from_attributes = True
         
 
+class ExportFormat(str, Enum):
+    NDJSON = "ndjson"
+    CSV = "csv"
+
+
+class Bucket(str, Enum):
+    DAY = "day"
+    WEEK = "week"
+    MONTH = "month"
+    YEAR = "year"
+
+
+class ExpenseFilter(BaseModel):
+    limit: int = Query(50, ge=1, le=500)
+    cursor: Optional[str] = None
+    start: Optional[datetime] = None
+    end: Optional[datetime] = None
+    min_amount: Optional[int] = None
+    max_amount: Optional[int] = None
+
+
+class ExpensePage(BaseModel):
+    items: List[ExpenseShow]
+    next_cursor: Optional[str] = None
+
+
+class AlertShow(BaseModel):
+    id: int
+    year: int
+    month: int
+    catagory: Catagory
+    threshold: int
+    planned_amount: int
+    actual_amount: int
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class AlertFilter(BaseModel):
+    limit: int = Query(50, ge=1, le=500)
+    cursor: Optional[str] = None
+
+
+class AlertPage(BaseModel):
+    items: List[AlertShow]
+    next_cursor: Optional[str] = None
+
+
+class RecurringKind(str, Enum):
+    EXPENSE = "expense"
+    INCOME = "income"
+    SAVINGS = "savings"
+
+
+class Frequency(str, Enum):
+    DAILY = "daily"
+    WEEKLY = "weekly"
+    MONTHLY = "monthly"
+    CRON = "cron"
+
+
+class RecurringRuleCreate(BaseModel):
+    kind: RecurringKind
+    amount: int = Field(gt=0)
+    source: Optional[ExpenseSource] = None
+    catagory: Optional[Catagory] = None
+    frequency: Frequency
+    cron: Optional[str] = None
+    start_at: Optional[datetime] = None
+    end_at: Optional[datetime] = None
+
+
+class RecurringRuleShow(BaseModel):
+    id: int
+    kind: RecurringKind
+    amount: int
+    source: Optional[ExpenseSource] = None
+    catagory: Optional[Catagory] = None
+    frequency: Frequency
+    cron: Optional[str] = None
+    start_at: datetime
+    end_at: Optional[datetime] = None
+    next_run_at: datetime
+    active: bool
+
+    class Config:
+        from_attributes = True
+
+
 class PlannedExpense(BaseModel):
     catagory: Catagory
     amount: int
 
 class MonthlyPlanCreate(BaseModel):
     planned_expenses: List[PlannedExpense]
+
+
+class PlanShow(BaseModel):
+    id: int
+    category: Catagory
+    planned_amount: int
+
+    class Config:
+        from_attributes = True
+
+
+class DashboardSummaryShow(BaseModel):
+    user: ShowUser
+    expenses: ExpensePage
+    monthly_report: dict
+    budget_plan: List[PlanShow]
+    budget_vs_actual: dict
+
+
+class AnalyticsShow(BaseModel):
+    # columnar: every list is parallel to periods
+    bucket: Bucket
+    periods: List[str]
+    totals: List[int]
+    counts: List[int]
+    by_catagory: dict[Catagory, List[int]]
+    running_average: List[float]
+    change: List[Optional[int]]
@@ -2,127 +2,450 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import APIRouter, Depends, HTTPException, status
 
 from app.auth import models
-from app.database import get_db
-from .schemas import IncomeSchema, SavingSchema, ExpenseCreate, MonthlyPlanCreate
-from .models import Expense, BudgetPlan
+from app.auth.services import UserProfile
+from app.database import (
+    ReadSessionLocal,
+    begin_read_transaction,
+    wrote_user_data,
+)
+from .schemas import (
+    IncomeSchema,
+    SavingSchema,
+    ExpenseCreate,
+    ExpenseFilter,
+    ExportFormat,
+    Bucket,
+    MonthlyPlanCreate,
+    Catagory,
+)
+from .models import Expense, BudgetPlan, MonthlyCategoryTotal
+from .rollup import MonthlyRollup
+from .alerts import SpendingAlerts
 from sqlalchemy.future import select
-from sqlalchemy import extract
+from sqlalchemy import (
+    and_,
+    delete,
+    func,
+    insert,
+    literal,
+    tuple_,
+    union_all,
+    update,
+)
+from pydantic import ValidationError
 from collections import defaultdict
+import csv
+import io
+import json
+from datetime import date, datetime, time
+from app.shared.utils import (
+    validate_month,
+    encode_cursor,
+    decode_cursor,
+    bucket_label,
+    bucket_periods,
+    dialect_insert,
+)
+
+MAX_ANALYTICS_BUCKETS = 2000
 
 
 class ExpenseManagement:
+    @staticmethod
+    async def adjust_balance(
+        db: AsyncSession, current_user: models.User, income: int = 0, savings: int = 0
+    ):
+        # one statement, so concurrent requests cannot lose each other's
+        # updates or overdraw; returns the user's UserBalance, or None when a
+        # balance would go negative. populate_existing refreshes a loaded row.
+        if income >= 0 and savings >= 0:
+            # a credit also creates the row of a user who has none yet
+            stmt = dialect_insert(db)(models.UserBalance).values(
+                user_id=current_user.id,
+                total_income=income,
+                total_savings=savings,
+                data_version=1,
+            )
+            stmt = stmt.on_conflict_do_update(
+                index_elements=["user_id"],
+                set_={
+                    "total_income": models.UserBalance.total_income
+                    + stmt.excluded.total_income,
+                    "total_savings": models.UserBalance.total_savings
+                    + stmt.excluded.total_savings,
+                    "data_version": models.UserBalance.data_version + 1,
+                },
+            )
+        else:
+            # without a row both balances are zero and nothing can be taken
+            stmt = (
+                update(models.UserBalance)
+                .where(
+                    models.UserBalance.user_id == current_user.id,
+                    models.UserBalance.total_income + income >= 0,
+                    models.UserBalance.total_savings + savings >= 0,
+                )
+                .values(
+                    total_income=models.UserBalance.total_income + income,
+                    total_savings=models.UserBalance.total_savings + savings,
+                    data_version=models.UserBalance.data_version + 1,
+                )
+            )
+        stmt = stmt.returning(models.UserBalance).execution_options(
+            populate_existing=True
+        )
+        result = await db.execute(stmt)
+        wrote_user_data(db, current_user.id)
+        return result.scalar_one_or_none()
+
+    @staticmethod
+    async def bump_data_version(db: AsyncSession, user_id: int):
+        # for writes that do not already go through adjust_balance
+        stmt = dialect_insert(db)(models.UserBalance).values(
+            user_id=user_id, total_income=0, total_savings=0, data_version=1
+        )
+        await db.execute(
+            stmt.on_conflict_do_update(
+                index_elements=["user_id"],
+                set_={"data_version": models.UserBalance.data_version + 1},
+            )
+        )
+        wrote_user_data(db, user_id)
+
     @staticmethod
     async def update_income(
         income_data: IncomeSchema, db: AsyncSession, current_user: models.User
     ):
-        current_user.total_income += income_data.amount
-        db.add(current_user)
-        await db.commit()
-        await db.refresh(current_user)
-        return current_user
+        updated = await ExpenseManagement.adjust_balance(
+            db, current_user, income=income_data.amount
+        )
+        # a negative amount that would take income below zero matches no row
+        if updated is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Income cannot go below zero",
+            )
+        return UserProfile.show(current_user, updated)
 
     @staticmethod
     async def update_savings(
         saving_data: SavingSchema, db: AsyncSession, current_user: models.User
     ):
-        if saving_data.amount > current_user.total_income:
+        updated = await ExpenseManagement.adjust_balance(
+            db, current_user, income=-saving_data.amount, savings=saving_data.amount
+        )
+        if updated is None:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Savings cannot exceed total income",
             )
-        current_user.total_savings += saving_data.amount
-        current_user.total_income -= saving_data.amount
-        db.add(current_user)
-        await db.commit()
-        await db.refresh(current_user)
-        return current_user
+        return UserProfile.show(current_user, updated)
 
     @staticmethod
     async def add_expense(
         expense_data: ExpenseCreate, db: AsyncSession, current_user: models.User
     ):
         if expense_data.source == "income":
-            if expense_data.amount > current_user.total_income:
+            updated = await ExpenseManagement.adjust_balance(
+                db, current_user, income=-expense_data.amount
+            )
+            if updated is None:
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
                     detail="Expense cannot exceed total income",
                 )
-            else:
-                current_user.total_income -= expense_data.amount
         elif expense_data.source == "savings":
-            if expense_data.amount > current_user.total_savings:
+            updated = await ExpenseManagement.adjust_balance(
+                db, current_user, savings=-expense_data.amount
+            )
+            if updated is None:
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
                     detail="Expense cannot exceed total savings",
                 )
-            else:
-                current_user.total_savings -= expense_data.amount
 
         new_expense = Expense(
             amount=expense_data.amount,
             user_id=current_user.id,
             # source=expense_data.source,
             catagory=expense_data.catagory,
+            created_at=datetime.utcnow(),
         )
-        db.add(current_user)
         db.add(new_expense)
-        await db.commit()
-        await db.refresh(new_expense)
+        totals = await MonthlyRollup.apply(
+            db,
+            user_id=current_user.id,
+            catagory=new_expense.catagory,
+            created_at=new_expense.created_at,
+            amount=new_expense.amount,
+            count=1,
+        )
+        await SpendingAlerts.evaluate(
+            db,
+            user_id=current_user.id,
+            catagory=new_expense.catagory,
+            created_at=new_expense.created_at,
+            amount=new_expense.amount,
+            totals=totals,
+        )
+        await db.flush()
         return new_expense
 
     @staticmethod
-    async def expense_list(db: AsyncSession, current_user: models.User):
-        stmt = select(Expense).where(Expense.user_id == current_user.id)
-        result = await db.execute(stmt)
-        expenses = result.scalars().all()
+    async def add_expenses(
+        expenses: list[ExpenseCreate], db: AsyncSession, current_user: models.User
+    ):
+        # all-or-nothing: balances are checked once against the per-source sums
+        if not expenses:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="No expenses to add",
+            )
+        from_income = sum(e.amount for e in expenses if e.source == "income")
+        from_savings = sum(e.amount for e in expenses if e.source == "savings")
+        updated = await ExpenseManagement.adjust_balance(
+            db, current_user, income=-from_income, savings=-from_savings
+        )
+        if updated is None:
+            balance = await db.get(models.UserBalance, current_user.id)
+            income = balance.total_income if balance else 0
+            source = "income" if from_income > income else "savings"
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Expenses cannot exceed total {source}",
+            )
+
+        created_at = datetime.utcnow()
+        rows = [
+            {
+                "amount": e.amount,
+                "user_id": current_user.id,
+                "catagory": e.catagory,
+                "created_at": created_at,
+            }
+            for e in expenses
+        ]
+        await db.execute(insert(Expense), rows)
+        await ExpenseManagement.apply_totals(db, rows)
+        return {
+            "inserted": len(rows),
+            "total_income": updated.total_income,
+            "total_savings": updated.total_savings,
+        }
+
+    @staticmethod
+    async def apply_totals(db: AsyncSession, rows: list[dict]):
+        # one rollup write (and alert check) per user, category and month of
+        # the inserted expense rows
+        by_month = defaultdict(lambda: [0, 0, None])
+        for row in rows:
+            created_at = row["created_at"]
+            month = by_month[
+                (row["user_id"], row["catagory"], created_at.year, created_at.month)
+            ]
+            month[0] += row["amount"]
+            month[1] += 1
+            month[2] = max(month[2] or created_at, created_at)
+        for (user_id, catagory, _, _), (amount, count, created_at) in by_month.items():
+            totals = await MonthlyRollup.apply(
+                db,
+                user_id=user_id,
+                catagory=catagory,
+                created_at=created_at,
+                amount=amount,
+                count=count,
+            )
+            await SpendingAlerts.evaluate(
+                db,
+                user_id=user_id,
+                catagory=catagory,
+                created_at=created_at,
+                amount=amount,
+                totals=totals,
+            )
+
+    @staticmethod
+    def parse_expense_csv(content: bytes) -> list[ExpenseCreate]:
+        # expects amount,source,catagory columns; reports every bad row at once
+        try:
+            reader = csv.DictReader(io.StringIO(content.decode("utf-8-sig")))
+        except UnicodeDecodeError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="CSV file must be UTF-8 encoded",
+            )
+        expenses, errors = [], []
+        for line, row in enumerate(reader, start=2):
+            try:
+                expenses.append(ExpenseCreate.model_validate(row))
+            except ValidationError as e:
+                errors.append(
+                    {
+                        "row": line,
+                        "errors": e.errors(include_url=False, include_context=False),
+                    }
+                )
+        if errors:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=errors
+            )
         return expenses
 
     @staticmethod
-    async def expense_list_by_catagory(
-        catagory: str, db: AsyncSession, current_user: models.User
+    async def expense_list(
+        filters: ExpenseFilter,
+        db: AsyncSession,
+        current_user: models.User,
+        catagory: str | None = None,
     ):
-        stmt = select(Expense).where(
-            Expense.user_id == current_user.id, Expense.catagory == catagory
+        # newest first, keyset paginated on (created_at, id); plain column
+        # rows rather than ORM objects, nothing here is modified
+        stmt = select(
+            Expense.id, Expense.amount, Expense.created_at, Expense.catagory
+        ).where(Expense.user_id == current_user.id)
+        if catagory is not None:
+            stmt = stmt.where(Expense.catagory == catagory)
+        if filters.start is not None:
+            stmt = stmt.where(Expense.created_at >= filters.start)
+        if filters.end is not None:
+            stmt = stmt.where(Expense.created_at < filters.end)
+        if filters.min_amount is not None:
+            stmt = stmt.where(Expense.amount >= filters.min_amount)
+        if filters.max_amount is not None:
+            stmt = stmt.where(Expense.amount <= filters.max_amount)
+        if filters.cursor:
+            created_at, id = decode_cursor(filters.cursor)
+            stmt = stmt.where(
+                tuple_(Expense.created_at, Expense.id) < tuple_(created_at, id)
+            )
+        stmt = stmt.order_by(Expense.created_at.desc(), Expense.id.desc()).limit(
+            filters.limit + 1
         )
         result = await db.execute(stmt)
-        expenses = result.scalars().all()
-        return expenses
+        expenses = result.all()
+
+        next_cursor = None
+        if len(expenses) > filters.limit:
+            expenses = expenses[: filters.limit]
+            last = expenses[-1]
+            next_cursor = encode_cursor(last.created_at, last.id)
+        return {"items": expenses, "next_cursor": next_cursor}
+
+    @staticmethod
+    async def expense_list_by_catagory(
+        catagory: str,
+        filters: ExpenseFilter,
+        db: AsyncSession,
+        current_user: models.User,
+    ):
+        return await ExpenseManagement.expense_list(
+            filters=filters, db=db, current_user=current_user, catagory=catagory
+        )
+
+    @staticmethod
+    async def export_expenses(format: ExportFormat, user_id: int):
+        # runs while the response streams, after the request session is gone,
+        # so it owns its session and only holds one partition at a time; a
+        # read session, so a long export never holds the write lock, with a
+        # read-only transaction for the cursor where the backend needs one
+        stmt = (
+            select(Expense.id, Expense.amount, Expense.created_at, Expense.catagory)
+            .where(Expense.user_id == user_id)
+            .order_by(Expense.created_at, Expense.id)
+        )
+        async with ReadSessionLocal(info={"user_id": user_id}) as db:
+            await begin_read_transaction(db, Expense)
+            result = await db.stream(stmt, execution_options={"yield_per": 1000})
+            if format == ExportFormat.CSV:
+                yield "id,amount,created_at,catagory\r\n"
+            async for rows in result.partitions():
+                buffer = io.StringIO()
+                if format == ExportFormat.CSV:
+                    writer = csv.writer(buffer)
+                    for row in rows:
+                        writer.writerow(
+                            [
+                                row.id,
+                                row.amount,
+                                row.created_at.isoformat(),
+                                row.catagory.value,
+                            ]
+                        )
+                else:
+                    for row in rows:
+                        buffer.write(
+                            json.dumps(
+                                {
+                                    "id": row.id,
+                                    "amount": row.amount,
+                                    "created_at": row.created_at.isoformat(),
+                                    "catagory": row.catagory.value,
+                                }
+                            )
+                        )
+                        buffer.write("\n")
+                yield buffer.getvalue()
 
     @staticmethod
     async def delete_expense(id: int, db: AsyncSession, current_user: models.User):
-        stmt = select(Expense).where(
-            Expense.id == id, Expense.user_id == current_user.id
+        stmt = (
+            delete(Expense)
+            .where(Expense.id == id, Expense.user_id == current_user.id)
+            .returning(Expense.amount, Expense.catagory, Expense.created_at)
         )
         result = await db.execute(stmt)
-        expense = result.scalar_one_or_none()
+        expense = result.one_or_none()
         if not expense:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND, detail="Expense not found"
             )
-        current_user.total_income += expense.amount
-        await db.delete(expense)
-        await db.commit()
-        return {"detail": "Expense deleted successfully"}
+        balance = await ExpenseManagement.adjust_balance(
+            db, current_user, income=expense.amount
+        )
+        await MonthlyRollup.apply(
+            db,
+            user_id=current_user.id,
+            catagory=expense.catagory,
+            created_at=expense.created_at,
+            amount=-expense.amount,
+            count=-1,
+        )
+        return UserProfile.show(current_user, balance)
 
     @staticmethod
-    async def monthly_report(
+    async def monthly_totals(
         year: int, month: int, db: AsyncSession, current_user: models.User
     ):
-        stmt = select(Expense).where(
-            Expense.user_id == current_user.id,
-            extract("year", Expense.created_at) == year,
-            extract("month", Expense.created_at) == month,
+        # one (catagory, total, expense_count) row per category from the rollup
+        validate_month(month)
+        stmt = select(
+            MonthlyCategoryTotal.catagory,
+            MonthlyCategoryTotal.total_amount.label("total"),
+            MonthlyCategoryTotal.expense_count,
+        ).where(
+            MonthlyCategoryTotal.user_id == current_user.id,
+            MonthlyCategoryTotal.year == year,
+            MonthlyCategoryTotal.month == month,
+            MonthlyCategoryTotal.expense_count > 0,
         )
         result = await db.execute(stmt)
-        expenses = result.scalars().all()
+        return result.all()
+
+    @staticmethod
+    async def monthly_report(
+        year: int, month: int, db: AsyncSession, current_user: models.User
+    ):
+        totals = await ExpenseManagement.monthly_totals(
+            year=year, month=month, db=db, current_user=current_user
+        )
 
         # total expense calculation
-        total_expense = sum(expense.amount for expense in expenses)
+        total_expense = sum(row.total for row in totals)
 
         # expense by catagory
         expense_by_catagory = defaultdict(int)
-        for expense in expenses:
-            expense_by_catagory[expense.catagory] += expense.amount
+        for row in totals:
+            expense_by_catagory[row.catagory] = row.total
 
         percentage_by_catagory = defaultdict(float)
         for catagory, amount in expense_by_catagory.items():
@@ -138,6 +461,106 @@ class ExpenseManagement:
             "percentage_by_catagory": percentage_by_catagory,
         }
 
+    @staticmethod
+    async def analytics(
+        start: date,
+        end: date,
+        bucket: Bucket,
+        db: AsyncSession,
+        current_user: models.User,
+    ):
+        # per-bucket and per-category totals for [start, end) from one grouped
+        # query; month and year buckets read the rollup and cover whole months
+        if end <= start:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="end must be after start",
+            )
+        periods = bucket_periods(start, end, bucket.value)
+        if len(periods) > MAX_ANALYTICS_BUCKETS:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Range spans more than {MAX_ANALYTICS_BUCKETS} buckets",
+            )
+
+        if bucket in (Bucket.MONTH, Bucket.YEAR):
+            rollup = MonthlyCategoryTotal
+            if end.day == 1:
+                last = (end.year, end.month)
+            elif end.month == 12:
+                last = (end.year + 1, 1)
+            else:
+                last = (end.year, end.month + 1)
+            group = [rollup.year]
+            if bucket == Bucket.MONTH:
+                group.append(rollup.month)
+            stmt = (
+                select(
+                    *group,
+                    rollup.catagory,
+                    func.sum(rollup.total_amount).label("total"),
+                    func.sum(rollup.expense_count).label("expense_count"),
+                )
+                .where(
+                    rollup.user_id == current_user.id,
+                    tuple_(rollup.year, rollup.month) >= (start.year, start.month),
+                    tuple_(rollup.year, rollup.month) < last,
+                )
+                .group_by(*group, rollup.catagory)
+            )
+        else:
+            label = bucket_label(
+                Expense.created_at, bucket.value, db.get_bind().dialect.name
+            )
+            stmt = (
+                select(
+                    label.label("period"),
+                    Expense.catagory,
+                    func.sum(Expense.amount).label("total"),
+                    func.count(Expense.id).label("expense_count"),
+                )
+                .where(
+                    Expense.user_id == current_user.id,
+                    Expense.created_at >= datetime.combine(start, time.min),
+                    Expense.created_at < datetime.combine(end, time.min),
+                )
+                .group_by(label, Expense.catagory)
+            )
+        rows = (await db.execute(stmt)).all()
+
+        index = {period: i for i, period in enumerate(periods)}
+        totals = [0] * len(periods)
+        counts = [0] * len(periods)
+        by_catagory = {}
+        for row in rows:
+            if bucket == Bucket.MONTH:
+                period = f"{row.year:04d}-{row.month:02d}"
+            elif bucket == Bucket.YEAR:
+                period = f"{row.year:04d}"
+            else:
+                period = row.period
+            i = index[period]
+            totals[i] += row.total
+            counts[i] += row.expense_count
+            by_catagory.setdefault(row.catagory, [0] * len(periods))[i] += row.total
+
+        running_average, change = [], []
+        cumulative = 0
+        for i, total in enumerate(totals):
+            cumulative += total
+            running_average.append(cumulative / (i + 1))
+            change.append(total - totals[i - 1] if i else None)
+
+        return {
+            "bucket": bucket,
+            "periods": periods,
+            "totals": totals,
+            "counts": counts,
+            "by_catagory": by_catagory,
+            "running_average": running_average,
+            "change": change,
+        }
+
 
 class ExpensePlanner:
 
@@ -149,18 +572,45 @@ class ExpensePlanner:
         db: AsyncSession,
         current_user: models.User,
     ):
+        # last amount wins if a category is listed twice; ON CONFLICT cannot
+        # touch the same row twice in one statement
+        amounts = {item.catagory: item.amount for item in plan_data.planned_expenses}
         try:
-            for item in plan_data.planned_expenses:
-                new_plan = BudgetPlan(
-                    user_id=current_user.id,
-                    year=year,
-                    month=month,
-                    category=item.catagory,
-                    planned_amount=item.amount,
+            # the submission replaces the month: categories left out are dropped
+            stale = delete(BudgetPlan).where(
+                BudgetPlan.user_id == current_user.id,
+                BudgetPlan.year == year,
+                BudgetPlan.month == month,
+            )
+            if amounts:
+                stale = stale.where(BudgetPlan.category.not_in(list(amounts)))
+            dropped = (await db.execute(stale)).rowcount
+            if amounts:
+                stmt = dialect_insert(db)(BudgetPlan).values(
+                    [
+                        {
+                            "user_id": current_user.id,
+                            "year": year,
+                            "month": month,
+                            "category": category,
+                            "planned_amount": amount,
+                            "created_at": datetime.utcnow(),
+                        }
+                        for category, amount in amounts.items()
+                    ]
+                )
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=["user_id", "year", "month", "category"],
+                    set_={"planned_amount": stmt.excluded.planned_amount},
                 )
-                db.add(new_plan)
-            await db.commit()
+                await db.execute(stmt)
+            if amounts or dropped:
+                await ExpenseManagement.bump_data_version(db, current_user.id)
             return {"detail": "Budget plan created successfully"}
+        except HTTPException:
+            # e.g. check_writable's 503 and its Retry-After
+            await db.rollback()
+            raise
         except Exception as e:
             await db.rollback()
             raise HTTPException(
@@ -195,76 +645,144 @@ class ExpensePlanner:
                 status_code=status.HTTP_404_NOT_FOUND, detail="Budget plan not found"
             )
         plan.planned_amount = amount
-        await db.commit()
+        await ExpenseManagement.bump_data_version(db, current_user.id)
         return {"detail": "Budget plan updated successfully"}
 
     @staticmethod
     async def delete_budget_plan(
         year: int, month: int, db: AsyncSession, current_user: models.User
     ):
-        stmt = select(BudgetPlan).where(
+        stmt = delete(BudgetPlan).where(
             BudgetPlan.user_id == current_user.id,
             BudgetPlan.year == year,
             BudgetPlan.month == month,
         )
         result = await db.execute(stmt)
-        plans = result.scalars().all()
-        if not plans:
+        if not result.rowcount:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND, detail="No budget plan found"
             )
-        for plan in plans:
-            await db.delete(plan)
-        await db.commit()
+        await ExpenseManagement.bump_data_version(db, current_user.id)
         return {"detail": "Budget plan deleted successfully"}
 
     @staticmethod
     async def budget_vs_actual(
         year: int, month: int, db: AsyncSession, current_user: models.User
     ):
-        # Fetch budget plans
-        stmt = select(BudgetPlan).where(
-            BudgetPlan.user_id == current_user.id,
-            BudgetPlan.year == year,
-            BudgetPlan.month == month,
-        )
-        result = await db.execute(stmt)
-        plans = result.scalars().all()
-
-        # Fetch actual expenses
-        stmt = select(Expense).where(
-            Expense.user_id == current_user.id,
-            extract("year", Expense.created_at) == year,
-            extract("month", Expense.created_at) == month,
-        )
-        result = await db.execute(stmt)
-        expenses = result.scalars().all()
-
-        # Calculate actual expenses by category
-        actual_by_category = defaultdict(int)
-        total_expense = 0
-        for expense in expenses:
-            actual_by_category[expense.catagory] += expense.amount
-            total_expense += expense.amount
-
-        
-        # Prepare the comparison data
-        comparison = []
-        total_planned = sum(plan.planned_amount for plan in plans)
-        for plan in plans:
-            actual_amount = actual_by_category.get(plan.category, 0)
-            comparison.append(
-                {
-                    "category": plan.category,
-                    "planned_amount": plan.planned_amount,
-                    "actual_amount": actual_amount,
-                }
+        validate_month(month)
+        # every category, outer-joined to its plan and its rollup row, so only
+        # one aggregated row per category leaves the database
+        categories = union_all(
+            *(
+                select(
+                    literal(category, BudgetPlan.category.type).label("catagory"),
+                    literal(position).label("position"),
+                )
+                for position, category in enumerate(Catagory)
             )
+        ).subquery("categories")
+        planned = func.coalesce(BudgetPlan.planned_amount, 0)
+        actual = func.coalesce(MonthlyCategoryTotal.total_amount, 0)
+        stmt = (
+            select(
+                categories.c.catagory,
+                planned.label("planned"),
+                actual.label("actual"),
+                (planned - actual).label("variance"),
+                (actual > planned).label("overspent"),
+            )
+            .select_from(categories)
+            .outerjoin(
+                BudgetPlan,
+                and_(
+                    BudgetPlan.category == categories.c.catagory,
+                    BudgetPlan.user_id == current_user.id,
+                    BudgetPlan.year == year,
+                    BudgetPlan.month == month,
+                ),
+            )
+            .outerjoin(
+                MonthlyCategoryTotal,
+                and_(
+                    MonthlyCategoryTotal.catagory == categories.c.catagory,
+                    MonthlyCategoryTotal.user_id == current_user.id,
+                    MonthlyCategoryTotal.year == year,
+                    MonthlyCategoryTotal.month == month,
+                ),
+            )
+            .order_by(categories.c.position)
+        )
+        rows = (await db.execute(stmt)).all()
 
+        comparison = [
+            {
+                "category": row.catagory,
+                "planned_amount": row.planned,
+                "actual_amount": row.actual,
+                "variance": row.variance,
+                # in Python: PostgreSQL has no round() for double precision
+                "percent_used": (
+                    round(row.actual * 100 / row.planned, 2)
+                    if row.planned > 0
+                    else None
+                ),
+                "overspent": bool(row.overspent),
+            }
+            for row in rows
+        ]
+        total_planned = sum(row.planned for row in rows)
+        total_expense = sum(row.actual for row in rows)
         return {
             "year": year,
             "month": month,
             "total_planned": total_planned,
             "total_expense": total_expense,
+            "total_variance": total_planned - total_expense,
+            "overspent": total_expense > total_planned,
+            "overspent_categories": [
+                item["category"] for item in comparison if item["overspent"]
+            ],
             "comparison": comparison,
         }
+
+    @staticmethod
+    async def drop_duplicate_plans(conn):
+        # keep the newest row per (user, month, category) so the unique index
+        # can be built on databases created before it existed
+        newest = select(func.max(BudgetPlan.id)).group_by(
+            BudgetPlan.user_id, BudgetPlan.year, BudgetPlan.month, BudgetPlan.category
+        )
+        await conn.execute(delete(BudgetPlan).where(BudgetPlan.id.not_in(newest)))
+
+
+class DashboardSummary:
+    @staticmethod
+    async def summary(
+        year: int,
+        month: int,
+        filters: ExpenseFilter,
+        db: AsyncSession,
+        current_user: models.User,
+    ):
+        # everything the dashboard renders on load, from one request session.
+        # An AsyncSession runs one statement at a time on its connection, so
+        # the queries run back to back rather than concurrently.
+        expenses = await ExpenseManagement.expense_list(
+            filters=filters, db=db, current_user=current_user
+        )
+        report = await ExpenseManagement.monthly_report(
+            year=year, month=month, db=db, current_user=current_user
+        )
+        budget_plan = await ExpensePlanner.get_budget_plan(
+            year=year, month=month, db=db, current_user=current_user
+        )
+        budget_vs_actual = await ExpensePlanner.budget_vs_actual(
+            year=year, month=month, db=db, current_user=current_user
+        )
+        return {
+            "user": await UserProfile.load(db, current_user),
+            "expenses": expenses,
+            "monthly_report": report,
+            "budget_plan": budget_plan,
+            "budget_vs_actual": budget_vs_actual,
+        }
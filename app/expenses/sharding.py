@@ -0,0 +1,396 @@
+"""Shard map maintenance, online rebalancing and cross-shard aggregates.
+
+With SHARD_URLS set, every user's balances, expenses, budget plans, rollup
+rows, alerts and recurring rules live on one shard, chosen by the bucket
+their id hashes to (app.database.user_bucket). shard_buckets on the primary
+assigns buckets to shards:
+
+    python -m app.expenses.sharding status
+    python -m app.expenses.sharding rebalance [--dry-run] [--grace SECONDS]
+    python -m app.expenses.sharding move BUCKET SHARD [--grace SECONDS]
+    python -m app.expenses.sharding totals YEAR MONTH [--top N]
+
+When sharding is first enabled on a database that already holds expenses,
+every bucket starts out on the primary (shard -1); rebalance then migrates
+them onto the shards one bucket at a time. After adding a URL to SHARD_URLS,
+rebalance moves buckets onto the new shard until all shards hold an equal
+share. Shards can be added but not removed.
+
+A move marks the bucket as moving, waits until every process has reloaded
+the map (writes for the bucket get a 503 meanwhile, reads continue from the
+source), then reads the bucket's users and copies their rows in one
+transaction, points the bucket at the target and, after another wait,
+deletes the source rows. Users who sign up later cannot write to the bucket
+until it has moved, so none of their rows stay behind. Copied rows get new
+ids on the target, so clients holding an expense or plan id from before the
+move get a 404 for it afterwards. An interrupted move can be rerun; its
+partial copy is replaced.
+"""
+import argparse
+import asyncio
+import heapq
+import sys
+from collections import Counter
+
+from sqlalchemy import delete, func, insert, inspect, literal, update
+from sqlalchemy.future import select
+from sqlalchemy.schema import CreateTable
+
+from app.auth.models import User
+from app.core.config import settings
+from app.database import (
+    PRIMARY_SHARD,
+    SHARD_BUCKETS,
+    Base,
+    ReadSessionLocal,
+    engine,
+    read_engine,
+    shard_buckets,
+    shard_map,
+    sharded_table_names,
+    user_bucket,
+)
+from .models import Expense, MonthlyCategoryTotal
+
+# users whose rows are copied or deleted per statement batch
+MOVE_CHUNK_SIZE = 100
+
+
+def sharded_tables() -> list:
+    # parents before children, so copies satisfy the foreign keys
+    return [t for t in Base.metadata.sorted_tables if t.name in sharded_table_names]
+
+
+def sharded_parents(table) -> list:
+    return [
+        fk for fk in table.foreign_keys if fk.column.table.name in sharded_table_names
+    ]
+
+
+def owned_by(table, user_ids: list):
+    # rows of `user_ids`; tables without user_id belong to a sharded parent
+    if "user_id" in table.c:
+        return table.c.user_id.in_(user_ids)
+    fk = sharded_parents(table)[0]
+    parent = fk.column.table
+    return fk.parent.in_(select(fk.column).where(owned_by(parent, user_ids)))
+
+
+def chunks(items: list, size: int):
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+class ShardAdmin:
+    @staticmethod
+    def create_tables(sync_conn):
+        # references to user.id cannot be enforced across databases, so
+        # shards only get the foreign keys between their own tables
+        existing = set(inspect(sync_conn).get_table_names())
+        for table in sharded_tables():
+            if table.name in existing:
+                continue
+            sync_conn.execute(
+                CreateTable(
+                    table,
+                    include_foreign_key_constraints=[
+                        fk.constraint for fk in sharded_parents(table)
+                    ],
+                )
+            )
+
+    @staticmethod
+    async def init_buckets(conn):
+        # run on the primary; the first sharded start-up fixes every bucket's
+        # shard, so later changes to SHARD_URLS never move data implicitly
+        if await conn.scalar(select(func.count()).select_from(shard_buckets)):
+            return
+        existing = await conn.run_sync(
+            lambda sync_conn: set(inspect(sync_conn).get_table_names())
+        )
+        legacy = False
+        for table in sharded_tables():
+            if table.name in existing and not legacy:
+                first = select(literal(1)).select_from(table).limit(1)
+                legacy = await conn.scalar(first) is not None
+        shard_count = len(shard_map.engines)
+        await conn.execute(
+            insert(shard_buckets),
+            [
+                {
+                    "bucket": bucket,
+                    "shard": PRIMARY_SHARD if legacy else bucket % shard_count,
+                    "moving": False,
+                }
+                for bucket in range(SHARD_BUCKETS)
+            ],
+        )
+
+    @staticmethod
+    def plan_rebalance(buckets: dict[int, int], shard_count: int) -> list:
+        # fewest moves that leave every shard within one bucket of the others;
+        # buckets still on the primary always move
+        quota = [
+            SHARD_BUCKETS // shard_count + (shard < SHARD_BUCKETS % shard_count)
+            for shard in range(shard_count)
+        ]
+        assigned = {shard: [] for shard in range(shard_count)}
+        surplus = []
+        for bucket, shard in sorted(buckets.items()):
+            if shard == PRIMARY_SHARD:
+                surplus.append(bucket)
+            else:
+                assigned[shard].append(bucket)
+        for shard in range(shard_count):
+            while len(assigned[shard]) > quota[shard]:
+                surplus.append(assigned[shard].pop())
+        moves = []
+        for shard in range(shard_count):
+            while len(assigned[shard]) < quota[shard]:
+                bucket = surplus.pop(0)
+                assigned[shard].append(bucket)
+                moves.append((bucket, shard))
+        return moves
+
+    @staticmethod
+    async def set_bucket(bucket: int, shard: int, moving: bool):
+        async with engine.begin() as conn:
+            await conn.execute(
+                update(shard_buckets)
+                .where(shard_buckets.c.bucket == bucket)
+                .values(shard=shard, moving=moving)
+            )
+
+    @staticmethod
+    async def copy_rows(source_conn, target_conn, user_ids: list):
+        tables = sharded_tables()
+        # leftovers of an interrupted move of the same users
+        for table in reversed(tables):
+            await target_conn.execute(delete(table).where(owned_by(table, user_ids)))
+        new_ids: dict[str, dict] = {}
+        for table in tables:
+            rows = [
+                dict(row)
+                for row in (
+                    await source_conn.execute(
+                        select(table).where(owned_by(table, user_ids))
+                    )
+                ).mappings()
+            ]
+            if not rows:
+                new_ids[table.name] = {}
+                continue
+            for fk in sharded_parents(table):
+                mapping = new_ids[fk.column.table.name]
+                for row in rows:
+                    row[fk.parent.name] = mapping[row[fk.parent.name]]
+            id_column = table.autoincrement_column
+            if id_column is None:
+                await target_conn.execute(insert(table), rows)
+                continue
+            old_ids = [row.pop(id_column.name) for row in rows]
+            ids = (
+                await target_conn.execute(
+                    insert(table).returning(id_column, sort_by_parameter_order=True),
+                    rows,
+                )
+            ).scalars().all()
+            new_ids[table.name] = dict(zip(old_ids, ids))
+
+    @staticmethod
+    async def delete_rows(conn, user_ids: list):
+        for table in reversed(sharded_tables()):
+            await conn.execute(delete(table).where(owned_by(table, user_ids)))
+
+    @staticmethod
+    async def bucket_users() -> dict[int, list]:
+        async with read_engine.connect() as conn:
+            ids = (await conn.execute(select(User.id).order_by(User.id))).scalars()
+            users: dict[int, list] = {}
+            for user_id in ids:
+                users.setdefault(user_bucket(user_id), []).append(user_id)
+        return users
+
+    @staticmethod
+    async def move_bucket(bucket: int, target: int, grace: float) -> int:
+        # returns the number of users moved
+        await shard_map.refresh(force=True)
+        source = shard_map.shard_for_bucket(bucket)
+        if source == target:
+            return 0
+        await ShardAdmin.set_bucket(bucket, source, moving=True)
+        # every process now refuses writes for the bucket
+        await asyncio.sleep(grace)
+        # read only now: a user who signed up before this point may have
+        # rows on the source; later ones can only write once the bucket
+        # has moved, so their rows go to the target
+        user_ids = (await ShardAdmin.bucket_users()).get(bucket, [])
+        try:
+            # an autocommit read, so the source keeps taking other buckets'
+            # writes; this bucket's are refused while it moves
+            source_engine = shard_map.engine(source, read_only=True)
+            async with source_engine.connect() as source_conn:
+                async with shard_map.engine(target).begin() as target_conn:
+                    for chunk in chunks(user_ids, MOVE_CHUNK_SIZE):
+                        await ShardAdmin.copy_rows(source_conn, target_conn, chunk)
+        except Exception:
+            await ShardAdmin.set_bucket(bucket, source, moving=False)
+            raise
+        await ShardAdmin.set_bucket(bucket, target, moving=False)
+        # processes still reading from the source have reloaded the map
+        await asyncio.sleep(grace)
+        async with shard_map.engine(source).begin() as conn:
+            for chunk in chunks(user_ids, MOVE_CHUNK_SIZE):
+                await ShardAdmin.delete_rows(conn, chunk)
+        return len(user_ids)
+
+
+class ShardAggregates:
+    """Cross-shard queries: run on every shard concurrently, then merged.
+
+    Users live on exactly one shard, so per-user rows never need merging.
+    While a move is between its copy and its source cleanup the bucket's
+    users exist on two shards; summed totals count them twice then, per-user
+    results do not.
+    """
+
+    @staticmethod
+    async def fan_out(query) -> list[tuple]:
+        async def run(shard):
+            async with ReadSessionLocal(info={"shard": shard}) as db:
+                return shard, (await db.execute(query)).all()
+
+        return await asyncio.gather(*(run(shard) for shard in shard_map.shard_ids()))
+
+    @staticmethod
+    async def shard_stats() -> dict:
+        query = select(
+            func.count(func.distinct(Expense.user_id)),
+            func.count(Expense.id),
+            func.coalesce(func.sum(Expense.amount), 0),
+        )
+        return {
+            shard: {"users": rows[0][0], "expenses": rows[0][1], "amount": rows[0][2]}
+            for shard, rows in await ShardAggregates.fan_out(query)
+        }
+
+    @staticmethod
+    async def category_totals(year: int, month: int) -> dict:
+        query = (
+            select(
+                MonthlyCategoryTotal.catagory,
+                func.sum(MonthlyCategoryTotal.total_amount),
+                func.sum(MonthlyCategoryTotal.expense_count),
+            )
+            .where(
+                MonthlyCategoryTotal.year == year,
+                MonthlyCategoryTotal.month == month,
+            )
+            .group_by(MonthlyCategoryTotal.catagory)
+        )
+        amounts, counts = Counter(), Counter()
+        for _, rows in await ShardAggregates.fan_out(query):
+            for catagory, amount, count in rows:
+                amounts[catagory.value] += amount
+                counts[catagory.value] += count
+        return {
+            catagory: {
+                "total_amount": amounts[catagory],
+                "expense_count": counts[catagory],
+            }
+            for catagory in sorted(amounts)
+        }
+
+    @staticmethod
+    async def top_spenders(year: int, month: int, limit: int) -> list[tuple]:
+        # every shard's own top `limit` contains its share of the overall top
+        total = func.sum(MonthlyCategoryTotal.total_amount)
+        query = (
+            select(MonthlyCategoryTotal.user_id, total)
+            .where(
+                MonthlyCategoryTotal.year == year,
+                MonthlyCategoryTotal.month == month,
+            )
+            .group_by(MonthlyCategoryTotal.user_id)
+            .order_by(total.desc())
+            .limit(limit)
+        )
+        candidates = [
+            (user_id, amount)
+            for shard, rows in await ShardAggregates.fan_out(query)
+            for user_id, amount in rows
+            # a moving bucket's copy on the target is not its owner's yet
+            if shard is None or shard_map.shard_of(user_id) == shard
+        ]
+        return heapq.nlargest(limit, candidates, key=lambda row: row[1])
+
+
+async def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("status")
+    # long enough for every process to reload the map and finish the
+    # requests it started with the old one
+    grace = settings.SHARD_MAP_REFRESH_SECONDS + 10
+    rebalance = commands.add_parser("rebalance")
+    rebalance.add_argument("--dry-run", action="store_true")
+    rebalance.add_argument("--grace", type=float, default=grace)
+    move = commands.add_parser("move")
+    move.add_argument("bucket", type=int)
+    move.add_argument("shard", type=int)
+    move.add_argument("--grace", type=float, default=grace)
+    move.set_defaults(dry_run=False)
+    totals = commands.add_parser("totals")
+    totals.add_argument("year", type=int)
+    totals.add_argument("month", type=int)
+    totals.add_argument("--top", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    await shard_map.refresh(force=True)
+    if args.command == "totals":
+        for catagory, row in (
+            await ShardAggregates.category_totals(args.year, args.month)
+        ).items():
+            print(
+                f"{catagory:<16} {row['total_amount']:>12} {row['expense_count']:>8}"
+            )
+        for user_id, amount in await ShardAggregates.top_spenders(
+            args.year, args.month, args.top
+        ):
+            print(f"user {user_id:<10} {amount:>12}")
+        return 0
+    if not shard_map.enabled:
+        print("sharding is not enabled; set SHARD_URLS")
+        return 1
+    if args.command == "status":
+        counts = Counter(shard_map.buckets.values())
+        for shard, stats in sorted((await ShardAggregates.shard_stats()).items()):
+            print(
+                f"shard {shard:>2}: {counts[shard]:>3} buckets, "
+                f"{stats['users']} users, {stats['expenses']} expenses"
+            )
+        if shard_map.moving:
+            print(f"moving: {sorted(shard_map.moving)}")
+        return 0
+
+    if args.command == "move":
+        if not 0 <= args.shard < len(shard_map.engines):
+            print(f"no shard {args.shard}")
+            return 1
+        moves = [(args.bucket, args.shard)]
+    else:
+        moves = ShardAdmin.plan_rebalance(shard_map.buckets, len(shard_map.engines))
+    users = await ShardAdmin.bucket_users() if args.dry_run else {}
+    for bucket, target in moves:
+        source = shard_map.shard_for_bucket(bucket)
+        if args.dry_run:
+            moved = len(users.get(bucket, []))
+        else:
+            moved = await ShardAdmin.move_bucket(bucket, target, args.grace)
+        print(f"bucket {bucket}: shard {source} -> {target} ({moved} users)")
+    print(f"{len(moves)} buckets {'to move' if args.dry_run else 'moved'}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
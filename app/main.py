@@ -1,14 +1,148 @@
+import asyncio
+import importlib.util
+from collections import defaultdict
+from sqlalchemy import delete, insert, inspect, text
 from fastapi import FastAPI
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, ORJSONResponse
 from fastapi.staticfiles import StaticFiles
 from pathlib import Path
 from .core.config import settings
-from .database import engine, Base
+from .core.metrics import MetricsMiddleware, instrument_engine, metrics_endpoint
+from .auth.models import UserBalance
+from .database import (
+    PRIMARY_SHARD,
+    engine,
+    read_engine,
+    read_pool_engine,
+    replica_engines,
+    shard_engines,
+    shard_map,
+    sharded_table_names,
+    Base,
+    AsyncSessionLocal,
+)
+from .expenses.coalescer import expense_writer
+from .expenses.models import BudgetPlan
+from .expenses.recurring import RecurringScheduler
+from .expenses.rollup import MonthlyRollup
+from .expenses.services import ExpensePlanner
+from .expenses.sharding import ShardAdmin
 from .base import api_router
 
 
+MIGRATE_CHUNK_SIZE = 500
+
+
+def existing_schema(sync_conn) -> tuple[set, set, set]:
+    inspector = inspect(sync_conn)
+    tables = set(inspector.get_table_names())
+    user_columns = (
+        {column["name"] for column in inspector.get_columns("user")}
+        if "user" in tables
+        else set()
+    )
+    plan_indexes = (
+        {index["name"] for index in inspector.get_indexes(BudgetPlan.__tablename__)}
+        if BudgetPlan.__tablename__ in tables
+        else set()
+    )
+    return tables, user_columns, plan_indexes
+
+
+async def upgrade_schema(conn):
+    # create_all skips columns and indexes on tables that already exist
+    tables, user_columns, plan_indexes = await conn.run_sync(existing_schema)
+    if "user" in tables and "token_version" not in user_columns:
+        await conn.execute(
+            text(
+                'ALTER TABLE "user" '
+                "ADD COLUMN token_version INTEGER NOT NULL DEFAULT 0"
+            )
+        )
+    if (
+        BudgetPlan.__tablename__ in tables
+        and "uq_budget_plans_user_month_category" not in plan_indexes
+    ):
+        await ExpensePlanner.drop_duplicate_plans(conn)
+    for table in Base.metadata.sorted_tables:
+        if table.name in tables:
+            for index in table.indexes:
+                await conn.run_sync(index.create, checkfirst=True)
+
+
+# balances were columns of "user" until they moved to the users' shards
+LEGACY_BALANCE_COLUMNS = ("total_income", "total_savings", "data_version")
+
+
+async def migrate_balances():
+    # copy the old columns into user_balances wherever each user's other rows
+    # live, then drop them; a rerun after an interruption replaces its copy
+    async with read_engine.connect() as conn:
+        _, user_columns, _ = await conn.run_sync(existing_schema)
+        columns = [c for c in LEGACY_BALANCE_COLUMNS if c in user_columns]
+        if not columns:
+            return
+        rows = (
+            await conn.execute(text(f'SELECT id, {", ".join(columns)} FROM "user"'))
+        ).mappings()
+        by_shard = defaultdict(list)
+        for row in rows:
+            shard = PRIMARY_SHARD
+            if shard_map.enabled:
+                shard = shard_map.shard_of(row["id"])
+            by_shard[shard].append(
+                {
+                    "user_id": row["id"],
+                    "total_income": row["total_income"] or 0,
+                    "total_savings": row["total_savings"] or 0,
+                    "data_version": row.get("data_version") or 0,
+                }
+            )
+    balances = UserBalance.__table__
+    for shard, shard_rows in by_shard.items():
+        async with shard_map.engine(shard).begin() as conn:
+            # buckets still on the primary keep their rows in its tables
+            await conn.run_sync(balances.create, checkfirst=True)
+            for start in range(0, len(shard_rows), MIGRATE_CHUNK_SIZE):
+                chunk = shard_rows[start : start + MIGRATE_CHUNK_SIZE]
+                await conn.execute(
+                    delete(balances).where(
+                        balances.c.user_id.in_([row["user_id"] for row in chunk])
+                    )
+                )
+                await conn.execute(insert(balances), chunk)
+    async with engine.begin() as conn:
+        for column in columns:
+            await conn.execute(text(f'ALTER TABLE "user" DROP COLUMN {column}'))
+
+
 async def init_models():
     async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+        if shard_map.enabled:
+            # per-user tables from before sharding stay, and keep serving
+            # the buckets not yet migrated off the primary
+            await conn.run_sync(
+                Base.metadata.create_all,
+                tables=[
+                    table
+                    for table in Base.metadata.sorted_tables
+                    if table.name not in sharded_table_names
+                ],
+            )
+            await ShardAdmin.init_buckets(conn)
+        else:
+            await conn.run_sync(Base.metadata.create_all)
+        await upgrade_schema(conn)
+    for shard_engine in shard_engines:
+        async with shard_engine.begin() as conn:
+            await conn.run_sync(ShardAdmin.create_tables)
+            await upgrade_schema(conn)
+    await shard_map.refresh(force=True)
+    await migrate_balances()
+    for shard in shard_map.shard_ids():
+        async with AsyncSessionLocal(info={"shard": shard}) as db:
+            await MonthlyRollup.backfill_if_empty(db)
 
 
 def include_router(app: FastAPI):
@@ -16,9 +150,26 @@ def include_router(app: FastAPI):
 
 
 def start_application() -> FastAPI:
-    app = FastAPI(title=settings.PROJECT_NAME, version=settings.PROJECT_VERSION)
+    if settings.FAST_JSON and importlib.util.find_spec("orjson") is None:
+        raise RuntimeError("FAST_JSON=true requires the orjson package")
+    app = FastAPI(
+        title=settings.PROJECT_NAME,
+        version=settings.PROJECT_VERSION,
+        default_response_class=ORJSONResponse if settings.FAST_JSON else JSONResponse,
+    )
     include_router(app)
 
+    if settings.GZIP_MIN_SIZE:
+        app.add_middleware(GZipMiddleware, minimum_size=settings.GZIP_MIN_SIZE)
+
+    if settings.METRICS_ENABLED:
+        # the same engine unless SQLite reads have their own pool
+        primary_engines = {engine, read_pool_engine}
+        for instrumented in (*primary_engines, *replica_engines, *shard_engines):
+            instrument_engine(instrumented)
+        app.add_middleware(MetricsMiddleware)
+        app.add_api_route("/metrics", metrics_endpoint, include_in_schema=False)
+
     # Mount static files (for optional custom JS/CSS)
     static_dir = Path(__file__).resolve().parent / "static"
     static_dir.mkdir(parents=True, exist_ok=True)
@@ -28,6 +179,21 @@ def start_application() -> FastAPI:
     @app.on_event("startup")
     async def on_startup():
         await init_models()
+        if settings.WRITE_COALESCING:
+            expense_writer.start()
+        if settings.RECURRING_ENABLED:
+            app.state.recurring_stop = asyncio.Event()
+            app.state.recurring_task = asyncio.create_task(
+                RecurringScheduler.run_forever(app.state.recurring_stop)
+            )
+
+    @app.on_event("shutdown")
+    async def on_shutdown():
+        task = getattr(app.state, "recurring_task", None)
+        if task is not None:
+            app.state.recurring_stop.set()
+            await task
+        await expense_writer.stop()
 
     return app
 
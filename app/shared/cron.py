@@ -0,0 +1,84 @@
+"""Minimal five-field cron expressions (minute hour day-of-month month
+day-of-week) for recurring rules.
+
+Supports ``*``, numbers, ``a-b`` ranges, ``,`` lists and ``/step``. Day of
+week is 0-6 with 0 = Sunday (7 is accepted as Sunday too). As in classic
+cron, when both day fields are restricted a day matching either one fires.
+"""
+from datetime import datetime, timedelta
+
+FIELDS = (
+    ("minute", 0, 59),
+    ("hour", 0, 23),
+    ("day", 1, 31),
+    ("month", 1, 12),
+    ("weekday", 0, 7),
+)
+# how far ahead next_after looks before deciding an expression never fires
+MAX_LOOKAHEAD_DAYS = 366 * 5
+
+
+def _parse_field(text: str, low: int, high: int) -> set[int]:
+    values = set()
+    for part in text.split(","):
+        step = 1
+        if "/" in part:
+            part, step_text = part.split("/", 1)
+            step = int(step_text)
+            if step < 1:
+                raise ValueError(f"invalid step in {text!r}")
+        if part == "*":
+            start, end = low, high
+        elif "-" in part:
+            start, end = (int(v) for v in part.split("-", 1))
+        else:
+            start = int(part)
+            end = high if step > 1 else start
+        if not low <= start <= end <= high:
+            raise ValueError(f"{text!r} is outside {low}-{high}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class CronSchedule:
+    def __init__(self, expression: str):
+        parts = expression.split()
+        if len(parts) != len(FIELDS):
+            raise ValueError("cron expressions need 5 fields")
+        try:
+            parsed = [
+                _parse_field(part, low, high)
+                for part, (_, low, high) in zip(parts, FIELDS)
+            ]
+        except ValueError as e:
+            raise ValueError(f"invalid cron expression {expression!r}: {e}") from e
+        self.minutes, self.hours, self.days, self.months, weekdays = parsed
+        self.minutes = sorted(self.minutes)
+        self.hours = sorted(self.hours)
+        # cron counts Sunday as 0 (or 7), Python's weekday() as 6
+        self.weekdays = {(d - 1) % 7 for d in weekdays}
+        self.any_day = parts[2] == "*"
+        self.any_weekday = parts[4] == "*"
+
+    def _day_matches(self, day: datetime) -> bool:
+        if day.month not in self.months:
+            return False
+        in_days = day.day in self.days
+        in_weekdays = day.weekday() in self.weekdays
+        if self.any_day or self.any_weekday:
+            return in_days and in_weekdays
+        return in_days or in_weekdays
+
+    def next_after(self, after: datetime) -> datetime:
+        """First matching minute strictly after `after`."""
+        after = after.replace(second=0, microsecond=0)
+        day = after.replace(hour=0, minute=0)
+        for _ in range(MAX_LOOKAHEAD_DAYS):
+            if self._day_matches(day):
+                for hour in self.hours:
+                    for minute in self.minutes:
+                        candidate = day.replace(hour=hour, minute=minute)
+                        if candidate > after:
+                            return candidate
+            day += timedelta(days=1)
+        raise ValueError("cron expression never fires")
@@ -0,0 +1,78 @@
+import base64
+from datetime import date, datetime, timedelta
+from fastapi import HTTPException, status
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+def validate_month(month: int):
+    if not 1 <= month <= 12:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Month must be between 1 and 12",
+        )
+
+
+def month_range(year: int, month: int) -> tuple[datetime, datetime]:
+    # half-open [start, end) bounds so created_at can be served by an index
+    validate_month(month)
+    start = datetime(year, month, 1)
+    if month == 12:
+        end = datetime(year + 1, 1, 1)
+    else:
+        end = datetime(year, month + 1, 1)
+    return start, end
+
+
+def dialect_insert(db: AsyncSession):
+    # insert() with on_conflict_do_update for the backends we ship drivers for
+    if db.get_bind().dialect.name == "postgresql":
+        return postgresql.insert
+    return sqlite.insert
+
+
+def encode_cursor(created_at: datetime, id: int) -> str:
+    raw = f"{created_at.isoformat()}|{id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        created_at, id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), int(id)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor"
+        )
+
+
+def bucket_label(column, bucket: str, dialect_name: str):
+    # SQL expression labelling a timestamp with its day/week bucket, matching
+    # the labels bucket_periods() produces (weeks start on Monday)
+    if dialect_name == "postgresql":
+        trunc = func.date_trunc(bucket, column)
+        return func.to_char(trunc, "YYYY-MM-DD")
+    if bucket == "week":
+        return func.date(column, "weekday 0", "-6 days")
+    return func.strftime("%Y-%m-%d", column)
+
+
+def bucket_periods(start: date, end: date, bucket: str) -> list[str]:
+    """Labels of every bucket overlapping [start, end), oldest first."""
+    periods = []
+    if bucket in ("day", "week"):
+        step = timedelta(days=1 if bucket == "day" else 7)
+        current = start if bucket == "day" else start - timedelta(days=start.weekday())
+        while current < end:
+            periods.append(current.isoformat())
+            current += step
+    elif bucket == "month":
+        year, month = start.year, start.month
+        while date(year, month, 1) < end:
+            periods.append(f"{year:04d}-{month:02d}")
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    else:
+        for year in range(start.year, end.year + (end > date(end.year, 1, 1))):
+            periods.append(f"{year:04d}")
+    return periods
@@ -0,0 +1,13 @@
+"""Benchmarks run against a throwaway database.
+
+Set BENCH_DATABASE_URL to benchmark an existing database such as a local
+PostgreSQL instance; otherwise a temporary SQLite file is used. Run them
+from the repository root, e.g. ``python -m benchmarks.monthly_report_scan``.
+"""
+import os
+import tempfile
+
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ["DATABASE_URL"] = os.getenv("BENCH_DATABASE_URL") or (
+    f"sqlite+aiosqlite:///{tempfile.mktemp(prefix='bench-', suffix='.db')}"
+)
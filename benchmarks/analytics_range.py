@@ -0,0 +1,59 @@
+"""Time a 5-year trend: one analytics call per bucket size vs one
+monthly_report call per month.
+
+Seeds one user with BENCH_EXPENSES expenses over five years and rebuilds the
+monthly rollup before timing.
+"""
+import asyncio
+import os
+import time
+from datetime import date
+
+from app.auth.models import User
+from app.database import AsyncSessionLocal, engine
+from app.expenses.rollup import MonthlyRollup
+from app.expenses.schemas import Bucket
+from app.expenses.services import ExpenseManagement
+from .seed import seed
+
+EXPENSES = int(os.getenv("BENCH_EXPENSES", "200000"))
+START, END = date(2020, 1, 1), date(2025, 1, 1)
+
+
+async def timed(label: str, coro_factory, repeat: int = 5):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        await coro_factory()
+    ms = (time.perf_counter() - start) / repeat * 1000
+    print(f"{label:>28}: {ms:8.2f} ms")
+
+
+async def main():
+    async with engine.begin() as conn:
+        print(f"seeding {EXPENSES} expenses over 5 years on {conn.dialect.name}")
+        await seed(conn, users=1, expenses=EXPENSES, years=5)
+
+    async with AsyncSessionLocal() as db:
+        await MonthlyRollup.rebuild(db)
+        user = await db.get(User, 1)
+
+        async def per_month_reports():
+            for year in range(START.year, END.year):
+                for month in range(1, 13):
+                    await ExpenseManagement.monthly_report(
+                        year=year, month=month, db=db, current_user=user
+                    )
+
+        await timed("60 x monthly_report", per_month_reports)
+        for bucket in Bucket:
+            await timed(
+                f"analytics bucket={bucket.value}",
+                lambda: ExpenseManagement.analytics(
+                    start=START, end=END, bucket=bucket, db=db, current_user=user
+                ),
+            )
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
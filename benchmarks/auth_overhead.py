@@ -0,0 +1,107 @@
+"""Measure what authentication adds to each request.
+
+Times token verification on its own (jose.jwt.decode against the HMAC fast
+path), then GET /expense/monthly end to end with each identity dependency:
+no auth at all (the baseline), claim-only, and the full User load with a warm
+and a cold user cache. The overhead column is the p50 difference from the
+baseline.
+"""
+import asyncio
+import os
+import statistics
+import time
+
+import httpx
+from fastapi import HTTPException, status
+from jose import jwt
+
+from app.auth.route_user import (
+    TokenUser,
+    get_current_reader,
+    get_reader_identity,
+    get_token_reader,
+)
+from app.core.config import settings
+from app.core.jwt_handler import TokenGenerator
+from app.core.user_cache import user_cache
+from app.database import engine
+from app.main import app
+from .seed import seed
+
+REQUESTS = int(os.getenv("BENCH_REQUESTS", "2000"))
+DECODES = int(os.getenv("BENCH_DECODES", "50000"))
+
+
+def per_call_us(fn, number: int) -> float:
+    start = time.perf_counter()
+    for _ in range(number):
+        fn()
+    return (time.perf_counter() - start) / number * 1e6
+
+
+async def no_auth():
+    return TokenUser(id=1)
+
+
+async def teapot():
+    raise HTTPException(status_code=status.HTTP_418_IM_A_TEAPOT)
+
+
+async def timed_requests(client: httpx.AsyncClient, headers: dict, cold: bool):
+    samples = []
+    for _ in range(REQUESTS):
+        if cold:
+            user_cache.clear()
+        start = time.perf_counter()
+        r = await client.get("/expense/monthly/2022/6", headers=headers)
+        samples.append((time.perf_counter() - start) * 1e6)
+        assert r.status_code == 200, r.text
+    return statistics.median(samples)
+
+
+async def main():
+    async with engine.begin() as conn:
+        await seed(conn, users=1, expenses=1000)
+    token = TokenGenerator.create_token(
+        {"sub": "bench1@example.com", "uid": 1, "ver": 0}
+    )
+    headers = {"Authorization": f"Bearer {token}"}
+
+    jose_us = per_call_us(
+        lambda: jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM]),
+        DECODES,
+    )
+    fast_us = per_call_us(lambda: TokenGenerator.verify_token(token), DECODES)
+    print(f"token verification ({settings.ALGORITHM}), per call:")
+    print(f"  jose.jwt.decode   {jose_us:8.1f} us")
+    print(f"  verify_token      {fast_us:8.1f} us")
+
+    modes = [
+        ("no auth (baseline)", no_auth, False),
+        ("claim-only", get_token_reader, False),
+        ("User load, warm cache", get_current_reader, False),
+        ("User load, cold cache", get_current_reader, True),
+    ]
+    transport = httpx.ASGITransport(app=app)
+    results = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        # an override the route does not use would time the same code each time
+        app.dependency_overrides[get_reader_identity] = teapot
+        r = await client.get("/expense/monthly/2022/6", headers=headers)
+        assert r.status_code == status.HTTP_418_IM_A_TEAPOT, r.status_code
+        for label, dependency, cold in modes:
+            # the monthly report resolves its caller through get_reader_identity
+            app.dependency_overrides[get_reader_identity] = dependency
+            await timed_requests(client, headers, cold)  # warm up
+            results.append((label, await timed_requests(client, headers, cold)))
+    app.dependency_overrides.clear()
+    await engine.dispose()
+
+    baseline = results[0][1]
+    print(f"GET /expense/monthly, p50 of {REQUESTS} requests:")
+    for label, p50 in results:
+        print(f"  {label:<22} {p50:8.1f} us   overhead {p50 - baseline:+8.1f} us")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,78 @@
+"""Fire hundreds of concurrent balance writes for one user and check the totals.
+
+Exits non-zero if the final balances are not exactly what the accepted
+requests add up to (lost updates) or if any balance was overdrawn. On SQLite
+some requests may fail with "database is locked"; those are rolled back and
+only the accepted ones are counted.
+"""
+import asyncio
+import os
+import sys
+from collections import Counter
+
+import httpx
+
+from app.core.hashing import Hasher
+from app.database import engine
+from app.main import app
+from .seed import seed
+
+REQUESTS = int(os.getenv("BENCH_REQUESTS", "300"))
+INCOME = 1000
+AMOUNT = 5
+
+
+async def run(requests: int = REQUESTS, income: int = INCOME) -> bool:
+    async with engine.begin() as conn:
+        await seed(conn, users=1, expenses=0, password=Hasher.hash_password("pass"))
+
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        token = (
+            await client.post(
+                "/login", data={"username": "bench1@example.com", "password": "pass"}
+            )
+        ).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+
+        # concurrent deposits must all land
+        deposits = await asyncio.gather(
+            *(
+                client.put("/income/", json={"amount": 1}, headers=headers)
+                for _ in range(income)
+            )
+        )
+        # more expenses than the income covers; none may overdraw it
+        expenses = await asyncio.gather(
+            *(
+                client.post(
+                    "/expense/",
+                    json={"amount": AMOUNT, "source": "income", "catagory": "Food"},
+                    headers=headers,
+                )
+                for _ in range(requests)
+            )
+        )
+        me = (await client.get("/me", headers=headers)).json()
+
+    deposited = sum(r.status_code == 201 for r in deposits)
+    spent = sum(r.status_code == 201 for r in expenses) * AMOUNT
+    expected = deposited - spent
+    print(f"deposits: {dict(Counter(r.status_code for r in deposits))}")
+    print(f"expenses: {dict(Counter(r.status_code for r in expenses))}")
+    print(f"total_income={me['total_income']} expected={expected}")
+    await engine.dispose()
+
+    ok = me["total_income"] == expected and me["total_income"] >= 0
+    if all(r.status_code != 500 for r in deposits + expenses):
+        ok = ok and spent == min(requests * AMOUNT, deposited)
+    print("ok" if ok else "FAILED")
+    return ok
+
+
+async def main():
+    return 0 if await run() else 1
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,69 @@
+"""Stream a large expense export and check that RSS stays flat.
+
+Seeds one user with BENCH_EXPENSES rows (1M by default), drains
+ExpenseManagement.export_expenses for each format and fails if resident
+memory grows by more than BENCH_RSS_CEILING_MB while streaming, after one
+unmeasured pass that warms the database connection's page cache.
+"""
+import asyncio
+import os
+import sys
+import time
+
+from app.database import engine, read_pool_engine
+from app.expenses.schemas import ExportFormat
+from app.expenses.services import ExpenseManagement
+from .seed import seed
+
+EXPENSES = int(os.getenv("BENCH_EXPENSES", "1000000"))
+RSS_CEILING_MB = float(os.getenv("BENCH_RSS_CEILING_MB", "64"))
+
+
+def rss_mb() -> float:
+    with open("/proc/self/statm") as f:
+        pages = int(f.read().split()[1])
+    return pages * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+async def drain(format: ExportFormat):
+    baseline = peak = rss_mb()
+    size = 0
+    start = time.perf_counter()
+    async for chunk in ExpenseManagement.export_expenses(format=format, user_id=1):
+        size += len(chunk)
+        peak = max(peak, rss_mb())
+    elapsed = time.perf_counter() - start
+    return size, elapsed, peak - baseline
+
+
+async def run(
+    expenses: int = EXPENSES, ceiling_mb: float = RSS_CEILING_MB
+) -> bool:
+    async with engine.begin() as conn:
+        print(f"seeding {expenses} expenses on {conn.dialect.name}")
+        await seed(conn, users=1, expenses=expenses)
+
+    # exports read through their own pool; fill its connection's SQLite page
+    # cache (bounded by SQLITE_CACHE_SIZE_KB) before measuring
+    await drain(ExportFormat.CSV)
+    failed = False
+    for format in ExportFormat:
+        size, elapsed, growth = await drain(format)
+        ok = growth <= ceiling_mb
+        failed |= not ok
+        print(
+            f"[{format.value}] {size / 2**20:.1f} MB in {elapsed:.1f}s, "
+            f"RSS growth {growth:.1f} MB (ceiling {ceiling_mb:.0f} MB) "
+            f"{'ok' if ok else 'FAILED'}"
+        )
+    for disposed in {engine, read_pool_engine}:
+        await disposed.dispose()
+    return not failed
+
+
+async def main():
+    return 0 if await run() else 1
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
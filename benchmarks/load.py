@@ -0,0 +1,289 @@
+"""Drive a realistic request mix through the whole API and record latencies.
+
+Seeds BENCH_USERS users x BENCH_EXPENSES expenses (plus a budget plan for
+every seeded month), then runs BENCH_REQUESTS requests from
+BENCH_CONCURRENCY virtual users against app.main.app over httpx's
+ASGITransport, so no server or network is involved. Operations are drawn
+from a weighted mix with a fixed seed, so two runs issue the same requests.
+
+    python -m benchmarks.load --mix read --output results/read.json
+    python -m benchmarks.load --mix read --baseline results/read.json
+
+Results are written as JSON. With --baseline, p95 latency and throughput are
+compared against an earlier result, and the exit status is 1 if anything
+regressed by more than --tolerance. Signup and login pay the full bcrypt
+cost; lower BCRYPT_ROUNDS to keep them from dominating a mix.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+from itertools import count
+
+import httpx
+from sqlalchemy import insert
+
+from app.core.config import settings
+from app.core.hashing import Hasher
+from app.database import AsyncSessionLocal, engine
+from app.expenses.models import BudgetPlan
+from app.expenses.rollup import MonthlyRollup
+from app.expenses.schemas import Catagory
+from app.main import app
+from .seed import seed
+
+USERS = int(os.getenv("BENCH_USERS", "20"))
+EXPENSES = int(os.getenv("BENCH_EXPENSES", "2000"))
+REQUESTS = int(os.getenv("BENCH_REQUESTS", "2000"))
+CONCURRENCY = int(os.getenv("BENCH_CONCURRENCY", "10"))
+SEED = int(os.getenv("BENCH_SEED", "1"))
+YEARS = 5
+PASSWORD = "benchpass"
+
+MIXES = {
+    "read": {
+        "list": 45, "monthly_report": 20, "budget_vs_actual": 20,
+        "add_expense": 10, "login": 5,
+    },
+    "write": {
+        "add_expense": 60, "list": 20, "monthly_report": 10,
+        "budget_vs_actual": 5, "login": 5,
+    },
+    "mixed": {
+        "signup": 2, "login": 8, "add_expense": 25, "list": 35,
+        "monthly_report": 15, "budget_vs_actual": 15,
+    },
+}
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def seeded_month(rng: random.Random) -> tuple[int, int]:
+    return rng.randrange(2020, 2020 + YEARS), rng.randint(1, 12)
+
+
+class VirtualUser:
+    signups = count(1)
+
+    def __init__(self, client: httpx.AsyncClient, user: int, rng: random.Random):
+        self.client = client
+        self.email = f"bench{user}@example.com"
+        self.rng = rng
+        self.headers = {}
+
+    async def login(self):
+        r = await self.client.post(
+            "/login", data={"username": self.email, "password": PASSWORD}
+        )
+        if r.status_code == 200:
+            self.headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+        return r
+
+    async def signup(self):
+        n = next(self.signups)
+        return await self.client.post(
+            "/signup",
+            json={
+                "email": f"load{SEED}-{n}@example.com",
+                "username": f"load{n}",
+                "password": PASSWORD,
+            },
+        )
+
+    async def add_expense(self):
+        return await self.client.post(
+            "/expense/",
+            json={
+                "amount": self.rng.randint(1, 50),
+                "source": "income",
+                "catagory": self.rng.choice(list(Catagory)).value,
+            },
+            headers=self.headers,
+        )
+
+    async def list(self):
+        return await self.client.get("/expense/", headers=self.headers)
+
+    async def monthly_report(self):
+        year, month = seeded_month(self.rng)
+        return await self.client.get(
+            f"/expense/monthly/{year}/{month}", headers=self.headers
+        )
+
+    async def budget_vs_actual(self):
+        year, month = seeded_month(self.rng)
+        return await self.client.get(
+            f"/budget-vs-actual/{year}/{month}", headers=self.headers
+        )
+
+
+async def prepare():
+    password = Hasher.hash_password(PASSWORD)
+    async with engine.begin() as conn:
+        await seed(conn, users=USERS, expenses=EXPENSES, years=YEARS, password=password)
+        plans = [
+            {
+                "user_id": user,
+                "year": year,
+                "month": month,
+                "category": category,
+                "planned_amount": 1000,
+            }
+            for user in range(1, USERS + 1)
+            for year in range(2020, 2020 + YEARS)
+            for month in range(1, 13)
+            for category in (Catagory.FOOD, Catagory.TRANSPORT, Catagory.UTILITIES)
+        ]
+        await conn.execute(insert(BudgetPlan), plans)
+        dialect = conn.dialect.name
+    async with AsyncSessionLocal() as db:
+        await MonthlyRollup.rebuild(db)
+    return dialect
+
+
+async def run(mix: dict) -> tuple[dict, float]:
+    samples = {name: [] for name in mix}
+    errors = {name: 0 for name in mix}
+    names, weights = list(mix), list(mix.values())
+    plan_rng = random.Random(SEED)
+    plan = plan_rng.choices(names, weights=weights, k=REQUESTS)
+    queue = iter(plan)
+
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        users = [
+            VirtualUser(client, i % USERS + 1, random.Random(SEED + i))
+            for i in range(CONCURRENCY)
+        ]
+        for user in users:
+            await user.login()
+            # income for the expense writes to draw from
+            await client.put(
+                "/income/", json={"amount": 10_000_000}, headers=user.headers
+            )
+
+        async def worker(user: VirtualUser):
+            for name in queue:
+                start = time.perf_counter()
+                r = await getattr(user, name)()
+                samples[name].append((time.perf_counter() - start) * 1000)
+                if r.status_code >= 400:
+                    errors[name] += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(user) for user in users))
+        elapsed = time.perf_counter() - start
+
+    results = {}
+    for name, values in samples.items():
+        if not values:
+            continue
+        results[name] = {
+            "count": len(values),
+            "errors": errors[name],
+            "mean_ms": round(statistics.fmean(values), 3),
+            "p50_ms": round(percentile(values, 50), 3),
+            "p95_ms": round(percentile(values, 95), 3),
+            "p99_ms": round(percentile(values, 99), 3),
+        }
+    return results, elapsed
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> list[str]:
+    regressions = []
+    base_rps = baseline["throughput_rps"]
+    if current["throughput_rps"] < base_rps * (1 - tolerance):
+        regressions.append(
+            f"throughput {base_rps:.1f} -> {current['throughput_rps']:.1f} req/s"
+        )
+    for name, stats in current["operations"].items():
+        before = baseline["operations"].get(name)
+        if before and stats["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            regressions.append(
+                f"{name} p95 {before['p95_ms']:.1f} -> {stats['p95_ms']:.1f} ms"
+            )
+    return regressions
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mix", choices=MIXES, default="mixed")
+    parser.add_argument("--output", help="write results JSON here")
+    parser.add_argument("--baseline", help="earlier results JSON to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.10)
+    args = parser.parse_args()
+
+    dialect = await prepare()
+    print(
+        f"{args.mix} mix: {REQUESTS} requests, concurrency {CONCURRENCY}, "
+        f"{USERS} users x {EXPENSES} expenses on {dialect}"
+    )
+    operations, elapsed = await run(MIXES[args.mix])
+    await engine.dispose()
+
+    result = {
+        "mix": args.mix,
+        "timestamp": datetime.utcnow().isoformat(timespec="seconds"),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "dialect": dialect,
+        "users": USERS,
+        "expenses_per_user": EXPENSES,
+        "requests": REQUESTS,
+        "concurrency": CONCURRENCY,
+        "seed": SEED,
+        "bcrypt_rounds": settings.BCRYPT_ROUNDS,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(REQUESTS / elapsed, 1),
+        "operations": operations,
+    }
+
+    print(f"{result['throughput_rps']} req/s over {elapsed:.1f}s")
+    for name, stats in operations.items():
+        print(
+            f"  {name:>16}: n={stats['count']:<5} err={stats['errors']:<3} "
+            f"p50={stats['p50_ms']:.1f} p95={stats['p95_ms']:.1f} "
+            f"p99={stats['p99_ms']:.1f} ms"
+        )
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(result, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            return 1
+        print(f"no regressions beyond {args.tolerance:.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
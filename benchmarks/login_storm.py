@@ -0,0 +1,107 @@
+"""Measure GET /expense/ latency while a burst of logins hashes passwords.
+
+Run it once with the default worker pool and once with HASH_WORKERS=0
+(bcrypt inline on the event loop) to compare:
+
+    python -m benchmarks.login_storm
+    HASH_WORKERS=0 python -m benchmarks.login_storm
+"""
+import asyncio
+import os
+import statistics
+import time
+
+import httpx
+
+from app.core.config import settings
+from app.core.hashing import Hasher
+from app.database import engine
+from app.main import app
+from .seed import seed
+
+USERS = int(os.getenv("BENCH_USERS", "50"))
+LOGINS = int(os.getenv("BENCH_LOGINS", "200"))
+CONCURRENCY = int(os.getenv("BENCH_CONCURRENCY", "20"))
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def login(client: httpx.AsyncClient, user: int) -> int:
+    r = await client.post(
+        "/login", data={"username": f"bench{user}@example.com", "password": "pass"}
+    )
+    return r.status_code
+
+
+async def probe(client: httpx.AsyncClient, headers: dict, stop: asyncio.Event):
+    samples = []
+    while not stop.is_set():
+        start = time.perf_counter()
+        await client.get("/expense/", headers=headers)
+        samples.append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(0.005)
+    return samples
+
+
+async def storm(client: httpx.AsyncClient) -> dict:
+    limit = asyncio.Semaphore(CONCURRENCY)
+    statuses: dict[int, int] = {}
+
+    async def one(i: int):
+        async with limit:
+            code = await login(client, i % USERS + 1)
+            statuses[code] = statuses.get(code, 0) + 1
+
+    await asyncio.gather(*(one(i) for i in range(LOGINS)))
+    return statuses
+
+
+def summary(label: str, samples: list[float]):
+    print(
+        f"{label:>8}: n={len(samples)} p50={statistics.median(samples):.1f}ms "
+        f"p99={percentile(samples, 99):.1f}ms max={max(samples):.1f}ms"
+    )
+
+
+async def main():
+    password = Hasher.hash_password("pass")
+    async with engine.begin() as conn:
+        await seed(conn, users=USERS, expenses=200, password=password)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        token = (
+            await client.post(
+                "/login", data={"username": "bench1@example.com", "password": "pass"}
+            )
+        ).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+
+        stop = asyncio.Event()
+        idle = asyncio.create_task(probe(client, headers, stop))
+        await asyncio.sleep(1)
+        stop.set()
+        idle_samples = await idle
+
+        stop = asyncio.Event()
+        busy = asyncio.create_task(probe(client, headers, stop))
+        start = time.perf_counter()
+        statuses = await storm(client)
+        elapsed = time.perf_counter() - start
+        stop.set()
+        busy_samples = await busy
+
+    print(
+        f"executor={settings.HASH_EXECUTOR} workers={settings.HASH_WORKERS} "
+        f"rounds={settings.BCRYPT_ROUNDS}: {LOGINS} logins in {elapsed:.1f}s {statuses}"
+    )
+    summary("idle", idle_samples)
+    summary("storm", busy_samples)
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,68 @@
+"""Compare the old extract() month filter with the created_at range filter.
+
+Seeds BENCH_USERS users with BENCH_EXPENSES expenses each, prints the query
+plan for both predicates and times the month report query.
+"""
+import asyncio
+import os
+import time
+
+from sqlalchemy import extract, select
+
+from app.database import engine
+from app.expenses.models import Expense
+from app.shared.utils import month_range
+from .seed import seed
+
+USERS = int(os.getenv("BENCH_USERS", "2"))
+EXPENSES = int(os.getenv("BENCH_EXPENSES", "100000"))
+YEAR, MONTH = 2024, 6
+
+
+def statements():
+    start, end = month_range(YEAR, MONTH)
+    old = select(Expense).where(
+        Expense.user_id == 1,
+        extract("year", Expense.created_at) == YEAR,
+        extract("month", Expense.created_at) == MONTH,
+    )
+    new = select(Expense).where(
+        Expense.user_id == 1,
+        Expense.created_at >= start,
+        Expense.created_at < end,
+    )
+    return {"extract": old, "range": new}
+
+
+async def explain(conn, stmt):
+    sql = str(
+        stmt.compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True})
+    )
+    prefix = "EXPLAIN QUERY PLAN " if conn.dialect.name == "sqlite" else "EXPLAIN "
+    result = await conn.exec_driver_sql(prefix + sql)
+    return [" ".join(str(col) for col in row) for row in result]
+
+
+async def timed(conn, stmt, repeat=20):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        rows = (await conn.execute(stmt)).all()
+    return (time.perf_counter() - start) / repeat * 1000, len(rows)
+
+
+async def main():
+    async with engine.begin() as conn:
+        print(f"seeding {USERS} users x {EXPENSES} expenses on {conn.dialect.name}")
+        await seed(conn, USERS, EXPENSES)
+    async with engine.connect() as conn:
+        for name, stmt in statements().items():
+            plan = await explain(conn, stmt)
+            ms, count = await timed(conn, stmt)
+            print(f"\n[{name}] {ms:.2f} ms/query, {count} rows")
+            for line in plan:
+                print(f"  {line}")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
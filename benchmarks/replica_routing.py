@@ -0,0 +1,116 @@
+"""Check that reads go to the replicas and a writer's next reads to the primary.
+
+By default two extra SQLite files act as replicas. Set BENCH_REPLICA_URLS
+(comma separated) to use e.g. two local PostgreSQL instances instead. The
+primary and every replica are seeded with the same data, and nothing
+replicates between them, so a write is only ever visible on the primary.
+That makes the routing observable:
+
+- report polls are spread round-robin over the replicas;
+- right after POST /expense/ the same user's list comes from the primary
+  and contains the new expense;
+- once REPLICA_STICKY_SECONDS have passed, the user reads from a replica
+  again.
+
+Exits 1 if any of these does not hold.
+"""
+import asyncio
+import os
+import random
+import sys
+import tempfile
+from collections import Counter
+
+# must be set before app.core.config is imported
+os.environ["DATABASE_REPLICA_URLS"] = os.getenv("BENCH_REPLICA_URLS") or ",".join(
+    f"sqlite+aiosqlite:///{tempfile.mktemp(prefix='bench-replica-', suffix='.db')}"
+    for _ in range(2)
+)
+os.environ.setdefault("REPLICA_STICKY_SECONDS", "1")
+
+import httpx  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+
+from app.core.config import settings  # noqa: E402
+from app.core.hashing import Hasher  # noqa: E402
+from app.database import engine, read_pool_engine, replica_engines  # noqa: E402
+from app.main import app  # noqa: E402
+from .seed import seed  # noqa: E402
+
+POLLS = 20
+
+
+def count_statements(engines: dict) -> Counter:
+    counts = Counter()
+    for name, counted in engines.items():
+        for sync_engine in {e.sync_engine for e in counted}:
+
+            @event.listens_for(sync_engine, "after_cursor_execute")
+            def after_cursor_execute(*args, name=name):
+                counts[name] += 1
+
+    return counts
+
+
+async def main():
+    password = Hasher.hash_password("pass")
+    for seeded in (engine, *replica_engines):
+        random.seed(0)
+        async with seeded.begin() as conn:
+            await seed(conn, users=1, expenses=500, password=password)
+
+    # primary reads go through its own pool with SQLite
+    engines = {"primary": (engine, read_pool_engine)}
+    engines.update({f"replica{i}": (e,) for i, e in enumerate(replica_engines, 1)})
+    counts = count_statements(engines)
+    failures = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        r = await client.post(
+            "/login", data={"username": "bench1@example.com", "password": "pass"}
+        )
+        headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+        await client.get("/me", headers=headers)  # warm the user cache
+
+        counts.clear()
+        for _ in range(POLLS):
+            r = await client.get("/expense/monthly/2022/6", headers=headers)
+            assert r.status_code == 200, r.text
+        print(f"{POLLS} report polls: {dict(counts)}")
+        if counts["primary"]:
+            failures.append("report polls reached the primary")
+        if len({counts[name] for name in engines if name != "primary"}) != 1:
+            failures.append("report polls were not spread evenly over the replicas")
+
+        await client.put("/income/", json={"amount": 100}, headers=headers)
+        r = await client.post(
+            "/expense/",
+            json={"amount": 5, "source": "income", "catagory": "Food"},
+            headers=headers,
+        )
+        expense_id = r.json()["id"]
+
+        counts.clear()
+        r = await client.get("/expense/?limit=5", headers=headers)
+        seen = any(item["id"] == expense_id for item in r.json()["items"])
+        print(f"list right after the write: {dict(counts)}, new expense seen={seen}")
+        if not counts["primary"] or not seen:
+            failures.append("the writer's next read did not come from the primary")
+
+        await asyncio.sleep(settings.REPLICA_STICKY_SECONDS + 0.1)
+        counts.clear()
+        r = await client.get("/expense/?limit=5", headers=headers)
+        seen = any(item["id"] == expense_id for item in r.json()["items"])
+        print(f"list after the sticky window: {dict(counts)}, new expense seen={seen}")
+        if counts["primary"]:
+            failures.append("reads stayed on the primary after the sticky window")
+
+    for disposed in {engine, read_pool_engine, *replica_engines}:
+        await disposed.dispose()
+    for failure in failures:
+        print(f"FAIL {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
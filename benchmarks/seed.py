@@ -0,0 +1,43 @@
+import random
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+
+from app.auth.models import User
+from app.database import Base
+from app.expenses.models import Expense
+from app.expenses.schemas import Catagory
+
+CHUNK = 10_000
+
+
+async def seed(conn, users: int, expenses: int, years: int = 5, password="x"):
+    """Recreate the schema and insert users x expenses spread over `years`."""
+    await conn.run_sync(Base.metadata.drop_all)
+    await conn.run_sync(Base.metadata.create_all)
+    await conn.execute(
+        insert(User),
+        [
+            {
+                "email": f"bench{i}@example.com",
+                "username": f"bench{i}",
+                "password": password,
+            }
+            for i in range(1, users + 1)
+        ],
+    )
+    categories = list(Catagory)
+    origin = datetime(2020, 1, 1)
+    span = int(timedelta(days=years * 365).total_seconds())
+    for user_id in range(1, users + 1):
+        for offset in range(0, expenses, CHUNK):
+            rows = [
+                {
+                    "user_id": user_id,
+                    "amount": random.randint(1, 500),
+                    "catagory": random.choice(categories),
+                    "created_at": origin + timedelta(seconds=random.randrange(span)),
+                }
+                for _ in range(min(CHUNK, expenses - offset))
+            ]
+            await conn.execute(insert(Expense), rows)
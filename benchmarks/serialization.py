@@ -0,0 +1,83 @@
+"""Time response serialization for expense pages, per 10k rows.
+
+Compares the old list path (ORM entities, FastAPI-style per-row validation,
+jsonable_encoder and json.dumps) with the current one (column rows validated
+and encoded in one TypeAdapter pass), and json vs orjson for the dict-shaped
+report responses. Serialization only; the query runs once up front.
+"""
+import asyncio
+import json
+import os
+import time
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import engine
+from app.expenses.models import Expense
+from app.expenses.route_expenses import expense_page_adapter
+from app.expenses.schemas import ExpenseShow
+from .seed import seed
+
+ROWS = int(os.getenv("BENCH_ROWS", "10000"))
+REPEAT = int(os.getenv("BENCH_REPEAT", "5"))
+
+
+def best_of(fn) -> float:
+    timings = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 10_000 / ROWS * 1000
+
+
+def per_row_encoder(entities):
+    items = [ExpenseShow.model_validate(e, from_attributes=True) for e in entities]
+    return json.dumps(jsonable_encoder({"items": items, "next_cursor": None})).encode()
+
+
+def bulk_adapter(rows):
+    page = expense_page_adapter.validate_python(
+        {"items": rows, "next_cursor": None}, from_attributes=True
+    )
+    return expense_page_adapter.dump_json(page)
+
+
+async def main():
+    async with engine.begin() as conn:
+        print(f"seeding {ROWS} expenses on {conn.dialect.name}")
+        await seed(conn, users=1, expenses=ROWS)
+
+    async with AsyncSession(engine) as db:
+        entities = (await db.execute(select(Expense))).scalars().all()
+        rows = (
+            await db.execute(
+                select(
+                    Expense.id, Expense.amount, Expense.created_at, Expense.catagory
+                )
+            )
+        ).all()
+    await engine.dispose()
+
+    assert json.loads(per_row_encoder(entities)) == json.loads(bulk_adapter(rows))
+    report = jsonable_encoder({"items": [row._asdict() for row in rows]})
+
+    print(f"ms per 10k rows, best of {REPEAT}")
+    cases = [
+        ("per-row validate + jsonable_encoder + json", lambda: per_row_encoder(entities)),
+        ("bulk TypeAdapter validate + dump_json", lambda: bulk_adapter(rows)),
+        ("dict payload, json.dumps", lambda: json.dumps(report).encode()),
+    ]
+    try:
+        import orjson
+    except ImportError:
+        print("  orjson not installed, skipping orjson.dumps")
+    else:
+        cases.append(("dict payload, orjson.dumps", lambda: orjson.dumps(report)))
+    for name, fn in cases:
+        print(f"  {name:<44} {best_of(fn):8.1f}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,238 @@
+"""Check user-id sharding end to end: migration, routing, moves, aggregates.
+
+Two extra SQLite files act as shards (or set BENCH_SHARD_URLS, comma
+separated). The primary is first seeded the way an unsharded deployment
+would have it, then:
+
+- start-up moves balances out of the user table, leaves every bucket on the
+  primary and the API keeps serving it;
+- `rebalance` migrates all buckets onto the shards, evenly, emptying the
+  primary's per-user tables without changing any user's expenses or balance
+  or the cross-shard category totals, and leaving every shard's rollup
+  consistent, including the expense of a user who signs up while it runs;
+- new expenses land on their owner's shard;
+- while a user's bucket is moving, their writes get a 503 and reads work;
+- `move` carries a bucket, recurring rules and balances included, to the
+  other shard.
+
+Exits 1 if any of these does not hold.
+"""
+import asyncio
+import os
+import random
+import sys
+import tempfile
+
+# must be set before app.core.config is imported
+os.environ["SHARD_URLS"] = os.getenv("BENCH_SHARD_URLS") or ",".join(
+    f"sqlite+aiosqlite:///{tempfile.mktemp(prefix='bench-shard-', suffix='.db')}"
+    for _ in range(2)
+)
+# the check runs in one process; every request sees the latest map
+os.environ["SHARD_MAP_REFRESH_SECONDS"] = "0"
+os.environ["RECURRING_ENABLED"] = "false"
+
+import httpx  # noqa: E402
+from sqlalchemy import func, inspect, text  # noqa: E402
+from sqlalchemy.future import select  # noqa: E402
+
+from app.auth.models import UserBalance  # noqa: E402
+from app.core.hashing import Hasher  # noqa: E402
+from app.database import (  # noqa: E402
+    PRIMARY_SHARD,
+    engine,
+    shard_engines,
+    shard_map,
+    user_bucket,
+)
+from app.expenses import rollup, sharding  # noqa: E402
+from app.expenses.models import Expense, RecurringRule  # noqa: E402
+from app.expenses.sharding import ShardAdmin, ShardAggregates  # noqa: E402
+from app.main import app, init_models  # noqa: E402
+from .seed import seed  # noqa: E402
+
+USERS = 40
+EXPENSES = 50
+
+
+async def expense_counts(shard: int) -> dict:
+    async with shard_map.engine(shard).connect() as conn:
+        rows = await conn.execute(
+            select(Expense.user_id, func.count()).group_by(Expense.user_id)
+        )
+        return dict(rows.all())
+
+
+async def balances(shard: int) -> dict:
+    async with shard_map.engine(shard).connect() as conn:
+        if not await conn.run_sync(
+            lambda sync_conn: inspect(sync_conn).has_table(UserBalance.__tablename__)
+        ):
+            return {}
+        rows = await conn.execute(select(UserBalance.user_id, UserBalance.total_income))
+        return dict(rows.all())
+
+
+async def main():
+    random.seed(0)
+    async with engine.begin() as conn:
+        await seed(
+            conn, users=USERS, expenses=EXPENSES, password=Hasher.hash_password("pass")
+        )
+        # balances where deployments from before user_balances keep them
+        await conn.run_sync(UserBalance.__table__.drop)
+        for column in ("total_income", "total_savings"):
+            await conn.execute(
+                text(f'ALTER TABLE "user" ADD COLUMN {column} INTEGER DEFAULT 0')
+            )
+        await conn.execute(text('UPDATE "user" SET total_income = id * 10'))
+    await init_models()
+    failures = []
+
+    if set(shard_map.buckets.values()) != {PRIMARY_SHARD}:
+        failures.append("existing data did not start out on the primary")
+    if await balances(PRIMARY_SHARD) != {i: i * 10 for i in range(1, USERS + 1)}:
+        failures.append("balances were not migrated out of the user table")
+    before_totals = await ShardAggregates.category_totals(2022, 6)
+    before_counts = await expense_counts(PRIMARY_SHARD)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        r = await client.post(
+            "/login", data={"username": "bench1@example.com", "password": "pass"}
+        )
+        headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+        r = await client.get("/expense/?limit=100", headers=headers)
+        if len(r.json()["items"]) != EXPENSES:
+            failures.append(f"list before migration: {r.status_code} {r.text[:200]}")
+
+        # a user who signs up mid-rebalance, in a bucket that has not moved
+        # yet, writes to the primary; their rows must move with the bucket
+        # (buckets move in order; the newcomer's, 50, moves after ~2 s)
+        rebalance = asyncio.create_task(
+            sharding.main(["rebalance", "--grace", "0.02"])
+        )
+        while not shard_map.moving:
+            await asyncio.sleep(0.01)
+            await shard_map.refresh(force=True)
+        newcomer = {"username": "late@example.com", "password": "pass"}
+        r = await client.post(
+            "/signup", json={**newcomer, "email": newcomer["username"]}
+        )
+        late_id = r.json()["id"]
+        r = await client.post("/login", data=newcomer)
+        late_headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+        await client.put("/income/", json={"amount": 100}, headers=late_headers)
+        late_status = 503
+        while late_status == 503:
+            r = await client.post(
+                "/expense/",
+                json={"amount": 5, "source": "income", "catagory": "Food"},
+                headers=late_headers,
+            )
+            late_status = r.status_code
+        if late_status != 201:
+            failures.append(f"expense during rebalance: {r.status_code} {r.text}")
+        if shard_map.shard_of(late_id) != PRIMARY_SHARD:
+            failures.append("the newcomer's bucket moved before they wrote")
+        before_counts[late_id] = 1
+        await rebalance
+        await shard_map.refresh(force=True)
+        print(f"after rebalance: {await ShardAggregates.shard_stats()}")
+        per_shard = [list(shard_map.buckets.values()).count(s) for s in (0, 1)]
+        if per_shard != [128, 128]:
+            failures.append(f"buckets per shard after rebalance: {per_shard}")
+        if await expense_counts(PRIMARY_SHARD):
+            failures.append("expenses left on the primary after migration")
+        after_counts = {}
+        for shard in (0, 1):
+            counts = await expense_counts(shard)
+            if any(shard_map.shard_of(user_id) != shard for user_id in counts):
+                failures.append(f"shard {shard} holds another shard's users")
+            after_counts.update(counts)
+        if after_counts != before_counts:
+            failures.append("per-user expense counts changed in the migration")
+        if await ShardAggregates.category_totals(2022, 6) != before_totals:
+            failures.append("cross-shard category totals changed in the migration")
+        if await rollup.main(["check"]):
+            failures.append("rollup drifted in the migration")
+        if await balances(PRIMARY_SHARD):
+            failures.append("balances left on the primary after migration")
+        after_balances = {}
+        for shard in (0, 1):
+            shard_balances = await balances(shard)
+            owners = {shard_map.shard_of(user_id) for user_id in shard_balances}
+            if owners - {shard}:
+                failures.append(f"shard {shard} holds another shard's balances")
+            after_balances.update(shard_balances)
+        if any(after_balances.get(i) != i * 10 for i in range(1, USERS + 1)):
+            failures.append("balances changed in the migration")
+
+        r = await client.get("/expense/?limit=100", headers=headers)
+        if len(r.json()["items"]) != EXPENSES:
+            failures.append(f"list after migration: {r.status_code} {r.text[:200]}")
+        await client.put("/income/", json={"amount": 100}, headers=headers)
+        r = await client.post(
+            "/expense/",
+            json={"amount": 5, "source": "income", "catagory": "Food"},
+            headers=headers,
+        )
+        home = shard_map.shard_of(1)
+        if r.status_code != 201 or (await expense_counts(home))[1] != EXPENSES + 1:
+            failures.append(f"new expense not on shard {home}: {r.text}")
+
+        bucket = user_bucket(1)
+        await ShardAdmin.set_bucket(bucket, home, moving=True)
+        r = await client.post(
+            "/expense/",
+            json={"amount": 5, "source": "income", "catagory": "Food"},
+            headers=headers,
+        )
+        listed = await client.get("/expense/?limit=1", headers=headers)
+        print(f"while moving: write {r.status_code}, read {listed.status_code}")
+        if r.status_code != 503 or listed.status_code != 200:
+            failures.append("moving bucket did not refuse writes and allow reads")
+        await ShardAdmin.set_bucket(bucket, home, moving=False)
+
+        r = await client.post(
+            "/recurring/",
+            json={
+                "kind": "expense",
+                "source": "income",
+                "amount": 10,
+                "catagory": "Food",
+                "frequency": "monthly",
+                "start_at": "2030-01-01T00:00:00",
+            },
+            headers=headers,
+        )
+        if r.status_code != 201:
+            failures.append(f"recurring rule: {r.status_code} {r.text}")
+        other = 1 - home
+        await sharding.main(["move", str(bucket), str(other), "--grace", "0"])
+        r = await client.get("/expense/?limit=100", headers=headers)
+        rules = await client.get("/recurring/", headers=headers)
+        print(
+            f"after moving bucket {bucket} to shard {other}: "
+            f"{len(r.json()['items'])} expenses, {len(rules.json())} rules"
+        )
+        if len(r.json()["items"]) != EXPENSES + 1 or len(rules.json()) != 1:
+            failures.append("user's data did not follow the bucket")
+        me = (await client.get("/me", headers=headers)).json()
+        if me["total_income"] != 10 + 100 - 5:
+            failures.append(f"balance did not follow the bucket: {me}")
+        async with shard_engines[home].connect() as conn:
+            if await conn.scalar(
+                select(func.count()).where(RecurringRule.user_id == 1)
+            ):
+                failures.append("moved rows left on the old shard")
+
+    for disposed in (engine, *shard_engines):
+        await disposed.dispose()
+    for failure in failures:
+        print(f"FAIL {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
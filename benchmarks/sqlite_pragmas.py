@@ -0,0 +1,106 @@
+"""Compare request throughput with and without the SQLite connection tuning.
+
+Copies the bundled app/expenses.db twice and drives the same read/write mix
+against each copy, once with SQLITE_TUNING=false (rollback journal, default
+pragmas) and once with it enabled. Each run is a separate process because
+the engine is configured at import time.
+"""
+import asyncio
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+
+BUNDLED_DB = Path(__file__).resolve().parent.parent / "app" / "expenses.db"
+DURATION = float(os.getenv("BENCH_DURATION", "10"))
+CONCURRENCY = int(os.getenv("BENCH_CONCURRENCY", "16"))
+WRITE_RATIO = float(os.getenv("BENCH_WRITE_RATIO", "0.3"))
+
+
+async def worker(client, headers, deadline, statuses):
+    while time.perf_counter() < deadline:
+        if random.random() < WRITE_RATIO:
+            r = await client.post(
+                "/expense/",
+                json={"amount": 1, "source": "income", "catagory": "Food"},
+                headers=headers,
+            )
+        elif random.random() < 0.5:
+            r = await client.get("/expense/", headers=headers)
+        else:
+            r = await client.get("/expense/monthly/2025/10", headers=headers)
+        statuses[r.status_code] += 1
+
+
+async def run():
+    import httpx
+    from app.database import engine
+    from app.main import app, init_models
+
+    await init_models()
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        credentials = {
+            "email": "bench@example.com",
+            "username": "bench",
+            "password": "pass",
+        }
+        await client.post("/signup", json=credentials)
+        token = (
+            await client.post(
+                "/login", data={"username": credentials["email"], "password": "pass"}
+            )
+        ).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        await client.put("/income/", json={"amount": 10**9}, headers=headers)
+
+        statuses = Counter()
+        deadline = time.perf_counter() + DURATION
+        await asyncio.gather(
+            *(worker(client, headers, deadline, statuses) for _ in range(CONCURRENCY))
+        )
+    await engine.dispose()
+    total = sum(statuses.values())
+    print(json.dumps({"requests": total, "rps": total / DURATION, "statuses": statuses}))
+
+
+def spawn(tuning: bool) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Path(tmp) / "expenses.db"
+        shutil.copy(BUNDLED_DB, db)
+        env = dict(
+            os.environ,
+            BENCH_DATABASE_URL=f"sqlite+aiosqlite:///{db}",
+            SQLITE_TUNING=str(tuning).lower(),
+            BCRYPT_ROUNDS="4",
+        )
+        out = subprocess.run(
+            [sys.executable, "-m", "benchmarks.sqlite_pragmas", "--child"],
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    if "--child" in sys.argv:
+        asyncio.run(run())
+        return
+    for tuning in (False, True):
+        result = spawn(tuning)
+        print(
+            f"SQLITE_TUNING={str(tuning).lower():5} "
+            f"{result['rps']:8.1f} req/s  statuses={result['statuses']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
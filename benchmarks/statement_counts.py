@@ -0,0 +1,177 @@
+"""Check how many SQL statements and commits each endpoint issues.
+
+Runs one request per endpoint against app.main.app with a warm user cache,
+recording cursor executions and transaction commits through engine events.
+Read endpoints must not commit, write endpoints must commit exactly once,
+no endpoint may go over its statement budget, and a report poll with a
+current ETag must be a 304 after a single statement. Exits 1 on any violation,
+so a change that adds a query to a hot path shows up here.
+"""
+import asyncio
+import sys
+from datetime import datetime
+
+import httpx
+from sqlalchemy import event
+
+from app.core.hashing import Hasher
+from app.database import engine, read_pool_engine
+from app.main import app
+from .seed import seed
+
+NOW = datetime.utcnow()
+MONTH = f"{NOW.year}/{NOW.month}"
+
+# (label, method, url, body, writes, statement budget)
+REQUESTS = [
+    # the balances are on the user's shard, not in the cached user row
+    ("me", "GET", "/me", None, False, 1),
+    ("add income", "PUT", "/income/", {"amount": 1000}, True, 1),
+    ("add savings", "PUT", "/savings/", {"amount": 100}, True, 1),
+    (
+        "add expense",
+        "POST",
+        "/expense/",
+        {"amount": 5, "source": "income", "catagory": "Food"},
+        True,
+        3,
+    ),
+    (
+        "add expense batch",
+        "POST",
+        "/expense/batch",
+        [
+            {"amount": 5, "source": "income", "catagory": "Food"},
+            {"amount": 5, "source": "savings", "catagory": "Transport"},
+        ],
+        True,
+        4,
+    ),
+    ("list expenses", "GET", "/expense/", None, False, 1),
+    ("list by catagory", "GET", "/expense/Food", None, False, 1),
+    ("monthly report", "GET", f"/expense/monthly/{MONTH}", None, False, 2),
+    (
+        "analytics",
+        "GET",
+        "/expense/analytics?start=2020-01-01&end=2025-01-01",
+        None,
+        False,
+        1,
+    ),
+    (
+        # dropping the month's other categories is its own DELETE
+        "create budget plan",
+        "POST",
+        f"/budget-plan/{MONTH}",
+        {"planned_expenses": [{"catagory": "Food", "amount": 100}]},
+        True,
+        3,
+    ),
+    ("get budget plan", "GET", f"/budget-plan/{MONTH}", None, False, 2),
+    ("budget vs actual", "GET", f"/budget-vs-actual/{MONTH}", None, False, 2),
+    ("dashboard summary", "GET", f"/dashboard/summary/{MONTH}", None, False, 5),
+    ("alerts", "GET", "/alerts/", None, False, 1),
+    ("recurring rules", "GET", "/recurring/", None, False, 1),
+    ("delete budget plan", "DELETE", f"/budget-plan/{MONTH}", None, True, 2),
+    ("delete expense", "DELETE", "/expense/1", None, True, 3),
+]
+
+# report routes answering If-None-Match from the user's data version
+CONDITIONAL = [
+    ("monthly report", f"/expense/monthly/{MONTH}"),
+    ("get budget plan", f"/budget-plan/{MONTH}"),
+    ("budget vs actual", f"/budget-vs-actual/{MONTH}"),
+]
+
+
+class Recorder:
+    def __init__(self):
+        self.statements = 0
+        self.commits = 0
+        self.rollbacks = 0
+
+    def listen(self, sync_engine):
+        @event.listens_for(sync_engine, "after_cursor_execute")
+        def count_statement(conn, cursor, statement, *args):
+            # SQLite write transactions start with an explicit BEGIN IMMEDIATE
+            # where other drivers begin implicitly; it is not a query
+            if not statement.startswith("BEGIN"):
+                self.statements += 1
+
+        @event.listens_for(sync_engine, "commit")
+        def count_commit(conn):
+            self.commits += 1
+
+        @event.listens_for(sync_engine, "rollback")
+        def count_rollback(conn):
+            self.rollbacks += 1
+
+    def reset(self):
+        self.statements = self.commits = self.rollbacks = 0
+
+
+async def check() -> list[str]:
+    async with engine.begin() as conn:
+        await seed(conn, users=1, expenses=200, password=Hasher.hash_password("pass"))
+
+    recorder = Recorder()
+    for listened in {engine, read_pool_engine}:
+        recorder.listen(listened.sync_engine)
+    failures = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        r = await client.post(
+            "/login", data={"username": "bench1@example.com", "password": "pass"}
+        )
+        headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+        print(
+            f"{'endpoint':<24} {'status':>6} {'stmts':>5} {'budget':>6} "
+            f"{'commits':>7}"
+        )
+        for label, method, url, body, writes, budget in REQUESTS:
+            # writes invalidate the cached user after commit; reload it first
+            # so every request is measured against a warm cache
+            await client.get("/me", headers=headers)
+            recorder.reset()
+            r = await client.request(method, url, json=body, headers=headers)
+            print(
+                f"{label:<24} {r.status_code:>6} {recorder.statements:>5} "
+                f"{budget:>6} {recorder.commits:>7}"
+            )
+            if r.status_code >= 400:
+                failures.append(f"{label}: HTTP {r.status_code} {r.text}")
+            if recorder.statements > budget:
+                failures.append(
+                    f"{label}: {recorder.statements} statements, budget {budget}"
+                )
+            if recorder.commits != (1 if writes else 0):
+                failures.append(f"{label}: {recorder.commits} commits")
+        # polls that still hold the current ETag: one version lookup, no report
+        for label, url in CONDITIONAL:
+            etag = (await client.get(url, headers=headers)).headers["etag"]
+            recorder.reset()
+            r = await client.get(url, headers={**headers, "If-None-Match": etag})
+            print(
+                f"{label + ' (304)':<24} {r.status_code:>6} {recorder.statements:>5} "
+                f"{1:>6} {recorder.commits:>7}"
+            )
+            if r.status_code != 304:
+                failures.append(f"{label}: conditional GET returned {r.status_code}")
+            if recorder.statements > 1 or recorder.commits:
+                failures.append(
+                    f"{label}: conditional GET ran {recorder.statements} statements"
+                )
+    await engine.dispose()
+    return failures
+
+
+async def main():
+    failures = await check()
+    for failure in failures:
+        print(f"FAIL {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
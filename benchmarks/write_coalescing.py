@@ -0,0 +1,137 @@
+"""Expense writes per second with and without the group-commit coalescer.
+
+Drives concurrent POST /expense/ requests for a few users against a fresh
+database, first on the direct path (one transaction per request), then with
+ExpenseWriteCoalescer running. The rate counts accepted (201) writes only.
+Incomes are large enough that ordinary writes never run out; one write in
+REJECT_EVERY asks for more than the income, which exercises the per-caller
+errors without letting cheap rejections inflate the rate. After each run the
+script checks that every user's income equals the starting income minus the
+accepted expenses and that the monthly rollup matches expenses_table. It
+exits 1 if either check fails or any request got a 5xx.
+
+    WRITE_BATCH_MAX_SIZE=128 WRITE_BATCH_MAX_LATENCY_MS=2 \\
+        python -m benchmarks.write_coalescing
+"""
+import asyncio
+import os
+import random
+import sys
+import time
+from collections import Counter
+
+import httpx
+from sqlalchemy import insert
+from sqlalchemy.future import select
+
+from app.auth.models import UserBalance
+from app.core.config import settings
+from app.core.hashing import Hasher
+from app.database import AsyncSessionLocal, engine
+from app.expenses.coalescer import expense_writer
+from app.expenses.rollup import MonthlyRollup
+from app.main import app
+from .seed import seed
+
+DURATION = float(os.getenv("BENCH_DURATION", "10"))
+CONCURRENCY = int(os.getenv("BENCH_CONCURRENCY", "64"))
+USERS = int(os.getenv("BENCH_USERS", "4"))
+INCOME = int(os.getenv("BENCH_INCOME", "10000000"))
+REJECT_EVERY = 50
+
+
+async def worker(client, tokens, deadline, statuses, spent):
+    while time.perf_counter() < deadline:
+        user_id = random.randint(1, USERS)
+        overdraw = random.randrange(REJECT_EVERY) == 0
+        amount = INCOME + 1 if overdraw else random.randint(1, 10)
+        r = await client.post(
+            "/expense/",
+            json={"amount": amount, "source": "income", "catagory": "Food"},
+            headers={"Authorization": f"Bearer {tokens[user_id]}"},
+        )
+        statuses[r.status_code] += 1
+        if r.status_code == 201:
+            spent[user_id] += amount
+
+
+async def run(coalesced: bool) -> tuple[float, bool]:
+    async with engine.begin() as conn:
+        await seed(
+            conn, users=USERS, expenses=0, password=Hasher.hash_password("pass")
+        )
+        await conn.execute(
+            insert(UserBalance),
+            [
+                {"user_id": user_id, "total_income": INCOME, "total_savings": 0}
+                for user_id in range(1, USERS + 1)
+            ],
+        )
+
+    if coalesced:
+        expense_writer.start()
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        tokens = {}
+        for user_id in range(1, USERS + 1):
+            r = await client.post(
+                "/login",
+                data={"username": f"bench{user_id}@example.com", "password": "pass"},
+            )
+            tokens[user_id] = r.json()["access_token"]
+
+        statuses = Counter()
+        spent = Counter()
+        batches, writes = expense_writer.batches, expense_writer.writes
+        deadline = time.perf_counter() + DURATION
+        await asyncio.gather(
+            *(
+                worker(client, tokens, deadline, statuses, spent)
+                for _ in range(CONCURRENCY)
+            )
+        )
+    if coalesced:
+        await expense_writer.stop()
+
+    async with AsyncSessionLocal() as db:
+        incomes = dict(
+            (
+                await db.execute(
+                    select(UserBalance.user_id, UserBalance.total_income)
+                )
+            ).all()
+        )
+        drift = await MonthlyRollup.check(db)
+    server_errors = sum(n for code, n in statuses.items() if code >= 500)
+    ok = (
+        not drift
+        and not server_errors
+        and all(incomes[user_id] == INCOME - spent[user_id] for user_id in incomes)
+    )
+
+    rate = statuses[201] / DURATION
+    label = "coalesced" if coalesced else "direct"
+    line = f"{label:<10} {rate:8.1f} accepted/s  statuses={dict(statuses)}"
+    if coalesced:
+        batches = expense_writer.batches - batches
+        writes = expense_writer.writes - writes
+        line += f"  batches={batches} mean size={writes / max(batches, 1):.1f}"
+    print(line + ("" if ok else "  FAILED"))
+    return rate, ok
+
+
+async def main():
+    print(
+        f"{CONCURRENCY} concurrent clients, {USERS} users, {DURATION:.0f}s per run, "
+        f"batch size {settings.WRITE_BATCH_MAX_SIZE}, "
+        f"latency {settings.WRITE_BATCH_MAX_LATENCY_MS}ms"
+    )
+    direct, direct_ok = await run(coalesced=False)
+    coalesced, coalesced_ok = await run(coalesced=True)
+    print(f"speedup: {coalesced / max(direct, 1e-9):.2f}x")
+    await engine.dispose()
+    return 0 if direct_ok and coalesced_ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
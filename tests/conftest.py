@@ -0,0 +1,29 @@
+import os
+import tempfile
+
+import pytest
+
+# app.database builds its engine from the environment when first imported;
+# the checks recreate the schema, so they never touch a configured database
+os.environ["DATABASE_URL"] = (
+    f"sqlite+aiosqlite:///{tempfile.mktemp(prefix='budget-buddy-test-', suffix='.db')}"
+)
+os.environ.setdefault("SECRET_KEY", "test-secret")
+os.environ["BCRYPT_ROUNDS"] = "4"
+os.environ["RECURRING_ENABLED"] = "false"
+
+from app.core.http_cache import response_cache  # noqa: E402
+from app.core.user_cache import user_cache  # noqa: E402
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture(autouse=True)
+def fresh_caches():
+    # every check reseeds the database, reusing user ids
+    user_cache.clear()
+    response_cache.clear()
+    yield
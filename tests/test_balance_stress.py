@@ -0,0 +1,8 @@
+import pytest
+
+from benchmarks.balance_stress import run
+
+
+@pytest.mark.anyio
+async def test_concurrent_balance_writes_add_up():
+    assert await run(requests=60, income=100)
@@ -0,0 +1,116 @@
+from datetime import datetime
+
+import pytest
+
+from app.shared.cron import CronSchedule
+
+
+def fires(expression: str, after: datetime, count: int) -> list[datetime]:
+    schedule = CronSchedule(expression)
+    times = []
+    for _ in range(count):
+        after = schedule.next_after(after)
+        times.append(after)
+    return times
+
+
+def test_parses_each_field():
+    schedule = CronSchedule("*/15 9-17 1,15 */3 1-5")
+    assert schedule.minutes == [0, 15, 30, 45]
+    assert schedule.hours == list(range(9, 18))
+    assert schedule.days == {1, 15}
+    assert schedule.months == {1, 4, 7, 10}
+    # Monday-Friday, as Python's weekday() numbers them
+    assert schedule.weekdays == {0, 1, 2, 3, 4}
+
+
+def test_a_stepped_number_runs_to_the_end_of_the_field():
+    assert CronSchedule("5/20 * * * *").minutes == [5, 25, 45]
+    assert CronSchedule("0 0-12/6 * * *").hours == [0, 6, 12]
+
+
+def test_sunday_is_0_or_7():
+    assert CronSchedule("0 0 * * 0").weekdays == {6}
+    assert CronSchedule("0 0 * * 7").weekdays == {6}
+
+
+@pytest.mark.parametrize(
+    "expression",
+    [
+        "* * * *",
+        "* * * * * *",
+        "60 * * * *",
+        "* 24 * * *",
+        "* * 0 * *",
+        "* * * 13 *",
+        "* * * * 8",
+        "*/0 * * * *",
+        "5-1 * * * *",
+        "a * * * *",
+        "1,,2 * * * *",
+    ],
+)
+def test_rejects_invalid_expressions(expression):
+    with pytest.raises(ValueError):
+        CronSchedule(expression)
+
+
+def test_either_day_field_fires_when_both_are_restricted():
+    # the 13th, and every Friday; 2026-10-13 is a Tuesday
+    assert fires("0 12 13 * 5", datetime(2026, 10, 1), 4) == [
+        datetime(2026, 10, 2, 12),
+        datetime(2026, 10, 9, 12),
+        datetime(2026, 10, 13, 12),
+        datetime(2026, 10, 16, 12),
+    ]
+
+
+def test_a_wildcard_day_field_leaves_the_other_in_charge():
+    assert fires("0 12 13 * *", datetime(2026, 10, 1), 2) == [
+        datetime(2026, 10, 13, 12),
+        datetime(2026, 11, 13, 12),
+    ]
+    assert fires("0 12 * * 5", datetime(2026, 10, 10), 2) == [
+        datetime(2026, 10, 16, 12),
+        datetime(2026, 10, 23, 12),
+    ]
+
+
+def test_next_after_is_strictly_after():
+    schedule = CronSchedule("30 8 * * *")
+    assert schedule.next_after(datetime(2026, 3, 1, 8, 30)) == datetime(
+        2026, 3, 2, 8, 30
+    )
+    # seconds do not count: 08:29:59 is still before 08:30
+    assert schedule.next_after(datetime(2026, 3, 1, 8, 29, 59)) == datetime(
+        2026, 3, 1, 8, 30
+    )
+
+
+def test_next_after_crosses_month_ends():
+    # months without a 31st are passed over
+    assert fires("30 23 31 * *", datetime(2026, 10, 31, 23, 30), 2) == [
+        datetime(2026, 12, 31, 23, 30),
+        datetime(2027, 1, 31, 23, 30),
+    ]
+    assert fires("0 0 1 * *", datetime(2026, 1, 31, 12), 2) == [
+        datetime(2026, 2, 1),
+        datetime(2026, 3, 1),
+    ]
+
+
+def test_next_after_crosses_year_ends():
+    assert fires("59 23 * * *", datetime(2026, 12, 31, 23, 59), 1) == [
+        datetime(2027, 1, 1, 23, 59)
+    ]
+    assert fires("0 0 1 1 *", datetime(2026, 6, 1), 2) == [
+        datetime(2027, 1, 1),
+        datetime(2028, 1, 1),
+    ]
+    # the next 29 February is in the next leap year
+    assert fires("0 0 29 2 *", datetime(2026, 3, 1), 1) == [datetime(2028, 2, 29)]
+
+
+def test_an_expression_that_never_fires_is_an_error():
+    with pytest.raises(ValueError):
+        CronSchedule("0 0 31 2 *").next_after(datetime(2026, 1, 1))
@@ -0,0 +1,8 @@
+import pytest
+
+from benchmarks.export_memory import run
+
+
+@pytest.mark.anyio
+async def test_export_streams_in_flat_memory():
+    assert await run(expenses=50_000, ceiling_mb=32)
@@ -0,0 +1,20 @@
+import pytest
+
+from app.core.http_cache import etag_matches
+
+ETAG = 'W/"7-3"'
+
+
+@pytest.mark.parametrize(
+    "if_none_match",
+    ['W/"7-3"', '"7-3"', '"x", W/"7-3"', ' "x" ,"7-3"', "*"],
+)
+def test_matches_the_weak_tag_in_either_form(if_none_match):
+    assert etag_matches(if_none_match, ETAG)
+
+
+@pytest.mark.parametrize(
+    "if_none_match", [None, "", '"7-2"', 'W/"7-30"', '"3-7"', "7-3", 'W/"x"']
+)
+def test_does_not_match_other_tags(if_none_match):
+    assert not etag_matches(if_none_match, ETAG)
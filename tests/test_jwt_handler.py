@@ -0,0 +1,197 @@
+import base64
+import hmac
+import json
+import time
+
+import pytest
+from jose import JWTError, jwt
+
+from app.core.config import settings
+from app.core.jwt_handler import HMAC_DIGESTS, TokenGenerator
+
+
+def b64url(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def segment(obj) -> str:
+    return b64url(json.dumps(obj).encode())
+
+
+def sign(claims: dict, algorithm: str | None = None) -> str:
+    return jwt.encode(
+        claims, settings.SECRET_KEY, algorithm=algorithm or settings.ALGORITHM
+    )
+
+
+def sign_raw(header, payload: bytes) -> str:
+    # correctly signed, so only the segment contents can fail the token
+    signing_input = f"{segment(header)}.{b64url(payload)}"
+    digest = hmac.new(
+        settings.SECRET_KEY.encode(),
+        signing_input.encode(),
+        HMAC_DIGESTS[settings.ALGORITHM],
+    ).digest()
+    return f"{signing_input}.{b64url(digest)}"
+
+
+def jose_decode(token: str):
+    try:
+        return jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+    except JWTError:
+        return None
+
+
+HEADER = {"alg": settings.ALGORITHM, "typ": "JWT"}
+
+
+def verify(token: str):
+    return TokenGenerator.verify_hmac_token(token)
+
+
+def test_accepts_a_token_from_create_token():
+    token = TokenGenerator.create_token({"sub": "a@b.com", "uid": 7, "ver": 0})
+    payload = verify(token)
+    assert payload["uid"] == 7
+    assert payload == jose_decode(token)
+
+
+@pytest.mark.parametrize(
+    "claims",
+    [
+        {"sub": "a@b.com", "uid": 1, "ver": 3},
+        {"sub": "a@b.com", "exp": time.time() + 60},
+        {"sub": "a@b.com", "exp": int(time.time()) + 60, "iat": int(time.time())},
+        {"sub": "a@b.com", "iat": time.time()},
+        {"sub": "a@b.com", "nbf": int(time.time()) - 60, "jti": "abc"},
+        {"uid": 2, "nested": {"list": [1, 2]}, "name": "ünïcode"},
+        {},
+    ],
+)
+def test_matches_jose_on_valid_tokens(claims):
+    token = sign(claims)
+    assert verify(token) is not None
+    assert verify(token) == jose_decode(token)
+
+
+def test_rejects_a_tampered_signature():
+    header, payload, signature = sign({"sub": "a@b.com"}).split(".")
+    flipped = "A" if signature[0] != "A" else "B"
+    assert verify(f"{header}.{payload}.{flipped}{signature[1:]}") is None
+    assert verify(f"{header}.{payload}.") is None
+
+
+def test_rejects_a_tampered_payload():
+    header, _, signature = sign({"sub": "a@b.com", "uid": 1}).split(".")
+    forged = segment({"sub": "a@b.com", "uid": 2})
+    assert verify(f"{header}.{forged}.{signature}") is None
+
+
+def test_rejects_a_token_signed_with_another_key():
+    token = jwt.encode({"sub": "a@b.com"}, "another-secret", algorithm="HS256")
+    assert verify(token) is None
+
+
+@pytest.mark.parametrize(
+    "algorithm", [alg for alg in HMAC_DIGESTS if alg != settings.ALGORITHM]
+)
+def test_rejects_another_alg(algorithm):
+    token = sign({"sub": "a@b.com"}, algorithm)
+    assert verify(token) is None
+    assert jose_decode(token) is None
+
+
+@pytest.mark.parametrize("alg", ["none", "None", None])
+def test_rejects_alg_none(alg):
+    token = f"{segment({'alg': alg, 'typ': 'JWT'})}.{segment({'sub': 'a@b.com'})}."
+    assert verify(token) is None
+    assert jose_decode(token) is None
+
+
+def test_rejects_a_header_without_alg():
+    _, payload, signature = sign({"sub": "a@b.com"}).split(".")
+    assert verify(f"{segment({'typ': 'JWT'})}.{payload}.{signature}") is None
+
+
+def test_rejects_an_expired_token():
+    token = sign({"sub": "a@b.com", "exp": int(time.time()) - 10})
+    assert verify(token) is None
+    assert jose_decode(token) is None
+
+
+def test_rejects_a_token_from_create_token_once_expired(monkeypatch):
+    token = TokenGenerator.create_token({"sub": "a@b.com"}, expires_in_minutes=1)
+    exp = jwt.get_unverified_claims(token)["exp"]
+    monkeypatch.setattr(time, "time", lambda: exp)
+    assert verify(token) is None
+
+
+def test_rejects_nbf_in_the_future():
+    token = sign({"sub": "a@b.com", "nbf": int(time.time()) + 60})
+    assert verify(token) is None
+    assert jose_decode(token) is None
+
+
+@pytest.mark.parametrize(
+    "token",
+    [
+        "",
+        "abc",
+        "abc.def",
+        "a.b.c",
+        "...",
+        "!!!.###.$$$",
+        "a.b.c.d",
+    ],
+)
+def test_rejects_malformed_tokens(token):
+    assert verify(token) is None
+
+
+def test_rejects_extra_segments():
+    token = sign({"sub": "a@b.com"})
+    header, payload, signature = token.split(".")
+    assert verify(f"{token}.{signature}") is None
+    assert verify(f"{header}.{payload}.{payload}.{signature}") is None
+    assert verify(f"{header}.{token}") is None
+
+
+def test_rejects_a_header_that_is_not_an_object():
+    assert verify(sign_raw([settings.ALGORITHM], b'{"uid": 1}')) is None
+
+
+@pytest.mark.parametrize("payload", [b"[1, 2]", b'"a@b.com"', b"42", b"null", b"{"])
+def test_rejects_payloads_that_are_not_objects(payload):
+    token = sign_raw(HEADER, payload)
+    assert verify(token) is None
+    assert jose_decode(token) is None
+
+
+@pytest.mark.parametrize(
+    "claims",
+    [
+        {"exp": "soon"},
+        {"exp": None},
+        {"nbf": "later"},
+        {"iat": "yesterday"},
+        {"iat": None},
+        {"sub": 1},
+        {"jti": 5},
+        {"aud": "budget-buddy"},
+    ],
+    ids=repr,
+)
+def test_rejects_claims_jose_rejects(claims):
+    token = sign({"uid": 1, **claims})
+    assert verify(token) is None
+    try:
+        assert jose_decode(token) is None
+    except TypeError:
+        # jose int()s the claim and only catches ValueError
+        pass
+
+
+@pytest.mark.parametrize("exp", [b"Infinity", b"NaN"])
+def test_rejects_dates_that_never_expire(exp):
+    token = sign_raw(HEADER, b'{"uid": 1, "exp": %s}' % exp)
+    assert verify(token) is None
@@ -0,0 +1,170 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import func, insert, select
+
+from app.auth.models import UserBalance
+from app.core.config import settings
+from app.database import AsyncSessionLocal, engine, read_pool_engine
+from app.expenses.models import Expense, RecurringOccurrence, RecurringRule
+from app.expenses.recurring import RecurringScheduler, next_occurrence
+from app.expenses.schemas import (
+    Catagory,
+    ExpenseSource,
+    Frequency,
+    RecurringKind,
+)
+from benchmarks.seed import seed
+
+NOW = datetime(2026, 1, 10, 12)
+USER_ID = 1
+
+
+def monthly(start_at: datetime) -> RecurringRule:
+    return RecurringRule(frequency=Frequency.MONTHLY, start_at=start_at)
+
+
+def test_monthly_rules_keep_their_day_clamped_to_short_months():
+    rule = monthly(datetime(2026, 1, 31, 9))
+    when = rule.start_at
+    dates = []
+    for _ in range(4):
+        when = next_occurrence(rule, when)
+        dates.append(when)
+    assert dates == [
+        datetime(2026, 2, 28, 9),
+        datetime(2026, 3, 31, 9),
+        datetime(2026, 4, 30, 9),
+        datetime(2026, 5, 31, 9),
+    ]
+    leap = monthly(datetime(2028, 1, 30))
+    assert next_occurrence(leap, leap.start_at) == datetime(2028, 2, 29)
+
+
+def test_monthly_rules_roll_over_the_year():
+    rule = monthly(datetime(2026, 12, 15))
+    assert next_occurrence(rule, rule.start_at) == datetime(2027, 1, 15)
+
+
+@pytest.fixture
+async def database():
+    async with engine.begin() as conn:
+        await seed(conn, users=1, expenses=0)
+    yield
+    await engine.dispose()
+    await read_pool_engine.dispose()
+
+
+async def add_rule(start_at: datetime, **columns) -> int:
+    async with AsyncSessionLocal(info={"user_id": USER_ID}) as db:
+        rule = RecurringRule(
+            user_id=USER_ID,
+            frequency=Frequency.DAILY,
+            start_at=start_at,
+            next_run_at=start_at,
+            active=True,
+            **columns,
+        )
+        db.add(rule)
+        await db.commit()
+        return rule.id
+
+
+async def set_balance(income: int, savings: int = 0):
+    async with AsyncSessionLocal(info={"user_id": USER_ID}) as db:
+        await db.execute(
+            insert(UserBalance).values(
+                user_id=USER_ID, total_income=income, total_savings=savings
+            )
+        )
+        await db.commit()
+
+
+async def state(rule_id: int) -> dict:
+    async with AsyncSessionLocal(info={"user_id": USER_ID}) as db:
+        balance = await db.get(UserBalance, USER_ID)
+        statuses = (
+            await db.execute(
+                select(RecurringOccurrence.status, func.count())
+                .where(RecurringOccurrence.rule_id == rule_id)
+                .group_by(RecurringOccurrence.status)
+            )
+        ).all()
+        rule = await db.get(RecurringRule, rule_id)
+        return {
+            "income": balance.total_income if balance else 0,
+            "savings": balance.total_savings if balance else 0,
+            "occurrences": dict(statuses),
+            "expenses": await db.scalar(select(func.count()).select_from(Expense)),
+            "next_run_at": rule.next_run_at,
+        }
+
+
+@pytest.mark.anyio
+async def test_each_occurrence_is_applied_once(database):
+    rule_id = await add_rule(
+        NOW - timedelta(days=2), kind=RecurringKind.INCOME, amount=100
+    )
+    assert await RecurringScheduler.run_due(NOW) == 3
+    assert await RecurringScheduler.run_due(NOW) == 0
+    after = await state(rule_id)
+    assert after["income"] == 300
+    assert after["occurrences"] == {"applied": 3}
+    assert after["next_run_at"] == NOW + timedelta(days=1)
+
+    # a pass that read the rule before the first one committed replays the
+    # same occurrences; the idempotency key turns them away
+    async with AsyncSessionLocal(info={"user_id": USER_ID}) as db:
+        rule = await db.get(RecurringRule, rule_id)
+        rule.next_run_at = rule.start_at
+        await db.commit()
+    assert await RecurringScheduler.run_due(NOW) == 0
+    assert (await state(rule_id))["income"] == 300
+
+
+@pytest.mark.anyio
+async def test_catches_up_beyond_max_catchup(database, monkeypatch):
+    monkeypatch.setattr(settings, "RECURRING_MAX_CATCHUP", 5)
+    rule_id = await add_rule(
+        NOW - timedelta(days=12), kind=RecurringKind.INCOME, amount=1
+    )
+    # 13 occurrences, five per batch, all within one pass
+    assert await RecurringScheduler.run_due(NOW) == 13
+    after = await state(rule_id)
+    assert after["income"] == 13
+    assert after["occurrences"] == {"applied": 13}
+    assert after["next_run_at"] == NOW + timedelta(days=1)
+    assert await RecurringScheduler.run_due(NOW) == 0
+
+
+@pytest.mark.anyio
+async def test_skips_debits_the_balance_cannot_cover(database):
+    await set_balance(income=100)
+    rule_id = await add_rule(
+        NOW - timedelta(days=2),
+        kind=RecurringKind.EXPENSE,
+        amount=40,
+        source=ExpenseSource.INCOME,
+        catagory=Catagory.FOOD,
+    )
+    assert await RecurringScheduler.run_due(NOW) == 2
+    after = await state(rule_id)
+    assert after["income"] == 20
+    assert after["occurrences"] == {"applied": 2, "skipped": 1}
+    assert after["expenses"] == 2
+
+
+@pytest.mark.anyio
+async def test_skips_debits_of_a_user_without_balances(database):
+    rule_id = await add_rule(
+        NOW,
+        kind=RecurringKind.EXPENSE,
+        amount=1,
+        source=ExpenseSource.SAVINGS,
+        catagory=Catagory.FOOD,
+    )
+    assert await RecurringScheduler.run_due(NOW) == 0
+    after = await state(rule_id)
+    assert (after["income"], after["savings"]) == (0, 0)
+    assert after["occurrences"] == {"skipped": 1}
+    assert after["expenses"] == 0
@@ -0,0 +1,8 @@
+import pytest
+
+from benchmarks.statement_counts import check
+
+
+@pytest.mark.anyio
+async def test_statement_budgets():
+    assert await check() == []